@@ -0,0 +1,264 @@
+"""
+Offline end-to-end benchmark of EmotionServices, driven by the deterministic FakeLLM.
+
+For every number of simulated users, the given number of messages is sent round-robin through add_input and the
+benchmark measures the throughput, the end-to-end latency (add_input until the response is queued for sending),
+the queue wait before a worker picks up a message, the p50/p99 wall time per pipeline stage, the p50/p99 simulated
+LLM latency per stage (emotion extraction, writing style, split, reflection, ...) and, with --memory, the memory
+growth of the service measured with tracemalloc (including its fixed overhead, so per_user_bytes is an upper bound).
+
+    python benchmarks/bench_pipeline.py --users 1,100,1000,10000 --messages 2000 --json results.json
+    python benchmarks/bench_pipeline.py --writing-style --text-split --split-mode llm --latency lognormal --median-ms 50
+    python benchmarks/bench_pipeline.py --writing-style --max-queued-inputs 50 --overflow-policy busy
+
+With --max-queued-inputs, the input queues are bounded: refused inputs are reported as "refused" and the work
+shed under overload (inputs, writing style adaptations, reflections) as "shed".
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from collections import defaultdict, deque
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from benchmarks.fake_llm import FakeLLM, LatencyModel     # noqa: E402
+from emotionsinai import EmotionServices, OverloadError   # noqa: E402
+from emotionsinai.response_split import TypingSpeedModel  # noqa: E402
+
+RESOURCES = os.path.join(ROOT, "demos", "simple long-term memory emotional agent")
+
+MESSAGES = [
+    "I finally got the job, I am so happy!",
+    "My cat is sick and I am really worried about her.",
+    "Why does nobody ever answer my emails? This is so annoying.",
+    "Can you help me plan a trip to Italy next summer?",
+    "I failed the exam again. I feel like giving up.",
+    "Thank you, that really helped me a lot.",
+    "I am not sure whether I should move to another city.",
+    "Honestly, I am scared of the surgery next week.",
+]
+ANSWER = (
+    "That sounds like a lot to deal with. It is completely understandable to feel this way. "
+    "Let us look at it together, step by step, and find something that works for you."
+)
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def summarize(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50_ms": round(percentile(values, 50), 3),
+        "p99_ms": round(percentile(values, 99), 3),
+        "mean_ms": round(statistics.fmean(values), 3) if values else 0.0,
+    }
+
+
+class BenchmarkedEmotionServices(EmotionServices):
+    """
+    EmotionServices that records the queue wait, the end-to-end latency and the wall time of the pipeline stages.
+    """
+
+    def __init__(self, *args, **kwargs):
+        self.stage_ms: Dict[str, List[float]] = defaultdict(list)
+        self.queue_wait_ms: List[float] = []
+        self.end_to_end_ms: List[float] = []
+        self.completed = 0
+        self.refused = 0
+        self._submitted: Dict[str, deque] = defaultdict(deque)
+        self._record_lock = threading.Lock()
+        super().__init__(*args, **kwargs)
+
+    def add_input(self, user_id, prompt, answer=None, writing_style=False, text_split=False):
+        with self._record_lock:
+            self._submitted[user_id].append(time.perf_counter())
+        try:
+            queued = super().add_input(user_id, prompt, answer, writing_style, text_split)
+        except OverloadError:
+            queued = False
+        if not queued:
+            # The refused input is the last one of the user, its workers have not seen it.
+            with self._record_lock:
+                self._submitted[user_id].pop()
+                self.refused += 1
+        return queued
+
+    def process_input(self, item):
+        started = time.perf_counter()
+        # The inputs of a user are processed in order by the same worker.
+        with self._record_lock:
+            submitted = self._submitted[item[0]].popleft()
+        super().process_input(item)
+        finished = time.perf_counter()
+        with self._record_lock:
+            self.queue_wait_ms.append((started - submitted) * 1000)
+            self.end_to_end_ms.append((finished - submitted) * 1000)
+            self.stage_ms["process_input"].append((finished - started) * 1000)
+            self.completed += 1
+
+    def parse_input(self, user_input):
+        return self._timed("parse_input", super().parse_input, user_input)
+
+    def apply_appraisal(self, scores, user_id):
+        return self._timed("appraisal", super().apply_appraisal, scores, user_id)
+
+    def stream_response(self, *args, **kwargs):
+        started = time.perf_counter()
+        yield from super().stream_response(*args, **kwargs)
+        self._record("stream_response", started)
+
+    def deliver_response(self, user_id, text):
+        return self._timed("send", super().deliver_response, user_id, text)
+
+    def _timed(self, stage, function, *args):
+        started = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self._record(stage, started)
+
+    def _record(self, stage, started):
+        elapsed = (time.perf_counter() - started) * 1000
+        with self._record_lock:
+            self.stage_ms[stage].append(elapsed)
+
+
+def run_scenario(users: int, messages: int, args, trace_memory: bool) -> Dict:
+    llm = FakeLLM(LatencyModel(args.latency, args.median_ms, args.sigma, args.token_ms, seed=args.seed))
+    # No typing delays: the benchmark measures the pipeline, not the simulated human pauses.
+    typing_model = TypingSpeedModel(pause_ms=0, min_delay_ms=0, max_delay_ms=0)
+    workdir = tempfile.mkdtemp(prefix="emotionsinai-bench-")
+
+    gc.collect()
+    if trace_memory:
+        tracemalloc.start()
+        baseline = tracemalloc.take_snapshot()
+    service = BenchmarkedEmotionServices(
+        resource_file_path=os.path.join(RESOURCES, "resources.json"),
+        system_prompt_path=os.path.join(RESOURCES, "emotion_system_prompt.json"),
+        num_workers=args.workers,
+        batch_size=args.batch_size,
+        cache_size=args.cache_size,
+        streaming=args.streaming,
+        pipeline_mode=args.pipeline_mode,
+        split_mode=args.split_mode,
+        typing_model=typing_model,
+        history_archive_dir=workdir if args.archive else None,
+        llm=llm,
+        max_queued_inputs=args.max_queued_inputs,
+        overflow_policy=args.overflow_policy,
+    )
+
+    total = max(messages, users)
+    started = time.perf_counter()
+    for index in range(total):
+        user_id = f"user-{index % users}"
+        # Every input is unique unless --repeat-inputs, so the appraisal cache does not hide the extraction cost.
+        prompt = MESSAGES[index % len(MESSAGES)]
+        if not args.repeat_inputs:
+            prompt = f"{prompt} ({index})"
+        service.add_input(user_id, prompt, ANSWER, args.writing_style, args.text_split)
+    submitted = time.perf_counter()
+
+    while service.completed + service.refused < total:
+        time.sleep(0.005)
+    finished = time.perf_counter()
+    # Let the reflection and send threads drain before the queues are sampled.
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline and (service.reflection_queue.qsize() or service.send_response_queue.qsize()):
+        time.sleep(0.01)
+
+    result = {
+        "users": users,
+        "messages": total,
+        "submit_s": round(submitted - started, 4),
+        "duration_s": round(finished - started, 4),
+        "throughput_msg_per_s": round(service.completed / (finished - started), 1),
+        "end_to_end": summarize(service.end_to_end_ms),
+        "queue_wait": summarize(service.queue_wait_ms),
+        "stages": {stage: summarize(values) for stage, values in sorted(service.stage_ms.items())},
+        "llm": {stage: summarize(values) for stage, values in sorted(llm.latencies_ms.items())},
+        "refused": service.refused,
+        "shed": dict(service.shed_stats),
+        "degraded": dict(service.degraded_stats),
+        "fused": dict(service.fused_stats),
+    }
+    if trace_memory:
+        gc.collect()
+        current, peak = tracemalloc.get_traced_memory()
+        growth = sum(stat.size_diff for stat in tracemalloc.take_snapshot().compare_to(baseline, "filename"))
+        tracemalloc.stop()
+        result["memory"] = {
+            "growth_bytes": growth,
+            "per_user_bytes": round(growth / users),
+            "peak_bytes": peak,
+            "current_bytes": current,
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", default="1,100,1000", help="comma-separated numbers of simulated users")
+    parser.add_argument("--messages", type=int, default=1000, help="messages per scenario (at least one per user)")
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--cache-size", type=int, default=10000)
+    parser.add_argument("--repeat-inputs", action="store_true", help="send the same few inputs again and again")
+    parser.add_argument("--writing-style", action="store_true")
+    parser.add_argument("--text-split", action="store_true")
+    parser.add_argument("--split-mode", choices=["local", "llm"], default="local")
+    parser.add_argument("--pipeline-mode", choices=["multi_call", "fused"], default="multi_call")
+    parser.add_argument("--streaming", action="store_true")
+    parser.add_argument("--max-queued-inputs", type=int, default=0, help="bound of every input queue (0: unbounded)")
+    parser.add_argument("--overflow-policy", choices=["block", "reject", "busy"], default="block")
+    parser.add_argument("--archive", action="store_true", help="archive old history to a temporary directory")
+    parser.add_argument("--latency", choices=["constant", "uniform", "lognormal"], default="lognormal")
+    parser.add_argument("--median-ms", type=float, default=5.0)
+    parser.add_argument("--sigma", type=float, default=0.5)
+    parser.add_argument("--token-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory", action="store_true", help="also run every scenario with tracemalloc (slower)")
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = {"config": vars(args), "python": sys.version.split()[0], "scenarios": []}
+    for users in (int(value) for value in args.users.split(",")):
+        scenario = run_scenario(users, args.messages, args, trace_memory=False)
+        if args.memory:
+            # tracemalloc slows down every allocation, so the memory is measured in a separate run.
+            scenario["memory"] = run_scenario(users, args.messages, args, trace_memory=True)["memory"]
+        results["scenarios"].append(scenario)
+        line = (
+            f"users={users:<6} messages={scenario['messages']:<6} {scenario['throughput_msg_per_s']:>9.1f} msg/s  "
+            f"e2e p50={scenario['end_to_end']['p50_ms']:.1f} ms p99={scenario['end_to_end']['p99_ms']:.1f} ms  "
+            f"queue wait p99={scenario['queue_wait']['p99_ms']:.1f} ms"
+        )
+        if "memory" in scenario:
+            line += f"  memory/user={scenario['memory']['per_user_bytes']} B"
+        print(line)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+    else:
+        print(json.dumps(results, indent=2))
+
+
+if __name__ == "__main__":
+    main()
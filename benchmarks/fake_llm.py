@@ -0,0 +1,163 @@
+"""
+Deterministic stand-in for an LLM backend, so the pipeline can be benchmarked offline.
+
+FakeLLM recognizes the prompt of every pipeline stage and returns a canned, well-formed output after a latency
+drawn from a seeded distribution. The emotion scores are derived from a hash of the user input, so repeated
+inputs get the same scores (like a real model at temperature 0) and the appraisal cache behaves realistically.
+"""
+import hashlib
+import json
+import math
+import random
+import re
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, Iterator, List, Optional, Union
+
+from emotionsinai.base_llm import BaseLLM
+from emotionsinai.structured_output import APPRAISAL_KEYS, EMOTION_KEYS
+
+
+class LatencyModel:
+    """
+    Latency distribution of the fake backend: "constant" (median_ms), "uniform" (0 to 2 * median_ms) or
+    "lognormal" (median_ms with shape sigma, i.e. a long tail like real LLM backends).
+    Every generated token adds token_ms on top, so longer outputs take longer.
+    """
+
+    def __init__(self, distribution: str = "lognormal", median_ms: float = 20.0, sigma: float = 0.5, token_ms: float = 0.0, seed: int = 0):
+        if distribution not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution '{distribution}', expected 'constant', 'uniform' or 'lognormal'.")
+        self.distribution = distribution
+        self.median_ms = median_ms
+        self.sigma = sigma
+        self.token_ms = token_ms
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def sample_ms(self, output_tokens: int = 0) -> float:
+        with self._lock:
+            if self.distribution == "constant":
+                latency = self.median_ms
+            elif self.distribution == "uniform":
+                latency = self._random.uniform(0, 2 * self.median_ms)
+            else:
+                latency = self.median_ms * math.exp(self._random.gauss(0, self.sigma))
+        return latency + output_tokens * self.token_ms
+
+
+class FakeLLM(BaseLLM):
+    """
+    Scripted BaseLLM: returns canned outputs for every stage of the pipeline after a simulated latency.
+    The number of calls and the simulated latencies are recorded per stage (see calls, latencies_ms and stats).
+    """
+
+    # Checked in order, the first matching marker determines the stage of a prompt.
+    STAGE_MARKERS = [
+        ("emotion_extraction_batch", "<<<INPUT"),
+        ("fused", "'parts'"),
+        ("emotion_extraction", "Here is the user prompt"),
+        ("writing_style", "adapting written responses"),
+        ("split", "formats long responses"),
+        ("reminder", "reminder or confirmation"),
+        ("reflection", "psychological assistant"),
+        ("summary", "updated summary"),
+        ("response", "empathetic AI agent"),
+    ]
+
+    def __init__(self, latency: Optional[LatencyModel] = None, model_name: str = "fake-llm", max_concurrency: int = 64):
+        self.latency = latency or LatencyModel()
+        self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self.calls: Dict[str, int] = defaultdict(int)
+        self.latencies_ms: Dict[str, List[float]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        text = self._prompt_text(prompt)
+        stage = self.classify(text)
+        output = self.respond(stage, text)
+        latency_ms = self.latency.sample_ms(len(output) // 4)
+        time.sleep(latency_ms / 1000)
+        with self._lock:
+            self.calls[stage] += 1
+            self.latencies_ms[stage].append(latency_ms)
+        return output
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        # The latency until the first token is the sampled latency without the token time; then one word per token_ms.
+        text = self._prompt_text(prompt)
+        stage = self.classify(text)
+        output = self.respond(stage, text)
+        latency_ms = self.latency.sample_ms()
+        time.sleep(latency_ms / 1000)
+        words = re.findall(r"\S+\s*", output) or [output]
+        for word in words:
+            if self.latency.token_ms:
+                time.sleep(self.latency.token_ms / 1000)
+            yield word
+        with self._lock:
+            self.calls[stage] += 1
+            self.latencies_ms[stage].append(latency_ms + len(words) * self.latency.token_ms)
+
+    @property
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """
+        Returns the number of calls and the total simulated latency per stage.
+        """
+        with self._lock:
+            return {stage: {"calls": self.calls[stage], "simulated_ms": round(sum(values), 1)} for stage, values in self.latencies_ms.items()}
+
+    def classify(self, text: str) -> str:
+        for stage, marker in self.STAGE_MARKERS:
+            if marker in text:
+                return stage
+        return "other"
+
+    def respond(self, stage: str, text: str) -> str:
+        if stage == "emotion_extraction":
+            return json.dumps(self.scores(text.rsplit("Here is the user prompt:", 1)[-1].strip()))
+        if stage == "emotion_extraction_batch":
+            inputs = re.findall(r"<<<INPUT (\d+)>>>\s*(.*?)\s*<<<END>>>", text, re.S)
+            return json.dumps([dict(self.scores(user_input), index=int(index)) for index, user_input in inputs])
+        if stage == "fused":
+            answer = "I hear you. That sounds like a lot to deal with. Let us look at it together, step by step."
+            return json.dumps(dict(
+                self.scores(text), emotional_response=answer,
+                parts=[{"text": sentence, "delay": 400} for sentence in answer.split(". ")]
+            ))
+        if stage == "writing_style":
+            return "Sure thing! Here is the answer in your style, short and to the point. Hope it helps."
+        if stage == "split":
+            return json.dumps([{"text": "First part of the answer.", "delay": 400}, {"text": "And the second part.", "delay": 0}])
+        if stage == "reminder":
+            return "[]"
+        if stage == "reflection":
+            return "Be warm and patient, acknowledge the user's feelings and keep the answers short."
+        if stage == "summary":
+            return "The user talked about their day and their plans."
+        if stage == "response":
+            return json.dumps({"emotional_response": "I am here for you.", "reasoning": "", "extracted_emotions": []})
+        return "OK"
+
+    @staticmethod
+    def scores(user_input: str) -> dict:
+        """
+        Deterministic emotion scores for an input, derived from its hash.
+        """
+        digest = hashlib.sha256(user_input.encode("utf-8")).digest()
+        values = [byte / 255 for byte in digest]
+        result = {key: round(values[index], 2) for index, key in enumerate(APPRAISAL_KEYS)}
+        offset = len(APPRAISAL_KEYS)
+        # Most emotions are absent in a typical message.
+        result["emotion_levels"] = {
+            key: round(values[offset + index], 2) if values[offset + index] > 0.6 else 0.0 for index, key in enumerate(EMOTION_KEYS)
+        }
+        return result
+
+    @staticmethod
+    def _prompt_text(prompt: Union[str, List[Dict[str, str]]]) -> str:
+        if isinstance(prompt, str):
+            return prompt
+        return "\n".join(message.get("content", "") for message in prompt)
@@ -0,0 +1,117 @@
+"""
+Import-time regression benchmark.
+
+Every statement is run in fresh interpreters with "python -X importtime"; the benchmark reports the median
+import time, which heavy dependencies were loaded and the modules with the highest self time. It fails
+(exit code 1) if "import emotionsinai" exceeds --max-ms or loads a provider SDK or other heavy dependency.
+
+    python benchmarks/import_time.py --runs 5 --max-ms 50 --json import_time.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+from typing import Dict, List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STATEMENTS = {
+    "package": "import emotionsinai",
+    "emotion_services": "from emotionsinai import EmotionServices",
+    "ollama_provider": "from emotionsinai import OllamaProvider",
+    "openai_provider": "from emotionsinai import OpenAIProvider",
+}
+# Must not be loaded by "import emotionsinai".
+HEAVY_MODULES = ["numpy", "openai", "langchain_ollama", "langchain_core", "langgraph", "langmem", "pydantic", "httpx", "asyncio"]
+
+_IMPORTTIME_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|\s*(\S+)")
+
+# Runs in the fresh interpreter: times the statement and lists the modules it loaded.
+_CHILD = """
+import json, sys, time
+before = set(sys.modules)
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "modules": sorted(set(sys.modules) - before)}}))
+"""
+
+
+def measure(statement: str) -> Dict:
+    """
+    Runs the statement in a fresh interpreter with -X importtime and returns its import time (ms), the heavy
+    modules it loaded and the modules with the highest self time. Returns an error if the statement fails
+    (e.g. a missing optional dependency).
+    """
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD.format(statement=statement)],
+        cwd=ROOT, capture_output=True, text=True
+    )
+    if process.returncode != 0:
+        return {"error": process.stderr.strip().splitlines()[-1] if process.stderr.strip() else "failed"}
+    result = json.loads(process.stdout.strip().splitlines()[-1])
+    top_level = {module.split(".")[0] for module in result["modules"]}
+    self_times = []
+    for line in process.stderr.splitlines():
+        match = _IMPORTTIME_LINE.match(line)
+        if match:
+            self_times.append((int(match.group(1)), match.group(3)))
+    slowest = [f"{module} ({us / 1000:.1f} ms)" for us, module in sorted(self_times, reverse=True)[:5]]
+    return {"ms": result["ms"], "heavy_modules": sorted(top_level.intersection(HEAVY_MODULES)), "slowest": slowest}
+
+
+def run(runs: int) -> Dict[str, Dict]:
+    results = {}
+    for name, statement in STATEMENTS.items():
+        samples: List[Dict] = [measure(statement) for _ in range(runs)]
+        if "error" in samples[0]:
+            results[name] = {"statement": statement, "error": samples[0]["error"]}
+            continue
+        times = [sample["ms"] for sample in samples]
+        results[name] = {
+            "statement": statement,
+            "median_ms": round(statistics.median(times), 2),
+            "min_ms": round(min(times), 2),
+            "max_ms": round(max(times), 2),
+            "heavy_modules": samples[0]["heavy_modules"],
+            "slowest_imports": samples[0]["slowest"],
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per statement")
+    parser.add_argument("--max-ms", type=float, default=50.0, help="budget for the median of 'import emotionsinai'")
+    parser.add_argument("--json", dest="json_path", help="write the results to this file")
+    args = parser.parse_args()
+
+    results = run(args.runs)
+    for name, result in results.items():
+        if "error" in result:
+            print(f"{name:18} skipped: {result['error']}")
+        else:
+            print(f"{name:18} {result['median_ms']:9.2f} ms  heavy modules: {', '.join(result['heavy_modules']) or '-'}")
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    package = results["package"]
+    failures = []
+    if "error" in package:
+        failures.append(package["error"])
+    else:
+        if package["median_ms"] > args.max_ms:
+            failures.append(f"'import emotionsinai' took {package['median_ms']} ms (budget {args.max_ms} ms)")
+        if package["heavy_modules"]:
+            failures.append(f"'import emotionsinai' loaded {', '.join(package['heavy_modules'])}")
+    for failure in failures:
+        print("REGRESSION:", failure)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
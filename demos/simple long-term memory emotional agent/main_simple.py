@@ -1,7 +1,5 @@
 import os
 from dotenv import load_dotenv
-import threading
-import time
 
 from emotionsinai import OpenAIProvider, OllamaProvider, EmotionServices
 from langgraph.store.memory import InMemoryStore
@@ -60,17 +58,13 @@ class SimpleAIAgent:
         except Exception as e:
             print(f"An error occurred while processing input: {e}")
 
-    def check_for_new_response(self):
-        while True:
-            new_response = self.emotion_service.get_new_response()
-            if new_response is not None:
-                print(f"Response: {new_response}")
-            time.sleep(1)
+    def print_response(self, user_id, new_response):
+        print(f"Response: {new_response}")
 
 def main():
     agent = SimpleAIAgent()
-    response_thread = threading.Thread(target=agent.check_for_new_response, daemon=True)
-    response_thread.start()
+    # Responses are printed as soon as they are delivered, no polling required.
+    agent.emotion_service.subscribe(agent.print_response, agent.user_id)
     
     while True:
         user_input = input("Enter a prompt (or type 'exit' to quit): ")
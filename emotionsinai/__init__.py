@@ -1,6 +1,44 @@
+from importlib import import_module
+from typing import TYPE_CHECKING
+
 from .base_llm import BaseLLM
-from .emotion_services import EmotionServices
-from .openai_provider import OpenAIProvider
-from .ollama_provider import OllamaProvider
 
-__all__ = ["BaseLLM", "EmotionServices", "OpenAIProvider", "OllamaProvider"]
\ No newline at end of file
+# Everything except BaseLLM is imported on first access, so "import emotionsinai" does not load the
+# pipeline, numpy or the provider SDKs (openai, langchain_ollama) that the application does not use.
+_LAZY_IMPORTS = {
+    "ResilientLLM": ".resilient_llm",
+    "CircuitOpenError": ".resilient_llm",
+    "EmotionServices": ".emotion_services",
+    "AsyncEmotionServices": ".async_emotion_services",
+    "OpenAIProvider": ".openai_provider",
+    "OllamaProvider": ".ollama_provider",
+    "Instrumentation": ".instrumentation",
+    "PersonaHost": ".persona_host",
+    "HostedPersona": ".persona_host",
+    "OverloadError": ".worker_pool",
+}
+
+if TYPE_CHECKING:
+    from .resilient_llm import ResilientLLM, CircuitOpenError
+    from .emotion_services import EmotionServices
+    from .async_emotion_services import AsyncEmotionServices
+    from .openai_provider import OpenAIProvider
+    from .ollama_provider import OllamaProvider
+    from .instrumentation import Instrumentation
+    from .persona_host import PersonaHost, HostedPersona
+    from .worker_pool import OverloadError
+
+
+def __getattr__(name: str):
+    if name not in _LAZY_IMPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(import_module(_LAZY_IMPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_LAZY_IMPORTS))
+
+
+__all__ = ["BaseLLM", "ResilientLLM", "CircuitOpenError", "EmotionServices", "AsyncEmotionServices", "OpenAIProvider", "OllamaProvider", "Instrumentation", "PersonaHost", "HostedPersona", "OverloadError"]
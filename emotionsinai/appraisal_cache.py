@@ -0,0 +1,188 @@
+import atexit
+import copy
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class AppraisalCache:
+    """
+    LRU/TTL cache for the results of parse_input.
+
+    Entries are addressed by a hash of the normalized input text and the identity of the model that produced
+    the scores, so repeated phrases ("ok", "thanks!", "hello", canned support phrases) skip the LLM call
+    entirely. Only inputs up to max_text_length characters are cached, long messages are rarely repeated.
+
+    If persist_path is given, the cache is loaded from this JSON file on start-up and written back by a
+    background thread every save_interval seconds (or as soon as save_every new entries were added) and on
+    interpreter exit, so it stays warm across restarts while the lookups never wait for the file.
+    With save_interval=None, no background thread is started and the owner has to call save() itself.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 4096,
+        ttl_seconds: Optional[float] = 3600,
+        persist_path: Optional[str] = None,
+        max_text_length: int = 280,
+        save_every: int = 100,
+        save_interval: Optional[float] = 30.0
+    ):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.persist_path = persist_path
+        self.max_text_length = max_text_length
+        self.save_every = save_every
+        self.save_interval = save_interval
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[str, Tuple[float, dict]]" = OrderedDict()
+        self._unsaved = 0
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+        self._save_requested = threading.Event()
+
+        if persist_path:
+            self.load()
+            atexit.register(self.save)
+            if save_interval is not None:
+                threading.Thread(target=self._save_process, daemon=True).start()
+
+    @staticmethod
+    def normalize(text: str) -> str:
+        """
+        Normalize the input text: unicode normalization, case folding and collapsed whitespace.
+        """
+        return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+    def make_key(self, text: str, model: str) -> str:
+        """
+        Content address of an input text for the given model.
+        """
+        return hashlib.sha256(f"{model}\0{self.normalize(text)}".encode("utf-8")).hexdigest()
+
+    def is_cacheable(self, text: str) -> bool:
+        """
+        Returns True if results for this input text are cached at all.
+        """
+        return self.max_entries > 0 and len(text) <= self.max_text_length
+
+    def get(self, text: str, model: str) -> Optional[dict]:
+        """
+        Returns a copy of the cached scores for the input text, or None on a cache miss.
+        """
+        if not self.is_cacheable(text):
+            return None
+        key = self.make_key(text, model)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._is_expired(entry[0]):
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry[1])
+
+    def put(self, text: str, model: str, scores: dict):
+        """
+        Stores the scores for the input text. Empty results (failed extractions) are not cached.
+        """
+        if not scores or not self.is_cacheable(text):
+            return
+        key = self.make_key(text, model)
+        with self._lock:
+            self._entries[key] = (time.time(), copy.deepcopy(scores))
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._unsaved += 1
+            save_soon = self.persist_path is not None and self._unsaved >= self.save_every
+        if save_soon:
+            self._save_requested.set()
+
+    def stats(self) -> Dict[str, float]:
+        """
+        Returns the hit and miss counters, the hit rate and the number of cached entries.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+            }
+
+    def clear(self):
+        """
+        Removes all entries and resets the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def save(self):
+        """
+        Writes the non-expired entries to persist_path. The file is replaced atomically.
+        """
+        if not self.persist_path:
+            return
+        # Saves are serialized, so an older state never replaces a newer one.
+        with self._save_lock:
+            with self._lock:
+                data = {key: [stored_at, scores] for key, (stored_at, scores) in self._entries.items() if not self._is_expired(stored_at)}
+                self._unsaved = 0
+            directory, name = os.path.split(os.path.abspath(self.persist_path))
+            try:
+                # A temporary file of its own, so other processes that share the cache file do not write into it.
+                fd, tmp_path = tempfile.mkstemp(prefix=f"{name}.", suffix=".tmp", dir=directory)
+                try:
+                    with os.fdopen(fd, "w") as file:
+                        json.dump(data, file)
+                    os.replace(tmp_path, self.persist_path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+            except OSError as e:
+                print(f"Warning: Could not save appraisal cache to '{self.persist_path}': {e}")
+
+    def load(self):
+        """
+        Loads the entries from persist_path, skipping expired ones.
+        """
+        try:
+            with open(self.persist_path, "r") as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not load appraisal cache '{self.persist_path}': {e}")
+            return
+
+        with self._lock:
+            # The file is written in LRU order, so the most recently used entries are loaded last.
+            for key, (stored_at, scores) in data.items():
+                if not self._is_expired(stored_at):
+                    self._entries[key] = (stored_at, scores)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _save_process(self):
+        while True:
+            self._save_requested.wait(self.save_interval)
+            self._save_requested.clear()
+            if self._unsaved:
+                self.save()
+
+    def _is_expired(self, stored_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - stored_at > self.ttl_seconds
@@ -0,0 +1,277 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional, Set
+
+from .emotion_services import EmotionServices
+from .worker_pool import OverloadError
+
+
+class AsyncEmotionServices(EmotionServices):
+    """
+    Asyncio-native variant of EmotionServices.
+
+    Instead of three global threads that drain one queue each, every user gets its own pipeline:
+      - an input queue with a dedicated worker task that processes the user's messages strictly in order,
+      - a send queue with a dedicated sender task that delivers the (text, delay) tuples in order.
+
+    Pipelines of different users run concurrently. All blocking work of a message, i.e. the LLM calls
+    (parse_input, WritingStyle, Response_Split, Reflection) and the access to the user profile (which may
+    load it from the profile store), is executed in the worker threads of a pool bounded by max_concurrency,
+    so that one slow call for user A does not block user B.
+
+    All user pipelines are created lazily in the running event loop, so the engine can be
+    constructed outside of a loop and used inside of one. A pipeline that had nothing to do for
+    pipeline_idle_timeout seconds is torn down again (None keeps it until close), so the queues and
+    tasks only exist for the users that are active. An idle pipeline is also torn down when the
+    user's profile is evicted from the profile cache.
+
+    max_queued_inputs bounds the input queue of every user, overflow_policy and shed_ratio apply as in
+    EmotionServices; the send queues are not bounded.
+
+    Further keyword arguments (e.g. streaming=True) are passed to EmotionServices.
+    """
+
+    def __init__(self, resource_file_path: str, system_prompt_path: str, max_concurrency: int = 32, pipeline_idle_timeout: Optional[float] = 60.0, **kwargs):
+        self.max_concurrency = max_concurrency
+        self.pipeline_idle_timeout = pipeline_idle_timeout
+        super().__init__(resource_file_path, system_prompt_path, **kwargs)
+
+    def _start_workers(self):
+        """
+        No background threads are started. The user pipelines are created on demand by add_input.
+        """
+        self._input_queues: Dict[str, asyncio.Queue] = {}
+        self._send_queues: Dict[str, asyncio.Queue] = {}
+        # The users with a running reflection.
+        self._reflection_running: Set[str] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._tasks: Set[asyncio.Task] = set()
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="emotion-llm")
+        self.instrumentation.register_queue("input", lambda: sum(q.qsize() for q in list(self._input_queues.values())))
+        self.instrumentation.register_queue("send_response", lambda: sum(q.qsize() for q in list(self._send_queues.values())))
+
+    async def add_input(self, user_id: str, prompt: str, answer: Optional[str] = None, writing_style: bool = False, text_split: bool = False) -> bool:
+        """
+        Add a new input to the pipeline of the given user. Inputs of the same user are processed strictly
+        in the order in which they were added, inputs of different users are processed concurrently.
+        Returns False if the input was refused because the user's input queue is full (see EmotionServices.add_input).
+        """
+        if self._loop is None:
+            self._loop = asyncio.get_running_loop()
+        if user_id not in self._input_queues:
+            self._start_user_pipeline(user_id)
+        input_queue = self._input_queues[user_id]
+        item = (prompt, answer, writing_style, text_split)
+        try:
+            if self.overflow_policy == "block":
+                await asyncio.wait_for(input_queue.put(item), self.overflow_timeout)
+            else:
+                input_queue.put_nowait(item)
+            return True
+        except (asyncio.QueueFull, asyncio.TimeoutError):
+            self._shed("input")
+            if self.overflow_policy == "reject":
+                raise OverloadError(f"The input queue is full, the input of user {user_id} was rejected.")
+            return False
+
+    async def get_response(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for the next response chunk for the given user.
+        Returns None if no response arrived within the timeout (in seconds).
+        """
+        return await self.response_channels.get_async(user_id, timeout)
+
+    def get_queue_depths(self) -> Dict[str, object]:
+        """
+        Returns the current number of queued items of the pipelines:
+          - "input": the depth of the input queue of every user,
+          - "send_response": the depth of the send queue of every user.
+        """
+        return {
+            "input": {user_id: input_queue.qsize() for user_id, input_queue in self._input_queues.items()},
+            "send_response": {user_id: send_queue.qsize() for user_id, send_queue in self._send_queues.items()},
+        }
+
+    def is_overloaded(self, user_id: str) -> bool:
+        """
+        Returns True if the user's input queue is filled beyond shed_ratio of max_queued_inputs.
+        """
+        if self.max_queued_inputs <= 0:
+            return False
+        input_queue = self._input_queues.get(user_id)
+        return input_queue is not None and input_queue.qsize() >= self.shed_ratio * self.max_queued_inputs
+
+    async def join(self):
+        """
+        Wait until all inputs that were added so far have been processed and their responses were delivered.
+        """
+        for input_queue in list(self._input_queues.values()):
+            await input_queue.join()
+        for send_queue in list(self._send_queues.values()):
+            await send_queue.join()
+
+    async def close(self):
+        """
+        Cancel all user pipelines.
+        """
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._input_queues.clear()
+        self._send_queues.clear()
+        self._executor.shutdown(wait=False)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    def _start_user_pipeline(self, user_id: str):
+        """
+        Create the input and send queues of a user together with their worker tasks.
+        """
+        # The profile is loaded by the worker threads (ProfileCache creates it exactly once).
+        self._input_queues[user_id] = asyncio.Queue(self.max_queued_inputs)
+        self._send_queues[user_id] = asyncio.Queue()
+        self._create_task(self._input_worker(user_id))
+        self._create_task(self._send_worker(user_id))
+
+    def _create_task(self, coro):
+        """
+        Start a task and keep a reference to it until it is done.
+        """
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    async def _run_blocking(self, func, *args):
+        """
+        Run a blocking call (typically an LLM round trip) in the bounded worker thread pool.
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(func, *args))
+
+    def release_user(self, user_id: str):
+        """
+        Releases the state of a user whose profile was evicted, including the user's pipeline if it is idle.
+        Called by the thread that evicted the profile.
+        """
+        super().release_user(user_id)
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            loop.call_soon_threadsafe(self._wake_idle_pipeline, user_id)
+
+    def _wake_idle_pipeline(self, user_id: str):
+        """
+        Let the input worker of an idle pipeline check right away whether the pipeline can be stopped.
+        """
+        input_queue = self._input_queues.get(user_id)
+        if input_queue is not None and input_queue.empty():
+            input_queue.put_nowait(None)
+
+    def _stop_user_pipeline(self, user_id: str):
+        """
+        Remove the queues of an idle user pipeline and let its sender task finish.
+        The next input of the user starts a new pipeline.
+        """
+        self._input_queues.pop(user_id, None)
+        send_queue = self._send_queues.pop(user_id, None)
+        if send_queue is not None:
+            send_queue.put_nowait(None)
+
+    async def _input_worker(self, user_id: str):
+        """
+        Processes the inputs of one user one after another. Ends when the pipeline was idle for pipeline_idle_timeout seconds
+        or the user's profile was evicted while the pipeline was idle.
+        """
+        input_queue = self._input_queues[user_id]
+        send_queue = self._send_queues[user_id]
+        while True:
+            try:
+                item = await asyncio.wait_for(input_queue.get(), self.pipeline_idle_timeout)
+            except asyncio.TimeoutError:
+                item = None
+            else:
+                if item is None:
+                    # Woken up by _wake_idle_pipeline.
+                    input_queue.task_done()
+            if item is None:
+                await send_queue.join()
+                # No await between the check and the removal, so no input can slip in between.
+                if input_queue.empty() and user_id not in self._reflection_running:
+                    self._stop_user_pipeline(user_id)
+                    return
+                continue
+            prompt, answer, writing_style, text_split = item
+            try:
+                if self.streaming:
+                    # The chunks are produced in a worker thread and handed to the sender task as soon as they are complete.
+                    on_chunks = functools.partial(self._loop.call_soon_threadsafe, send_queue.put_nowait)
+                    await self._run_blocking(self._process_pinned, user_id, prompt, answer, writing_style, text_split, on_chunks)
+                else:
+                    response_list = await self._run_blocking(self._process_pinned, user_id, prompt, answer, writing_style, text_split)
+                    await send_queue.put(response_list)
+            except Exception as e:
+                print(f"[AsyncEmotionServices] Error processing input for user {user_id}: {e}")
+            finally:
+                input_queue.task_done()
+
+    def _process_pinned(self, user_id: str, prompt: str, answer: Optional[str], writing_style: bool, text_split: bool, on_chunks=None):
+        """
+        Processes a message and applies its appraisal in a worker thread, while the profile is kept in memory
+        (see EmotionServices.using_profile). Returns the (text, delay) tuples to send.
+        """
+        with self.using_profile(user_id):
+            scores, response_list = self.process_message(user_id, prompt, answer, writing_style, text_split, on_chunks)
+            self.apply_appraisal(scores, user_id)
+        return response_list
+
+    async def _send_worker(self, user_id: str):
+        """
+        Delivers the (text, delay) tuples of one user in order.
+        """
+        send_queue = self._send_queues[user_id]
+        while True:
+            tuples_list = await send_queue.get()
+            if tuples_list is None:
+                # The pipeline was stopped.
+                send_queue.task_done()
+                return
+            try:
+                for text, delay in tuples_list:
+                    # Adds the chunk to the user's profile, which may have to be loaded.
+                    await self._run_blocking(self.deliver_response, user_id, text)
+                    await asyncio.sleep(delay / 1000)
+            finally:
+                send_queue.task_done()
+
+    def request_reflection(self, user_id: str):
+        """
+        Queues a guideline refresh for the user. Called by process_message in a worker thread
+        whenever the reflection policy asks for a refresh.
+        """
+        self._loop.call_soon_threadsafe(self._schedule_reflection, user_id)
+
+    def _schedule_reflection(self, user_id: str):
+        """
+        Start a reflection for the user unless one is already running for this user.
+        """
+        if user_id in self._reflection_running:
+            return
+        self._reflection_running.add(user_id)
+        self._create_task(self._reflect(user_id))
+
+    async def _reflect(self, user_id: str):
+        """
+        Generates a new emotional guideline for the user in a worker thread (see EmotionServices.run_reflection).
+        """
+        try:
+            await self._run_blocking(self.run_reflection, user_id)
+        except Exception as e:
+            print(f"[AsyncEmotionServices] Error during reflection for user {user_id}: {e}")
+        finally:
+            self._reflection_running.discard(user_id)
@@ -1,13 +1,24 @@
 # base_llm.py
 
+import contextlib
+import weakref
 from abc import ABC, abstractmethod
-from typing import Union, List, Dict
+from typing import TYPE_CHECKING, AsyncIterator, Union, List, Dict, Iterator, Optional
+
+if TYPE_CHECKING:
+    import asyncio
 
 class BaseLLM(ABC):
     """
     Abstract base class defining the minimal contract for an LLM provider.
+
+    Only send_prompt is required. stream_prompt, send_prompt_async and batch_send have default
+    implementations on top of it, which providers with native support should override.
+    At most max_concurrency requests are sent at the same time by batch_send and send_prompt_async.
     """
 
+    max_concurrency: int = 8
+
     @abstractmethod
     def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
         """
@@ -17,3 +28,80 @@ class BaseLLM(ABC):
         Return the LLM's response as a string.
         """
         pass
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        """
+        Yields the LLM's response in pieces (tokens) as soon as they are generated.
+        Providers that support streaming should override this method; by default,
+        the complete response of send_prompt is yielded as one piece.
+        """
+        yield self.send_prompt(prompt)
+
+    async def send_prompt_async(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        """
+        Asynchronous variant of send_prompt. By default, send_prompt is run in a worker thread.
+        """
+        # asyncio (and concurrent.futures below) are imported on use, they are slow to import and many callers are synchronous.
+        import asyncio
+        async with self._get_async_semaphore():
+            return await asyncio.to_thread(self.send_prompt, prompt)
+
+    def batch_send(self, prompts: List[Union[str, List[Dict[str, str]]]], max_concurrency: Optional[int] = None) -> List[str]:
+        """
+        Sends several independent prompts concurrently (at most max_concurrency at a time)
+        and returns the responses in the order of the prompts.
+        """
+        if not prompts:
+            return []
+        workers = min(len(prompts), max_concurrency or self.max_concurrency)
+        if workers <= 1:
+            return [self.send_prompt(prompt) for prompt in prompts]
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="llm-batch") as executor:
+            return list(executor.map(self.send_prompt, prompts))
+
+    def is_healthy(self) -> bool:
+        """
+        Returns False while the provider is known to be unavailable or overloaded (see ResilientLLM),
+        so callers can skip optional LLM work instead of waiting for failing calls.
+        """
+        return True
+
+    def _get_async_semaphore(self) -> "asyncio.Semaphore":
+        """
+        Returns the semaphore that limits the concurrent async requests of this provider in the running event loop.
+        """
+        import asyncio
+        loop = asyncio.get_running_loop()
+        if "_async_semaphores" not in self.__dict__:
+            self._async_semaphores = weakref.WeakKeyDictionary()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores[loop] = asyncio.Semaphore(self.max_concurrency)
+        return semaphore
+
+    @contextlib.asynccontextmanager
+    async def _async_slot(self) -> AsyncIterator[None]:
+        """
+        Holds one of the max_concurrency request slots for an async request. Providers that limit their sync requests
+        with a threading semaphore (self._slots) share it with the async requests, so mixed callers never have more
+        than max_concurrency requests in flight; a busy slot is waited for in a worker thread.
+        """
+        import asyncio
+        slots = self.__dict__.get("_slots")
+        if slots is None:
+            async with self._get_async_semaphore():
+                yield
+            return
+        if not slots.acquire(blocking=False):
+            acquired = asyncio.get_running_loop().run_in_executor(None, slots.acquire)
+            try:
+                await asyncio.shield(acquired)
+            except asyncio.CancelledError:
+                # The worker thread still takes the slot, give it back as soon as it has.
+                acquired.add_done_callback(lambda future: future.cancelled() or slots.release())
+                raise
+        try:
+            yield
+        finally:
+            slots.release()
@@ -0,0 +1,178 @@
+import textwrap
+import threading
+from typing import Dict, List, Optional
+
+from .base_llm import BaseLLM
+from .conversation_buffer import MessageRecord
+from .instrumentation import llm_stage
+from .user_profile import UserProfile
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough token estimate of a text (about four characters per token), good enough for budgeting prompts.
+    """
+    return (len(text) + 3) // 4
+
+
+class ContextBuilder:
+    """
+    Builds the conversation context of the LLM prompts (reflection, writing style, response) within a token budget.
+
+      - The most recent turns (at most recent_turns, or the window a caller passes to build) are kept verbatim
+        as long as they fit into the budget.
+        The latest turn is always included, shortened if necessary.
+      - Older turns are folded into a running summary that is stored on the user profile. The summary is
+        updated incrementally: only the turns that dropped out of the recent window since the last update
+        are added, the history is never summarized again from scratch.
+      - The summary is updated with the llm if one is given, otherwise by a cheap extractive summary
+        (the beginning of every message). It is limited to summary_share of the budget.
+
+    The token counts of the contexts and of the complete prompts are recorded per stage (see get_stats).
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 1024,
+        recent_turns: int = 6,
+        summary_share: float = 0.25,
+        llm: Optional[BaseLLM] = None,
+        stage_budgets: Optional[Dict[str, int]] = None
+    ):
+        self.max_tokens = max_tokens
+        self.recent_turns = recent_turns
+        self.summary_share = summary_share
+        self.llm = llm
+        self.stage_budgets = stage_budgets or {}
+        self._stats: Dict[str, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+
+    def build(self, user_profile: UserProfile, stage: str = "default", max_tokens: Optional[int] = None, recent_turns: Optional[int] = None) -> str:
+        """
+        Returns the conversation context of the user for the given stage as text.
+        recent_turns overrides the number of turns that are kept verbatim (default: the recent_turns of the builder).
+        """
+        budget = max_tokens or self.stage_budgets.get(stage, self.max_tokens)
+        summary_budget = int(budget * self.summary_share)
+        window = self.recent_turns if recent_turns is None else recent_turns
+        records = user_profile.get_recent_messages()
+
+        # Select the recent turns from the newest one backwards until the budget is used up.
+        recent: List[str] = []
+        used = 0
+        for record in reversed(records[-window:] if window > 0 else []):
+            line = self.format_record(record)
+            tokens = estimate_tokens(line) + 1
+            if recent and used + tokens > budget - summary_budget:
+                break
+            if not recent and tokens > budget - summary_budget:
+                line = textwrap.shorten(line, width=max(20, (budget - summary_budget) * 4), placeholder=" ...")
+                tokens = estimate_tokens(line) + 1
+            recent.append(line)
+            used += tokens
+        recent.reverse()
+
+        # Everything before the recent turns belongs to the summary.
+        summary = self._update_summary(user_profile, user_profile.conversations.total_appended - len(recent), summary_budget)
+
+        parts = []
+        if summary:
+            parts.append(f"Summary of the earlier conversation: {summary}")
+        if recent:
+            parts.append("Recent messages:\n" + "\n".join(recent))
+        context = "\n\n".join(parts) if parts else "No previous messages."
+        self._record(stage, "context_tokens", estimate_tokens(context))
+        return context
+
+    def record_prompt(self, stage: str, prompt: str):
+        """
+        Records the token count of a complete prompt that was sent to the LLM for the given stage.
+        """
+        tokens = estimate_tokens(prompt)
+        self._record(stage, "prompt_tokens", tokens)
+        with self._lock:
+            stats = self._stats[stage]
+            stats["prompts"] = stats.get("prompts", 0) + 1
+            stats["max_prompt_tokens"] = max(stats.get("max_prompt_tokens", 0), tokens)
+
+    def get_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the recorded token counts per stage: number of prompts, total and maximum prompt tokens,
+        total context tokens and the tokens sent to summarize old turns.
+        """
+        with self._lock:
+            return {stage: dict(stats) for stage, stats in self._stats.items()}
+
+    def format_record(self, record: MessageRecord) -> str:
+        """
+        Formats one message compactly: the role, the content and the noticeable emotions.
+        """
+        line = f"{record.role}: {record.content}"
+        if record.emotions:
+            emotions = ", ".join(f"{emotion} {score:.2f}" for emotion, score in record.emotions if score >= 0.1)
+            if emotions:
+                line += f" [emotions: {emotions}]"
+        return line
+
+    def _update_summary(self, user_profile: UserProfile, summarize_until: int, summary_budget: int) -> str:
+        """
+        Folds the turns between the last summarized turn and summarize_until (both counted over all messages
+        ever appended) into the running summary of the user and returns it.
+        """
+        summary = user_profile.context_summary
+        summarized = user_profile.context_summarized
+        if summarize_until <= summarized:
+            return summary
+
+        records = user_profile.get_recent_messages()
+        first_retained = user_profile.conversations.total_appended - len(records)
+        # Turns that were evicted from the history before they could be summarized are skipped.
+        new_records = records[max(summarized, first_retained) - first_retained:max(0, summarize_until - first_retained)]
+        if new_records:
+            summary = self._summarize(summary, new_records, summary_budget)
+
+        with self._lock:
+            # Another stage may have updated the summary in the meantime; the first update wins.
+            if user_profile.context_summarized == summarized:
+                user_profile.context_summary = summary
+                user_profile.context_summarized = summarize_until
+                user_profile.dirty = True
+            return user_profile.context_summary
+
+    def _summarize(self, summary: str, new_records: List[MessageRecord], summary_budget: int) -> str:
+        if self.llm is not None:
+            prompt = (
+                "You maintain a running summary of a conversation between a user and an AI agent. "
+                "Update the summary with the new messages. Keep the facts, the user's concerns and the emotional "
+                f"course of the conversation. Use at most {summary_budget * 3 // 4} words.\n\n"
+                f"Current summary: {summary or 'None'}\n\n"
+                "New messages:\n" + "\n".join(self.format_record(record) for record in new_records) + "\n\n"
+                "Return ONLY the updated summary."
+            )
+            self._record("summary", "prompt_tokens", estimate_tokens(prompt))
+            try:
+                with llm_stage("context_summary"):
+                    updated = self.llm.send_prompt(prompt).strip()
+                if updated:
+                    return self._limit(updated, summary_budget)
+            except Exception as e:
+                print(f"[ContextBuilder] Error updating the summary, falling back to an extractive summary: {e}")
+
+        lines = [summary] if summary else []
+        for record in new_records:
+            lines.append(f"{record.role}: {textwrap.shorten(record.content, width=100, placeholder=' ...')}")
+        return self._limit(" | ".join(lines), summary_budget)
+
+    def _limit(self, summary: str, summary_budget: int) -> str:
+        """
+        Drops the beginning of the summary if it exceeds the budget, so the most recent part is kept.
+        """
+        max_chars = summary_budget * 4
+        if len(summary) <= max_chars:
+            return summary
+        return "..." + summary[len(summary) - max_chars + 3:]
+
+    def _record(self, stage: str, key: str, tokens: int):
+        with self._lock:
+            stats = self._stats.setdefault(stage, {})
+            stats[key] = stats.get(key, 0) + tokens
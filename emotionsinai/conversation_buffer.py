@@ -0,0 +1,143 @@
+import gzip
+import json
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+
+class MessageRecord:
+    """
+    Compact record of one conversation message.
+    The emotions are stored as a tuple of (emotion, score) pairs instead of a list of dictionaries.
+    """
+
+    __slots__ = ("role", "content", "emotions", "timestamp")
+
+    def __init__(self, role: str, content: str, emotions: Optional[List[Dict[str, float]]] = None, timestamp: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.emotions: Optional[Tuple[Tuple[str, float], ...]] = (
+            tuple((emotion_obj["emotion"], emotion_obj["score"]) for emotion_obj in emotions) if emotions is not None else None
+        )
+        self.timestamp = timestamp if timestamp is not None else time.time()
+
+    def get_emotions(self) -> Optional[List[Dict[str, float]]]:
+        """
+        Returns the emotions in the {'emotion': ..., 'score': ...} format of UserProfile.add_message.
+        """
+        if self.emotions is None:
+            return None
+        return [{"emotion": emotion, "score": score} for emotion, score in self.emotions]
+
+    def to_dict(self) -> Dict:
+        """
+        Returns the message in the dictionary format of the conversation history.
+        """
+        return {
+            "role": self.role,
+            "content": self.content,
+            "emotions": self.get_emotions()
+        }
+
+    def __getitem__(self, key: str):
+        # Allows read access like on the former message dictionaries, e.g. record["content"].
+        if key == "emotions":
+            return self.get_emotions()
+        if key in ("role", "content", "timestamp"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def __repr__(self) -> str:
+        return f"MessageRecord(role={self.role!r}, content={self.content!r})"
+
+
+class ConversationBuffer:
+    """
+    Fixed-capacity ring buffer of MessageRecords.
+
+    Once the buffer is full, every new message replaces the oldest one, so the memory per user is bounded
+    by the capacity. If archive_path is given, evicted messages are appended to this gzip-compressed JSON
+    lines file instead of being dropped.
+    """
+
+    def __init__(self, capacity: int = 100, archive_path: Optional[str] = None):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1.")
+        self.capacity = capacity
+        self.archive_path = archive_path
+        self._records: List[Optional[MessageRecord]] = [None] * capacity
+        self._count = 0        # total number of appended records
+        self._lock = threading.Lock()
+
+    @property
+    def total_appended(self) -> int:
+        """
+        Number of messages that were ever appended, including the evicted ones.
+        """
+        return self._count
+
+    def __len__(self) -> int:
+        return min(self._count, self.capacity)
+
+    def __iter__(self) -> Iterator[MessageRecord]:
+        return iter(self.last())
+
+    def append(self, record: MessageRecord):
+        """
+        Appends a record, evicting (and optionally archiving) the oldest one if the buffer is full.
+        """
+        with self._lock:
+            position = self._count % self.capacity
+            evicted = self._records[position]
+            self._records[position] = record
+            self._count += 1
+            if evicted is not None and self.archive_path:
+                self._archive_record(evicted)
+
+    def last(self, num_messages: Optional[int] = None) -> List[MessageRecord]:
+        """
+        Returns the last num_messages records (all records if None), oldest first.
+        Takes O(num_messages): only the references to the records are sliced out of the ring, nothing is copied.
+        """
+        with self._lock:
+            size = min(self._count, self.capacity)
+            if num_messages is None or num_messages > size:
+                num_messages = size
+            if num_messages <= 0:
+                return []
+            end = self._count % self.capacity
+            start = end - num_messages
+            if start >= 0:
+                return self._records[start:end]
+            return self._records[start:] + self._records[:end]
+
+    def clear(self):
+        """
+        Removes all records from the buffer. Archived messages are kept.
+        """
+        with self._lock:
+            self._records = [None] * self.capacity
+            self._count = 0
+
+    def read_archive(self) -> Iterator[Dict]:
+        """
+        Iterates over the archived (evicted) messages, oldest first.
+        """
+        if not self.archive_path:
+            return
+        try:
+            with gzip.open(self.archive_path, "rt", encoding="utf-8") as file:
+                for line in file:
+                    yield json.loads(line)
+        except FileNotFoundError:
+            return
+
+    def _archive_record(self, record: MessageRecord):
+        # Every append adds a gzip member, the file is not kept open so idle users hold no file handles.
+        entry = record.to_dict()
+        entry["timestamp"] = record.timestamp
+        try:
+            with gzip.open(self.archive_path, "at", encoding="utf-8") as file:
+                file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        except OSError as e:
+            print(f"Warning: Could not archive message to '{self.archive_path}': {e}")
@@ -0,0 +1,133 @@
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from .base_llm import BaseLLM
+from .structured_output import StructuredOutputError, extract_json, coerce_scores
+
+
+class EmotionBatcher:
+    """
+    Collects concurrent emotion extraction requests within a small time or size window and sends them
+    to the LLM as one structured request, so the long instruction block is only sent once per batch.
+
+    The LLM is asked to return a JSON array with one score object per input. The results are split back
+    to the callers. If the batch output is malformed (invalid JSON, wrong number of objects, missing keys),
+    submit returns None and the caller falls back to the single-input extraction.
+
+    Batching only pays off if several threads extract emotions at the same time,
+    e.g. EmotionServices with num_workers > 1.
+    """
+
+    def __init__(self, llm: BaseLLM, max_batch_size: int = 8, max_wait_ms: int = 20, max_concurrent_batches: int = 2):
+        self.llm = llm
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self._requests: queue.Queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches, thread_name_prefix="emotion-batch")
+        threading.Thread(target=self._collect, daemon=True).start()
+
+    def submit(self, user_input: str) -> Optional[dict]:
+        """
+        Queue the user input for the next batch and block until its scores are available.
+        Returns the parsed score dictionary, or None if the batch output could not be used for this input.
+        """
+        future: Future = Future()
+        # The context of the caller travels with the request, so the batched LLM call is attributed to its stage.
+        self._requests.put((user_input, future, contextvars.copy_context()))
+        return future.result()
+
+    def _collect(self):
+        """
+        Forms batches: waits for a first request, then collects more requests until the batch is full
+        or the time window is over, and hands the batch to the executor.
+        """
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait_ms / 1000.0
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch: List[Tuple[str, Future, contextvars.Context]]):
+        """
+        Sends one batch to the LLM and resolves the futures of its callers.
+        """
+        if len(batch) == 1:
+            # Nothing to share, the caller uses the regular single-input prompt.
+            batch[0][1].set_result(None)
+            return
+
+        try:
+            context = batch[0][2]
+            response = context.run(self.llm.send_prompt, self.build_batch_prompt([user_input for user_input, _, _ in batch]))
+            results = context.run(self.parse_batch_output, response, len(batch))
+        except Exception as e:
+            print("Error in batched emotion extraction:", e)
+            results = None
+
+        for index, (_, future, _) in enumerate(batch):
+            future.set_result(results[index] if results else None)
+
+    @staticmethod
+    def build_batch_prompt(user_inputs: List[str]) -> str:
+        """
+        Build one prompt that asks for the emotional and appraisal scores of several user inputs.
+        """
+        numbered_inputs = "\n\n".join(
+            f"<<<INPUT {index}>>>\n{user_input}\n<<<END>>>" for index, user_input in enumerate(user_inputs)
+        )
+        return f"""
+            You are an expert NLP analyzer designed to extract detailed emotional and appraisal scores from user inputs.
+            Please analyze each of the following {len(user_inputs)} user prompts independently and return a JSON array of score objects,
+            exactly one object per user prompt and in the same order. Each object includes the following keys with scores between 0 and 1:
+            - "index": The number of the user prompt the object belongs to.
+            - "sentiment_score": A value representing the overall sentiment of the text (0 being very negative and 1 being very positive).
+            - "relevance": How relevant the prompt is in relation to the current context.
+            - "novelty": The degree of unexpectedness or new information in the prompt.
+            - "goal_alignment": How well the prompt aligns with the agent's goals.
+            - "controllability": A measure of how controllable or manageable the situation described in the prompt is.
+            - "normative_significance": The importance of the prompt based on social norms or expected interactions.
+            - "emotion_levels": A JSON object containing the following keys, each with a score between 0 and 1:
+                "happiness", "sadness", "anger", "fear", "surprise", "disgust", "love", "jealousy", "guilt", "pride", "shame", "compassion", "sympathy", "trust".
+
+            Please ensure that each key is assigned a numerical score between 0 and 1, where 0 means the attribute is absent and 1 means it is at its maximum.
+            Please only return the JSON array, no explanation or other text. And never put any single or double quotation marks before and after the JSON array.
+
+            Here are the user prompts, each enclosed in <<<INPUT n>>> and <<<END>>>:
+
+            {numbered_inputs}
+            """
+
+    @staticmethod
+    def parse_batch_output(output: str, expected: int) -> Optional[List[dict]]:
+        """
+        Parse the JSON array returned for a batch of the given size.
+        Returns the score objects in input order, or None if the output is malformed.
+        """
+        try:
+            data = extract_json(output, expect=list)
+        except StructuredOutputError as e:
+            print("Error parsing batch JSON:", e)
+            return None
+
+        if len(data) != expected:
+            return None
+        if not all(isinstance(item, dict) and isinstance(item.get("emotion_levels"), dict) for item in data):
+            return None
+
+        # Prefer the explicit index over the position if the LLM returned every index exactly once.
+        indices = [item.get("index") for item in data]
+        if sorted(i for i in indices if isinstance(i, int)) == list(range(expected)):
+            data = sorted(data, key=lambda item: item["index"])
+
+        return [coerce_scores(item) for item in data]
@@ -2,25 +2,33 @@ import json
 import threading
 import time
 import queue
-from typing import Dict, Optional, Tuple, List
+import heapq
+import weakref
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, Optional, Tuple, List
 
 import os
-from dotenv import load_dotenv
+from urllib.parse import quote
 
 # Assuming BaseLLM, UserProfile, and Response are defined elsewhere in your package.
 from .base_llm import BaseLLM
 from .user_profile import UserProfile
 from .reponse import Response
-from .response_split import Response_Split
+from .response_split import Response_Split, LocalSplitter, TypingSpeedModel
 from .writing_style import WritingStyle
 from .reflection import Reflection
 from .internal_profile import InternalProfile
-
-from langchain_ollama import ChatOllama
-from langgraph.func import entrypoint
-from langgraph.store.memory import InMemoryStore
-from langmem import create_memory_store_manager
-from pydantic import BaseModel, Field
+from .response_channels import ResponseChannels
+from .worker_pool import ShardedWorkerPool, OverloadError
+from .emotion_batcher import EmotionBatcher
+from .appraisal_cache import AppraisalCache
+from .reflection_policy import ReflectionPolicy
+from .profile_store import ProfileCache, ProfileStore
+from .state_journal import StateJournal
+from .context_builder import ContextBuilder
+from .resilient_llm import ResilientLLM
+from .structured_output import extract_json, coerce_scores
+from .instrumentation import Instrumentation, InstrumentedLLM, TimedQueue
 
 
 #OPENAI_API_KEY = ""
@@ -40,22 +48,103 @@ class EmotionServices:
     #def add_new_messages_to_memory(self, messages: list):
     #    self.manager.invoke({"messages": messages})
 
-    def __init__(self, resource_file_path: str, system_prompt_path: str):
+    def __init__(
+        self,
+        resource_file_path: str,
+        system_prompt_path: str,
+        num_workers: int = 1,
+        batch_size: int = 1,
+        batch_window_ms: int = 20,
+        cache_size: int = 4096,
+        cache_ttl: Optional[float] = 3600,
+        cache_path: Optional[str] = None,
+        fast_path: bool = False,
+        fast_path_min_confidence: float = 0.6,
+        fast_path_max_length: int = 200,
+        reflection_policy: Optional[ReflectionPolicy] = None,
+        history_capacity: int = 100,
+        history_archive_dir: Optional[str] = None,
+        profile_store: Optional[ProfileStore] = None,
+        max_cached_profiles: int = 10000,
+        profile_flush_interval: float = 5.0,
+        state_dir: Optional[str] = None,
+        context_builder: Optional[ContextBuilder] = None,
+        streaming: bool = False,
+        pipeline_mode: str = "multi_call",
+        split_mode: str = "local",
+        typing_model: Optional[TypingSpeedModel] = None,
+        llm: Optional[BaseLLM] = None,
+        instrumentation: Optional[Instrumentation] = None,
+        max_queued_inputs: int = 0,
+        max_queued_reflections: int = 0,
+        max_queued_responses: int = 0,
+        overflow_policy: str = "block",
+        overflow_timeout: Optional[float] = None,
+        shed_ratio: float = 0.5,
+        max_buffered_responses: int = 1000,
+        response_ttl: Optional[float] = 600.0
+    ):
         """
-        Initializes the emotion service with two LLM providers and loads an overall emotion setup
-        from a JSON file (if available). This new version employs two dedicated threads:
-        
-          1. reflection_process: waits for a user_id, performs reflection using llm_reflecting,
-             and passes a list of tuples to the send_response_process.
-             
-          2. send_response_process: waits for a list of (string, int) tuples and generates a final response using llm_thinking.
+        Initializes the emotion service: loads the persona from resource_file_path and the emotion system prompt
+        from system_prompt_path and starts the workers (see _start_workers).
+
+        LLM and pipeline:
+          - llm: the BaseLLM of all stages (default: OllamaProvider with llama3.1 in a ResilientLLM). If it fails or
+            is unhealthy, the stages degrade to local fallbacks instead of failing (see degraded_stats).
+          - pipeline_mode: "multi_call", or "fused" for one LLM call for emotions, answer and split (see Response.fused_response).
+          - streaming: the adapted answer is streamed and sent chunk by chunk while it is generated.
+          - split_mode: "local" (LocalSplitter) or "llm" (Response_Split); the typing_model simulates the delays.
+          - batch_size, batch_window_ms: batched emotion extraction (see EmotionBatcher).
+          - cache_size, cache_ttl, cache_path: cache of the parse_input results (see AppraisalCache).
+          - fast_path, fast_path_min_confidence, fast_path_max_length: local scoring before the LLM (see LexiconEmotionExtractor).
+          - reflection_policy: decides when a guideline refresh is worth an LLM call (see ReflectionPolicy).
+          - context_builder: builds the conversation context of the prompts (see ContextBuilder).
+          - instrumentation: metrics of the stages, LLM calls and queues (see Instrumentation).
+
+        State:
+          - history_capacity, history_archive_dir: retained and archived messages per user (see UserProfile).
+          - profile_store, max_cached_profiles, profile_flush_interval: lazily loaded user profiles (see ProfileCache).
+          - state_dir: journal of the emotional state, restored on start-up (see StateJournal).
+          - max_buffered_responses, response_ttl: unread response chunks per user (see ResponseChannels).
+
+        Concurrency and overload:
+          - num_workers: input workers; the inputs of one user are processed in order by one worker (see ShardedWorkerPool).
+          - max_queued_inputs, max_queued_reflections, max_queued_responses: queue bounds (0: unbounded).
+          - overflow_policy, overflow_timeout, shed_ratio: handling of a full input queue (see add_input).
         """
+        self.history_capacity = history_capacity
+        self.history_archive_dir = history_archive_dir
+        self.num_workers = num_workers
+        self.streaming = streaming
+        if pipeline_mode not in ("multi_call", "fused"):
+            raise ValueError(f"Unknown pipeline_mode '{pipeline_mode}', expected 'multi_call' or 'fused'.")
+        self.pipeline_mode = pipeline_mode
+        self.fused_stats = {"fused": 0, "fallback": 0}
+        if split_mode not in ("local", "llm"):
+            raise ValueError(f"Unknown split_mode '{split_mode}', expected 'local' or 'llm'.")
+        self.split_mode = split_mode
+        self.degraded_stats: Dict[str, int] = {}
+        # Guards the counters fused_stats, degraded_stats and shed_stats, which are updated by all workers.
+        self._stats_lock = threading.Lock()
+        if overflow_policy not in ("block", "reject", "busy"):
+            raise ValueError(f"Unknown overflow_policy '{overflow_policy}', expected 'block', 'reject' or 'busy'.")
+        self.overflow_policy = overflow_policy
+        self.overflow_timeout = overflow_timeout
+        self.max_queued_inputs = max_queued_inputs
+        self.shed_ratio = shed_ratio
+        self.shed_stats: Dict[str, int] = {}
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
     
-        self.llm_reflecting = ChatOllama(
-            model="llama3.1",
-            temperature=0,
-            # other params...
-        )
+        if llm is None:
+            # Imported on demand, so a custom provider does not require the Ollama client.
+            from .ollama_provider import OllamaProvider
+            llm = ResilientLLM(OllamaProvider("llama3.1", temperature=0))
+        # The LLM calls are measured per stage (unless the llm already reports to this instrumentation, see PersonaHost).
+        if not (isinstance(llm, InstrumentedLLM) and llm.instrumentation is self.instrumentation):
+            llm = InstrumentedLLM(llm, self.instrumentation)
+        # All stages share the provider and its pooled connections.
+        self.llm = llm
+        self.llm_reflecting = llm
 
         # Configure the memory manager as a class attribute
         #self.manager = create_memory_store_manager(
@@ -68,61 +157,167 @@ class EmotionServices:
         
         #entrypoint(store=self.store)(self.add_new_messages_to_memory)
 
-        self.internal_profile = InternalProfile()
-        self.internal_profile.load_from_json(resource_file_path)
+        self.internal_profile = self._load_internal_profile(resource_file_path)
+
+        self.state_journal: Optional[StateJournal] = None
+        if state_dir:
+            self.state_journal = StateJournal(state_dir)
+            # Restore the agent's emotional state; user states are restored when their profiles are loaded.
+            self.internal_profile.set_baseline_emotions({**self.internal_profile.get_baseline_emotions(), **self.state_journal.get_agent_state()})
+
+        self.typing_model = typing_model or TypingSpeedModel.from_persona(self.internal_profile)
+
+        self.user_profiles = self._create_profile_cache(profile_store, max_cached_profiles, profile_flush_interval)
+        self._emotional_state_lock = threading.Lock()
+
+        self.context_builder = context_builder if context_builder is not None else ContextBuilder()
 
-        self.user_profiles: Dict[str, UserProfile] = {}
+        self.response = Response(llm=self.llm_reflecting, context_builder=self.context_builder)
 
-        self.response = Response(llm=self.llm_reflecting)
+        self.reflection = Reflection(llm=self.llm_reflecting, context_builder=self.context_builder)
+        self.reflection_policy = reflection_policy or ReflectionPolicy()
+        self._reflection_pending = set()
+        self._reflection_pending_lock = threading.Lock()
 
-        self.reflection = Reflection(llm=self.llm_reflecting)
+        self.appraisal_cache = AppraisalCache(max_entries=cache_size, ttl_seconds=cache_ttl, persist_path=cache_path)
+
+        self.fast_path_extractor = None
+        self.fast_path_min_confidence = fast_path_min_confidence
+        self.fast_path_max_length = fast_path_max_length
+        if fast_path:
+            # Imported on demand, so the lexicon is only loaded if the fast path is used.
+            from .lexicon_extractor import get_default_extractor
+            self.fast_path_extractor = get_default_extractor()
+
+        self.emotion_batcher: Optional[EmotionBatcher] = None
+        if batch_size > 1:
+            self.emotion_batcher = EmotionBatcher(self.llm_reflecting, max_batch_size=batch_size, max_wait_ms=batch_window_ms)
         
 
         # Load the emotion_sytem_prompt from the corresponding json file
-        self.emotion_system_prompt = ""  # Initialize the variable
-        try:
-            with open(system_prompt_path, "r") as file:
-                data = json.load(file)
-                self.emotion_system_prompt = data.get("emotion_system_prompt", "")  # Correct variable name
-        except (FileNotFoundError, json.JSONDecodeError):
-            print(f"Warning: Could not load emotion_system_prompt file '{system_prompt_path}'. Proceeding without emotion setup.")
+        self.emotion_system_prompt = self._load_system_prompt(system_prompt_path)
+        self.compile_prompt_extension()
 
         # Attributes for storing responses.
         self.new_response = None
+        self.response_channels = ResponseChannels(max_buffered_responses, response_ttl)
         self.processed_reflection = None
 
         # Set up the two queues:
-        # - reflection_queue holds user_id strings.
+        # - reflection_queue holds user_id strings, at most one pending refresh per user.
         # - send_response_queue holds lists of tuples, each tuple a (string, int).
-        self.reflection_queue = queue.Queue()         # For reflection_process: input is a user_id.
-        self.send_response_queue = queue.Queue()        # For send_response_process: input is a user_id and List[Tuple[str, int]]
-        self.input_queue = queue.Queue()  # New queue for input processing
+        # TimedQueue measures how long the items wait (see Instrumentation).
+        # For reflection_process: input is a user_id.
+        self.reflection_queue = TimedQueue(max_queued_reflections, on_wait=lambda seconds: self.instrumentation.record_queue_wait("reflection", seconds))
+        # For send_response_process: input is a user_id and List[Tuple[str, int]]
+        self.send_response_queue = TimedQueue(max_queued_responses, on_wait=lambda seconds: self.instrumentation.record_queue_wait("send_response", seconds))
+
+        # The per-user state outside of the profiles is released together with the profile.
+        self.user_profiles.add_eviction_listener(self.release_user)
+
+        self._start_workers()
+
+    def _load_internal_profile(self, resource_file_path: str) -> InternalProfile:
+        """
+        Loads the persona of the agent from the resource file.
+        PersonaHost overrides it to share the persona data of all personas that use the same file.
+        """
+        internal_profile = InternalProfile()
+        internal_profile.load_from_json(resource_file_path)
+        return internal_profile
+
+    def _create_profile_cache(self, profile_store: Optional[ProfileStore], max_cached_profiles: int, profile_flush_interval: float) -> ProfileCache:
+        """
+        Creates the cache of the user profiles (see ProfileCache).
+        """
+        return ProfileCache(profile_store, max_profiles=max_cached_profiles, flush_interval=profile_flush_interval)
+
+    def _load_system_prompt(self, system_prompt_path: str) -> str:
+        """
+        Loads the emotion system prompt from its JSON file (empty if the file is missing or invalid).
+        """
+        try:
+            with open(system_prompt_path, "r") as file:
+                data = json.load(file)
+                return data.get("emotion_system_prompt", "")
+        except (FileNotFoundError, json.JSONDecodeError):
+            print(f"Warning: Could not load emotion_system_prompt file '{system_prompt_path}'. Proceeding without emotion setup.")
+            return ""
 
-        # Start the two dedicated background threads.
+    def _start_workers(self):
+        """
+        Starts the dedicated background threads that drain the reflection and send_response queues
+        and the sharded worker pool that processes the inputs.
+        Subclasses with a different execution model (e.g. AsyncEmotionServices) override this method.
+        """
         threading.Thread(target=self.reflection_process, daemon=True).start()
         threading.Thread(target=self.send_response_process, daemon=True).start()
-        threading.Thread(target=self.process_input, daemon=True).start()  # New input processing thread
+        # Input processing: one queue per worker, the user_id decides which worker handles an input.
+        self.input_pool = ShardedWorkerPool(
+            self.process_input, self.num_workers, name="process_input",
+            on_wait=lambda seconds: self.instrumentation.record_queue_wait("input", seconds),
+            max_queue_size=self.max_queued_inputs
+        )
+        self.input_pool.start()
+        self.instrumentation.register_queue("input", lambda: sum(self.input_pool.queue_depths()), self.input_pool.oldest_age)
+        self.instrumentation.register_queue("reflection", self.reflection_queue.qsize, self.reflection_queue.oldest_age)
+        self.instrumentation.register_queue("send_response", self.send_response_queue.qsize, self.send_response_queue.oldest_age)
+
+    def compile_prompt_extension(self):
+        """
+        Renders the static fragments of the prompt extension (system prompt and persona) once.
+        Must be called again if the persona attributes of the internal profile are replaced.
+        """
+        internal_profile = self.internal_profile
+        self._prompt_head = f"""{self.emotion_system_prompt}. 
+            Your current name:"{internal_profile.my_name}";
+            Your current goal:"{internal_profile.my_goal}";
+            Your current role:"{internal_profile.my_role}";
+            Your current history:"{internal_profile.my_history}";
+            Your current emotions:\""""
+        self._prompt_persona = f"""\"; 
+            Your current personality traits:"{internal_profile.personality_traits}"; 
+            Your current motivational drivers:"{internal_profile.motivational_drivers}"; 
+            Your current ethical framework:"{internal_profile.ethical_framework}"; 
+            Your current learning behavior:"{internal_profile.learning_behavior}"; 
+            Your current relationship building:"{internal_profile.relationship_building}".
+            Your emotions about the user you are just talking to:\""""
+        self._prompt_agent_part: Optional[Tuple[int, str]] = None
+        self._prompt_extensions = weakref.WeakKeyDictionary()
+
+    def get_prompt_extension_version(self, user_id: str) -> Tuple[int, int]:
+        """
+        Returns the cache key of the user's prompt extension: it only changes if the prompt extension changes.
+        """
+        return self.internal_profile.version, self.get_user_profile(user_id).version
 
     def get_prompt_extension(self, user_id, prompt):
         """
         Returns a prompt extension that includes the current emotional state and profile of the user.
         This is required to ensure that the LLM can generate responses that are emotionally appropriate.
+
+        The static persona fragments are rendered once (see compile_prompt_extension); the agent's emotions
+        and the user's part are only re-rendered when the version of the internal profile or of the user
+        profile changed. As long as both are unchanged, the same string object is returned.
         """
+        user_profile = self.get_user_profile(user_id)
+        key = (self.internal_profile.version, user_profile.version)
+        cached = self._prompt_extensions.get(user_profile)
+        if cached is not None and cached[0] == key:
+            return cached[1]
 
-        return f"""{self.emotion_system_prompt}. 
-            Your current name:"{self.internal_profile.my_name}";
-            Your current goal:"{self.internal_profile.my_goal}";
-            Your current role:"{self.internal_profile.my_role}";
-            Your current history:"{self.internal_profile.my_history}";
-            Your current emotions:"{self.internal_profile.emotional_profile}"; 
-            Your current personality traits:"{self.internal_profile.personality_traits}"; 
-            Your current motivational drivers:"{self.internal_profile.motivational_drivers}"; 
-            Your current ethical framework:"{self.internal_profile.ethical_framework}"; 
-            Your current learning behavior:"{self.internal_profile.learning_behavior}"; 
-            Your current relationship building:"{self.internal_profile.relationship_building}".
-            Your emotions about the user you are just talking to:"{self.get_user_profile(user_id).get_emotional_profile()}".  
-            A general psychological guideline how to deal with this user:"{self.get_user_profile(user_id).get_guideline()}".
+        agent_part = self._prompt_agent_part
+        if agent_part is None or agent_part[0] != key[0]:
+            # The emotional profile contains the baseline emotions, which change with every appraisal. It is a
+            # copy-on-write snapshot, so it can be rendered without a lock while a worker publishes a new one.
+            agent_part = (key[0], f"{self.internal_profile.emotional_profile}")
+            self._prompt_agent_part = agent_part
+
+        extension = f"""{self._prompt_head}{agent_part[1]}{self._prompt_persona}{user_profile.get_emotional_profile()}".  
+            A general psychological guideline how to deal with this user:"{user_profile.get_guideline()}".
         """ 
+        self._prompt_extensions[user_profile] = (key, extension)
+        return extension
     
     def get_new_response(self):
         """
@@ -132,6 +327,32 @@ class EmotionServices:
         return_response = self.new_response
         self.new_response = None  # Clear the previous response.
         return return_response
+
+    def get_response(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Waits for the next response chunk for the given user and returns it.
+        Unlike get_new_response, no chunk is ever lost or overwritten by the responses of other users.
+        Returns None if no response arrived within the timeout (in seconds).
+        """
+        return self.response_channels.get(user_id, timeout)
+
+    def responses(self, user_id: str):
+        """
+        Asynchronous iterator over the response chunks of the given user:
+
+            async for text in emotion_service.responses(user_id):
+                ...
+        """
+        return self.response_channels.stream(user_id)
+
+    def subscribe(self, callback: Callable[[str, str], None], user_id: Optional[str] = None) -> Callable[[], None]:
+        """
+        Registers a callback(user_id, text) that is invoked as soon as a response chunk is delivered,
+        either for the given user or, if user_id is None, for all users.
+        Subscribed chunks are handed to the callbacks instead of being buffered for get_response.
+        Returns a function that removes the subscription again.
+        """
+        return self.response_channels.subscribe(callback, user_id)
     
     def get_self_reflection(self):
         """
@@ -153,16 +374,62 @@ class EmotionServices:
     def get_self_emotions(self):
         """
         Retrieve the current emotional state of the agent.
+        The returned profile is an immutable snapshot (see InternalProfile.set_baseline_emotions): it is read
+        without a lock, is never changed by the workers afterwards and must not be modified by the caller.
         """
         return self.internal_profile.emotional_profile
     
     def get_user_profile(self, user_id: str) -> UserProfile:
         """
-        Retrieve the user profile for a given user. If the profile does not exist, it is created.
+        Retrieve the user profile for a given user. If the profile is not in memory, it is loaded from the
+        profile store; if the user is unknown, the profile is created.
+        """
+        return self.user_profiles.get_or_create(user_id, self.create_user_profile)
+
+    @contextmanager
+    def using_profile(self, user_id: str) -> Iterator[UserProfile]:
+        """
+        Returns the user profile like get_user_profile and keeps it in memory until the block is left,
+        so the changes of a worker are not lost to an eviction in the meantime.
+        """
+        with self.user_profiles.pinned(user_id, self.create_user_profile) as user_profile:
+            yield user_profile
+
+    def release_user(self, user_id: str):
+        """
+        Releases the state of a user that is kept outside of the user profile. Called when the user's profile
+        was evicted from memory and written to the profile store (see ProfileCache.add_eviction_listener).
         """
-        if user_id not in self.user_profiles:
-            self.user_profiles[user_id] = UserProfile(user_id)
-        return self.user_profiles[user_id]
+        self.response_channels.drop(user_id)
+        self.reflection_policy.forget(user_id)
+        if self.state_journal is not None:
+            # From now on the profile store holds the user's latest emotional state.
+            self.state_journal.forget_user(user_id)
+
+    def create_user_profile(self, user_id: str, data: Optional[dict] = None) -> UserProfile:
+        """
+        Creates a user profile with the configured history retention, either empty or restored from
+        the serialized profile data of the profile store.
+        """
+        archive_path = None
+        if self.history_archive_dir:
+            os.makedirs(self.history_archive_dir, exist_ok=True)
+            archive_path = os.path.join(self.history_archive_dir, f"{quote(user_id, safe='')}.jsonl.gz")
+        if data is not None:
+            user_profile = UserProfile.from_dict(data, history_capacity=self.history_capacity, archive_path=archive_path)
+        else:
+            user_profile = UserProfile(user_id, history_capacity=self.history_capacity, archive_path=archive_path)
+
+        # The journal holds the most recent emotional state, it may be newer than the stored profile.
+        journaled_state = self.state_journal.get_user_state(user_id) if self.state_journal else None
+        if journaled_state:
+            merged = {**user_profile.rolling_averages, **journaled_state}
+            if merged != user_profile.rolling_averages:
+                user_profile.rolling_averages = merged
+                # The merged state is not in the store yet. A dirty profile is written back before it is released,
+                # so the journal only forgets the state once the store holds it (see release_user).
+                user_profile.dirty = True
+        return user_profile
     
     def parse_input(self, user_input: str) -> dict:
         """
@@ -180,9 +447,91 @@ class EmotionServices:
                 "love", "jealousy", "guilt", "pride", "shame", "compassion",
                 "sympathy", "trust".
                 
+        Repeated inputs are answered from the appraisal cache without an LLM call.
+        If the fast path is enabled, short inputs that the local lexicon scores confidently are not sent to the LLM either.
+        If batching is enabled, the input is extracted together with other concurrent inputs in one LLM request.
+        The single-input prompt is used as fallback if the batch output is malformed.
+
         Returns:
         A dictionary with the extracted keys and their corresponding scores.
         """
+        with self.instrumentation.stage("parse_input"):
+            model = self.get_model_identity()
+            cached = self.appraisal_cache.get(user_input, model)
+            if cached is not None:
+                return cached
+
+            if self.fast_path_extractor is not None and len(user_input) <= self.fast_path_max_length:
+                lexicon_result, confidence = self.fast_path_extractor.extract(user_input)
+                if confidence >= self.fast_path_min_confidence:
+                    return lexicon_result
+
+            if not self.llm.is_healthy():
+                return self._extract_locally(user_input, "emotion_extraction")
+
+            result = None
+            if self.emotion_batcher is not None:
+                result = self.emotion_batcher.submit(user_input)
+            if result is None:
+                try:
+                    result = self._parse_single_input(user_input)
+                except Exception as e:
+                    return self._extract_locally(user_input, "emotion_extraction", e)
+
+            self.appraisal_cache.put(user_input, model, result)
+            return result
+
+    def _extract_locally(self, user_input: str, stage: str, error: Optional[Exception] = None) -> dict:
+        """
+        Degraded emotion extraction with the local lexicon, used while the LLM is unavailable. The result is not cached.
+        """
+        self._degrade(stage, error)
+        from .lexicon_extractor import get_default_extractor
+        return get_default_extractor().extract(user_input)[0]
+
+    def _degrade(self, stage: str, error: Optional[Exception] = None):
+        """
+        Counts a stage that was skipped or replaced by its local fallback because the LLM failed or is unhealthy.
+        """
+        with self._stats_lock:
+            self.degraded_stats[stage] = self.degraded_stats.get(stage, 0) + 1
+        self.instrumentation.record_degraded(stage)
+        if error is not None:
+            print(f"[EmotionServices] LLM call failed in stage '{stage}', degrading: {error}")
+
+    def _shed(self, work: str):
+        """
+        Counts work that was refused or skipped because the pipeline is overloaded.
+        """
+        with self._stats_lock:
+            self.shed_stats[work] = self.shed_stats.get(work, 0) + 1
+        self.instrumentation.record_shed(work)
+
+    def is_overloaded(self, user_id: str) -> bool:
+        """
+        Returns True if the input queue that holds the user's next messages is filled beyond shed_ratio of
+        max_queued_inputs, i.e. if low-value work of the user's current message should be shed.
+        Must be called by the input worker that processes the message.
+        """
+        if self.max_queued_inputs <= 0:
+            return False
+        return self.input_pool.current_backlog() >= self.shed_ratio * self.max_queued_inputs
+
+    def get_model_identity(self) -> str:
+        """
+        Returns an identifier of the model used for the emotion extraction, e.g. to address cached results.
+        """
+        llm = self.llm_reflecting
+        # Wrappers like ResilientLLM do not change the results, the wrapped provider identifies the model.
+        while hasattr(llm, "inner"):
+            llm = llm.inner
+        model = getattr(llm, "model", None) or getattr(llm, "model_name", None) or type(llm).__name__
+        return f"{type(llm).__name__}:{model}"
+
+    def _parse_single_input(self, user_input: str) -> dict:
+        """
+        Extract the appraisal scores and emotion levels of a single user input with one LLM call.
+        """
         prompt = f"""
             You are an expert NLP analyzer designed to extract detailed emotional and appraisal scores from a user’s input. 
             Please analyze the following user prompt and provide a JSON object that includes the following keys with scores between 0 and 1:
@@ -203,17 +552,11 @@ class EmotionServices:
             {user_input}
             """
         # Send the prompt to the LLM and capture its response.
-        response = self.llm_reflecting.invoke(prompt)
+        response = self.llm_reflecting.send_prompt(prompt)
         #print(f"#################################LLM response: {response}")
 
-        # Attempt to convert the response to a Python dictionary.
-        try:
-            result = json.loads(response.content)
-        except Exception as e:
-            print("Error parsing JSON:", e)
-            result = {}
-
-        return result
+        # Extract the JSON object and clamp it to the schema; a StructuredOutputError makes parse_input fall back.
+        return coerce_scores(extract_json(response, expect=dict))
 
     
     def evaluate_appraisal(self, input_scores: dict) -> dict:
@@ -296,6 +639,9 @@ class EmotionServices:
         - self.internal_profile is an instance of InternalProfile.
         - self.internal_profile.emotional_profile["baseline_emotions"] is a dictionary with keys such as:
             "happiness", "sadness", "anger", "fear", "surprise", "love", "pride", etc.
+        - Calls are serialized by the caller (apply_appraisal holds the emotional state lock). The baseline is
+            not modified in place: the new state is computed on a copy and published with
+            InternalProfile.set_baseline_emotions, so lock-free readers never see a half-updated state.
         - Personality traits (especially "neuroticism") are defined within
             self.internal_profile.personality_traits["big_five"] with values between 0 and 1.
         
@@ -308,8 +654,8 @@ class EmotionServices:
         2. Novelty is also considered to modulate the 'surprise' emotion.
         3. The updated values are clamped between 0 and 1 to ensure valid emotion intensities.
         """
-        # Retrieve baseline emotions from the internal profile.
-        baseline = self.internal_profile.emotional_profile.get("baseline_emotions", {})
+        # Retrieve a copy of the baseline emotions from the internal profile.
+        baseline = dict(self.internal_profile.get_baseline_emotions())
 
         # For demonstration purposes, we assume baseline emotions are already initialized.
         # If a specific emotion is missing, default to a neutral value of 0.5.
@@ -353,15 +699,15 @@ class EmotionServices:
         sentiment_bias = (sentiment_score - 0.5) * 0.05
         baseline["happiness"] = min(1.0, max(0.0, baseline["happiness"] + sentiment_bias))
         
-        # Save the updated baseline emotions back into the internal profile.
-        self.internal_profile.emotional_profile["baseline_emotions"] = baseline
+        # Publish the updated baseline emotions as the new snapshot of the internal profile.
+        self.internal_profile.set_baseline_emotions(baseline)
         
         # Optionally, update user-specific feelings (if such a mechanism exists)
         # For example, you might store an aggregated "feeling towards user" that considers both the updated mood
         # and historical interactions.
         # self.user_feeling[user_id] = baseline["happiness"]  # This is a simplified example.
 
-    def add_input(self, user_id: str, prompt: str, answer: Optional[str] = None, writing_style: bool = False, text_split: bool = False):
+    def add_input(self, user_id: str, prompt: str, answer: Optional[str] = None, writing_style: bool = False, text_split: bool = False) -> bool:
         """
         Add a new input to the emotion service queue for processing. The input is added as a tuple containing: 
         - user_id: A unique identifier for the user.
@@ -369,57 +715,292 @@ class EmotionServices:
         - answer: The AI's response or answer (if available).
         - writing_style: A boolean indicating whether to adapt the writing style of the response.
         - text_split: A boolean indicating whether to split the response into multiple parts for a more human-like interaction.
+        Returns True if the input was queued, or False if it was refused because the input queue is full.
+
+        With max_queued_inputs > 0, the overflow_policy applies when the queue of the user's worker is full: "block"
+        waits for a free slot (at most overflow_timeout seconds, then the input is refused), "reject" raises an
+        OverloadError and "busy" refuses the input right away. Before inputs are refused, low-value work is shed:
+        once the queue is filled beyond shed_ratio, messages skip the writing style adaptation and their guideline
+        refreshes (see is_overloaded). A refresh that does not fit into the reflection queue is dropped as well; the
+        reflection policy requests it again with the user's next message. Responses are never dropped: a full
+        send_response queue makes the workers wait. Shed work is counted in shed_stats.
         """
-        self.input_queue.put((user_id, prompt, answer, writing_style, text_split))
+        return self._enqueue_input(user_id, user_id, (user_id, prompt, answer, writing_style, text_split))
 
-    def process_input(self):
+    def _enqueue_input(self, user_id: str, key: str, item) -> bool:
         """
-        Process the input queue by extracting emotional scores from the user input, updating the internal emotional system,
-        and adapting the emotional response to the historic writing style if required.
+        Submits an input to the input pool according to the overflow_policy.
         """
-        while True:
-            user_id, prompt, answer, writing_style, text_split = self.input_queue.get()
-            
-            # Retrieve the user's profile.
-            user_profile = self.get_user_profile(user_id)
-
-            # Initiate the reflection process.
-            self.reflection_queue.put((user_id))
-
-            # Extract emotional scores from the user input.
-            scores = self.parse_input(prompt)
-            self.processed_reflection = "-extract emotional scores from user input and update internal emotional system"
-            emotion_levels = scores.get("emotion_levels", {})
-            new_emotions = [{"emotion": key, "score": value} for key, value in emotion_levels.items()]
-            
-            # Add the user's message to the conversation history.
-            user_profile.add_message("User", prompt, new_emotions)
-            # Updates the user's emotional profile of the ai agent with the new emotions extracted from the last user input.
-            user_profile.update_emotions(new_emotions)
-
-            # Optionally adapt the writing style of the response.
-            if writing_style:
-                writing_style_instance = WritingStyle(self.llm_reflecting)
-                adapted_answer = writing_style_instance.adapt_writing_style(user_id, user_profile, new_emotions, answer)
-                self.processed_reflection = "-adapt emotional response to the historic writing style"
+        try:
+            if self.overflow_policy == "block":
+                self.input_pool.submit(key, item, timeout=self.overflow_timeout)
             else:
-                adapted_answer = answer
+                self.input_pool.submit(key, item, block=False)
+            return True
+        except queue.Full:
+            self._shed("input")
+            if self.overflow_policy == "reject":
+                raise OverloadError(f"The input queue is full, the input of user {user_id} was rejected.")
+            return False
 
-            # Optionally split the response into multiple parts for a more human-like interaction.
-            if text_split:
-                response_split = Response_Split(self.llm_reflecting)
-                response_list = response_split.return_response_split(user_id, prompt, user_profile, new_emotions, adapted_answer)
-                self.processed_reflection = "-split up response into human-like chat interaction"
+    def get_queue_depths(self) -> Dict[str, object]:
+        """
+        Returns the current number of queued items of the pipeline:
+          - "input": a list with the queue depth of every input worker (shard),
+          - "reflection": the depth of the reflection queue,
+          - "send_response": the depth of the send_response queue.
+        Use it to size num_workers against the concurrency limits of the LLM backend.
+        """
+        return {
+            "input": self.input_pool.queue_depths(),
+            "reflection": self.reflection_queue.qsize(),
+            "send_response": self.send_response_queue.qsize(),
+        }
+
+    def process_input(self, item: Tuple[str, str, Optional[str], bool, bool]):
+        """
+        Process one input of the input queue by extracting emotional scores from the user input, updating the internal emotional system,
+        and adapting the emotional response to the historic writing style if required.
+        Called by the worker threads of the input pool.
+        """
+        user_id, prompt, answer, writing_style, text_split = item
+
+        with self.using_profile(user_id):
+            if self.streaming:
+                # Every chunk is added to the send_response_queue as soon as it is complete.
+                scores, _ = self.process_message(
+                    user_id, prompt, answer, writing_style, text_split,
+                    on_chunks=lambda chunks: self.send_response_queue.put((user_id, chunks))
+                )
             else:
-                response_list = [(adapted_answer, 0)]
+                scores, response_list = self.process_message(user_id, prompt, answer, writing_style, text_split)
 
-            # Add the response to the send_response_queue for further processing.
-            self.send_response_queue.put((user_id, response_list))
+                # Add the response to the send_response_queue for further processing.
+                self.send_response_queue.put((user_id, response_list))
 
             #update the emotional state of the agent based on the user input.
             #TODO: HERE WE SHOULD TRIGGER AN INTERNAL REFLECTION MECHANISM TO UPDATE THE EMOTIONAL STATE OF THE AGENT
+            self.apply_appraisal(scores, user_id)
+
+    def process_message(
+        self,
+        user_id: str,
+        prompt: str,
+        answer: Optional[str],
+        writing_style: bool,
+        text_split: bool,
+        on_chunks: Optional[Callable[[List[Tuple[str, int]]], None]] = None
+    ) -> Tuple[dict, List[Tuple[str, int]]]:
+        """
+        Runs the per-message part of the pipeline for a single input: extracts the emotional scores from the user input,
+        updates the user's profile and conversation history and optionally adapts and splits the answer.
+        Returns the extracted scores and the list of (text, delay) tuples that should be sent to the user.
+        If on_chunks is given, the answer is streamed (see stream_response) and every complete chunk is
+        passed to on_chunks right away.
+        """
+        # Retrieve the user's profile.
+        user_profile = self.get_user_profile(user_id)
+
+        # In the fused mode, emotions, adapted answer and split are produced by one LLM call.
+        fused = None
+        # Under overload, the low-value LLM work is shed first, so the user-visible responses keep flowing.
+        overloaded = self.is_overloaded(user_id)
+        if writing_style and overloaded:
+            writing_style = False
+            self._shed("writing_style")
+        # A local split needs no LLM call, so it alone is no reason for the fused call.
+        llm_split = text_split and self.split_mode == "llm"
+        if self.pipeline_mode == "fused" and on_chunks is None and (writing_style or llm_split) and self.llm.is_healthy():
+            fused = self.process_fused(user_id, prompt, user_profile, answer, writing_style, text_split)
+
+        # Extract emotional scores from the user input.
+        scores = fused["scores"] if fused is not None else self.parse_input(prompt)
+        self.processed_reflection = "-extract emotional scores from user input and update internal emotional system"
+        emotion_levels = scores.get("emotion_levels", {})
+        new_emotions = [{"emotion": key, "score": value} for key, value in emotion_levels.items()]
+
+        # Initiate the reflection process if the policy considers a guideline refresh worth it.
+        # This has to happen before the new emotions are merged into the user's rolling averages.
+        refresh, _ = self.reflection_policy.should_reflect(user_profile, emotion_levels)
+        if refresh:
+            if overloaded:
+                self._shed("reflection")
+                self.reflection_policy.retry(user_id)
+            elif self.llm.is_healthy():
+                self.request_reflection(user_id)
+            else:
+                self._degrade("reflection")
+                self.reflection_policy.retry(user_id)
+
+        # Add the user's message to the conversation history.
+        user_profile.add_message("User", prompt, new_emotions)
+        # Updates the user's emotional profile of the ai agent with the new emotions extracted from the last user input.
+        user_profile.update_emotions(new_emotions)
+        if self.state_journal is not None:
+            averages = user_profile.rolling_averages
+            self.state_journal.record_user(user_id, {emotion: averages[emotion] for emotion in emotion_levels if emotion in averages})
+
+        if fused is not None:
+            return scores, fused["parts"]
+
+        if on_chunks is not None:
+            response_list = []
+            with self.instrumentation.stage("stream_response", user_id):
+                for chunk in self.stream_response(user_id, user_profile, new_emotions, answer, writing_style, text_split):
+                    response_list.append(chunk)
+                    on_chunks([chunk])
+            return scores, response_list
+
+        # Optionally adapt the writing style of the response.
+        adapted_answer = answer
+        if writing_style and not self.llm.is_healthy():
+            self._degrade("writing_style")
+        elif writing_style:
+            writing_style_instance = WritingStyle(self.llm_reflecting, self.context_builder)
+            try:
+                with self.instrumentation.stage("writing_style", user_id):
+                    adapted_answer = writing_style_instance.adapt_writing_style(user_id, user_profile, new_emotions, answer)
+                self.processed_reflection = "-adapt emotional response to the historic writing style"
+            except Exception as e:
+                self._degrade("writing_style", e)
+
+        # Optionally split the response into multiple parts for a more human-like interaction.
+        if text_split and (self.split_mode == "local" or not self.llm.is_healthy()):
+            with self.instrumentation.stage("split", user_id):
+                response_list = LocalSplitter(self.typing_model).split_text(adapted_answer or "")
+            self.processed_reflection = "-split up response into human-like chat interaction"
+        elif text_split:
+            response_split = Response_Split(self.llm_reflecting, LocalSplitter(self.typing_model))
+            with self.instrumentation.stage("split", user_id):
+                response_list = response_split.return_response_split(user_id, prompt, user_profile, new_emotions, adapted_answer)
+            self.processed_reflection = "-split up response into human-like chat interaction"
+        else:
+            response_list = [(adapted_answer, 0)]
+
+        return scores, response_list
+
+    def process_fused(
+        self,
+        user_id: str,
+        prompt: str,
+        user_profile: UserProfile,
+        answer: Optional[str],
+        writing_style: bool,
+        text_split: bool
+    ) -> Optional[dict]:
+        """
+        Runs the fused single-call pipeline for a message. Returns the result of Response.fused_response,
+        or None if the message has to be processed with separate calls.
+        """
+        agent_state = self.internal_profile.get_baseline_emotions()
+        llm_split = text_split and self.split_mode == "llm"
+        with self.instrumentation.stage("fused", user_id):
+            fused = self.response.fused_response(user_id, prompt, user_profile, agent_state, answer, writing_style, llm_split)
+        with self._stats_lock:
+            self.fused_stats["fallback" if fused is None else "fused"] += 1
+        if fused is None:
+            print(f"[EmotionServices] Invalid fused output for user {user_id}, falling back to separate calls.")
+            return None
+        if text_split and not llm_split:
+            fused["parts"] = LocalSplitter(self.typing_model).split_text(fused["emotional_response"])
+        # The extracted emotions are as good as those of parse_input, so repeated inputs can use them.
+        self.appraisal_cache.put(prompt, self.get_model_identity(), fused["scores"])
+        self.processed_reflection = "-extract emotions, adapt and split the response in one call"
+        return fused
+
+    def stream_response(
+        self,
+        user_id: str,
+        user_profile: UserProfile,
+        new_emotions: List[Dict[str, float]],
+        answer: Optional[str],
+        writing_style: bool,
+        text_split: bool
+    ):
+        """
+        Yields the (text, delay) chunks of the response as soon as they are complete: the adapted answer is
+        streamed from the LLM and, with text_split, split at sentence boundaries while it is generated.
+        """
+        if writing_style and self.llm.is_healthy():
+            writing_style_instance = WritingStyle(self.llm_reflecting, self.context_builder)
+            pieces = self._stream_with_fallback(
+                writing_style_instance.stream_writing_style(user_id, user_profile, new_emotions, answer), answer
+            )
+            self.processed_reflection = "-adapt emotional response to the historic writing style"
+        else:
+            if writing_style:
+                self._degrade("writing_style")
+            pieces = [answer or ""]
+
+        if text_split and self.split_mode == "llm" and isinstance(pieces, list) and self.llm.is_healthy():
+            # The answer is complete, so the LLM split can be streamed and its parts sent as they are parsed.
+            response_split = Response_Split(self.llm_reflecting, LocalSplitter(self.typing_model))
+            yield from response_split.stream_response_split(pieces[0])
+            self.processed_reflection = "-split up response into human-like chat interaction"
+        elif text_split:
+            yield from LocalSplitter(self.typing_model).split(pieces)
+            self.processed_reflection = "-split up response into human-like chat interaction"
+        else:
+            yield ("".join(pieces), 0)
+
+    def _stream_with_fallback(self, pieces, answer: Optional[str]):
+        """
+        Passes the streamed pieces through. If the stream fails before the first piece, the original answer is used;
+        if it fails later, the response ends with the pieces streamed so far.
+        """
+        started = False
+        try:
+            for piece in pieces:
+                started = True
+                yield piece
+        except Exception as e:
+            self._degrade("writing_style", e)
+            if not started:
+                yield answer or ""
+
+    def apply_appraisal(self, scores: dict, user_id: str):
+        """
+        Evaluates the appraisal of the extracted scores and updates the internal emotional state of the agent.
+        """
+        with self.instrumentation.stage("appraisal", user_id):
             appraisal = self.evaluate_appraisal(scores)
-            self.update_emotional_state(appraisal, scores, user_id)
+            # The agent's emotional state is shared by all workers. Only the writers are serialized; readers use
+            # the published snapshot without a lock.
+            with self._emotional_state_lock:
+                previous = self.internal_profile.get_baseline_emotions()
+                self.update_emotional_state(appraisal, scores, user_id)
+                if self.state_journal is not None:
+                    baseline = self.internal_profile.get_baseline_emotions()
+                    self.state_journal.record_agent({emotion: value for emotion, value in baseline.items() if previous.get(emotion) != value})
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the metrics of the pipeline stages, LLM calls and queues (see Instrumentation.snapshot).
+        """
+        return self.instrumentation.snapshot()
+
+    def get_context_stats(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns the token counts of the prompts per stage (see ContextBuilder.get_stats).
+        """
+        return self.context_builder.get_stats()
+
+    def request_reflection(self, user_id: str):
+        """
+        Queues a guideline refresh for the user. Requests for a user whose refresh is still queued are merged into it.
+        """
+        with self._reflection_pending_lock:
+            if user_id in self._reflection_pending:
+                return
+            self._reflection_pending.add(user_id)
+        try:
+            self.reflection_queue.put(user_id, block=False)
+        except queue.Full:
+            # A refresh is not worth waiting for; the reflection policy requests it again with the next message.
+            with self._reflection_pending_lock:
+                self._reflection_pending.discard(user_id)
+            self._shed("reflection")
+            self.reflection_policy.retry(user_id)
 
     def reflection_process(self):
         """
@@ -432,60 +1013,87 @@ class EmotionServices:
             # Wait until a reflection tuple is available.
             #user_id, response, delay = self.reflection_queue.get()  # blocking call; expects a tuple (user_id, text, delay)
             user_id = self.reflection_queue.get()
-            # Wait for the specified delay (convert milliseconds to seconds).
-            #time.sleep(delay / 1000.0)
-            # Set the new response.
-            #self.new_response = response
-            # Retrieve the user's profile and update conversation history.
-            user_profile = self.get_user_profile(user_id)
-            guideline = self.reflection.generate_emotional_guideline(user_profile,5)
+            self.run_reflection(user_id)
+
+    def run_reflection(self, user_id: str):
+        """
+        Refreshes the emotional guideline of a user whose refresh was taken from the reflection queue.
+        """
+        # Messages arriving from now on are not covered by this refresh, so they may request a new one.
+        with self._reflection_pending_lock:
+            self._reflection_pending.discard(user_id)
+        # Wait for the specified delay (convert milliseconds to seconds).
+        #time.sleep(delay / 1000.0)
+        # Set the new response.
+        #self.new_response = response
+        # Retrieve the user's profile and update conversation history.
+        if not self.llm.is_healthy():
+            # The refresh is requested again with the user's next message, once the LLM recovered.
+            self._degrade("reflection")
+            self.reflection_policy.retry(user_id)
+            return
+        try:
+            with self.instrumentation.stage("reflection", user_id), self.using_profile(user_id) as user_profile:
+                guideline = self.reflection.generate_emotional_guideline(user_profile,5)
+        except Exception as e:
+            self._degrade("reflection", e)
 
-            #print(f"[reflection_process] Sent reflection to user {user_id}: {guideline}")
+        #print(f"[reflection_process] Sent reflection to user {user_id}: {guideline}")
 
     def send_response_process(self):
         """
-        This thread waits for a tuple (user_id, list_of_tuples) from the send_response_queue.
+        This thread waits for tuples (user_id, list_of_tuples) from the send_response_queue.
         Each tuple consists of:
           - A user_id (string)
           - A list of (string, int) tuples
-        The function processes the list as follows:
-          - It takes the first tuple from the list,
-          - Sets self.new_response to the tuple’s string,
-          - Sleeps for the number of seconds specified by the integer,
-          - Removes that tuple,
-          - And continues until the list is empty.
+        Instead of sleeping between the chunks, every chunk is scheduled at its due time:
+          - The first chunk of a list is due immediately, or right after the previous chunks of the same user,
+          - Every following chunk is due after the delay (in milliseconds) specified by the integer of its predecessor.
+        Due chunks are delivered to the user's response channel. Chunks of different users are scheduled
+        independently, so the delays of one user never hold back the responses of another user.
         """
-        while True:
-            # Wait until a tuple (user_id, list_of_tuples) is available.
-            user_id, tuples_list = self.send_response_queue.get()  # blocking call
-            backup_responses = tuples_list
-            #print(f"[send_response_process] Received tuples list for user {user_id}: {tuples_list}")
-            
-            # Process each tuple one-by-one.
-            while tuples_list:
-                text, delay = tuples_list.pop(0)  # Remove the first tuple.
-                self.new_response = text
-                
-                user_profile = self.get_user_profile(user_id)
-                # Update the user's conversation history.
-                user_profile.add_message("You", self.new_response)
-
-                #print(f"[send_response_process] Processing tuple for user {user_id}: text='{text}', delay={delay}")
-                time.sleep(delay / 200)
-
-            #print("START REFLECTION PROCESS.........")
-            #Initiate the reflection process
-            
-            #print(self.emotion_setup.get("emotional_parameters"))
-            #json_emotional_parameters = reflection.self_reflection(self.emotion_setup.get("emotional_parameters"), user_profile, backup_responses)
-            #self.set_self_emotions(json_emotional_parameters)
-            #rint(f"NEW SELF EMOTIONS:{json_emotional_parameters}")
+        self.schedule_chunks(self.send_response_queue, self.deliver_response)
 
-            #self.processed_reflection = "-update internal emotional system"
+    @staticmethod
+    def schedule_chunks(source: queue.Queue, deliver: Callable[[object, str], None]):
+        """
+        Runs the chunk scheduler of send_response_process forever: takes (key, list_of_tuples) items from source
+        and calls deliver(key, text) for every chunk at its due time. The chunks of one key are delivered in order.
+        """
+        scheduled = []   # heap of (due_time, sequence, key, text)
+        next_free: Dict[object, float] = {}
+        sequence = 0
+        while True:
+            timeout = max(0.0, scheduled[0][0] - time.monotonic()) if scheduled else None
+            try:
+                # Wait until a tuple (key, list_of_tuples) is available or the next chunk is due.
+                key, tuples_list = source.get(timeout=timeout)
+                due_time = max(time.monotonic(), next_free.get(key, 0.0))
+                for text, delay in tuples_list:
+                    heapq.heappush(scheduled, (due_time, sequence, key, text))
+                    sequence += 1
+                    due_time += delay / 1000
+                next_free[key] = due_time
+            except queue.Empty:
+                pass
 
-            #self.emotion_setup["emotional_parameters"] = json_emotional_parameters
-            #print("SELF EMOTIONS UPDATED")
+            now = time.monotonic()
+            while scheduled and scheduled[0][0] <= now:
+                _, _, key, text = heapq.heappop(scheduled)
+                try:
+                    deliver(key, text)
+                except Exception as e:
+                    print(f"[send_response_process] Error delivering a response chunk: {e}")
+                if next_free.get(key, 0.0) <= now:
+                    next_free.pop(key, None)
 
-            #reflection_response = self.reflection.set_reminder(user_id, user_profile, tuples_list)
-            #self.reflection_queue.put((user_id, *reflection_response))
-            #self.processed_reflection = "-set reminder for future user interaction"
+    def deliver_response(self, user_id: str, text: str):
+        """
+        Delivers a single response chunk to the user: publishes it on the user's response channel
+        and adds it to the user's conversation history.
+        """
+        with self.instrumentation.stage("send", user_id), self.using_profile(user_id) as user_profile:
+            self.new_response = text
+            # Update the user's conversation history.
+            user_profile.add_message("You", text)
+            self.response_channels.publish(user_id, text)
@@ -0,0 +1,443 @@
+import bisect
+import contextvars
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, Union
+
+from .base_llm import BaseLLM
+
+# Upper bounds (seconds) of the latency histograms.
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# The stage that is currently running in this thread or task; LLM calls and parse failures are attributed to it.
+_current_stage: contextvars.ContextVar[Optional[Tuple["Instrumentation", str]]] = contextvars.ContextVar("emotionsinai_stage", default=None)
+
+
+class _Histogram:
+    """
+    Cumulative latency histogram in the Prometheus format (not thread-safe, guarded by the Instrumentation lock).
+    """
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimates the q-quantile as the upper bound of the bucket it falls into.
+        """
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank:
+                return self.buckets[index] if index < len(self.buckets) else float("inf")
+        return float("inf")
+
+
+class Instrumentation:
+    """
+    Structured metrics of the pipeline of EmotionServices:
+
+      - per stage (parse_input, appraisal, writing_style, split, fused, reflection, send): wall time histogram and errors,
+      - per stage: LLM latency histogram, prompt and completion sizes (characters) and failed LLM calls (see InstrumentedLLM),
+      - per stage: LLM outputs that could not be parsed (see structured_output.extract_json),
+      - per stage: degraded executions (skipped or replaced by the local fallback),
+      - per kind of work (input, reflection, writing_style): work shed under overload,
+      - per queue (input, reflection, send_response): depth, age of the oldest item and wait time histogram.
+
+    Every record is also passed as event dictionary to the subscribed callbacks, e.g.
+        {"type": "stage", "stage": "writing_style", "user_id": "u1", "duration_ms": 812.4, "error": None}
+    to_prometheus() renders all metrics in the Prometheus text format, serve_prometheus() exposes them over HTTP.
+
+    Recording costs a clock read, a lock and a bisect, so the instrumentation can stay enabled in production;
+    enabled=False turns every record into a no-op.
+    """
+
+    def __init__(self, enabled: bool = True, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, prefix: str = "emotionsinai"):
+        self.enabled = enabled
+        self.buckets = tuple(sorted(buckets))
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._stage_seconds: Dict[str, _Histogram] = {}
+        self._stage_errors: Dict[str, int] = {}
+        self._llm_seconds: Dict[str, _Histogram] = {}
+        self._llm_errors: Dict[str, int] = {}
+        self._prompt_chars: Dict[str, int] = {}
+        self._completion_chars: Dict[str, int] = {}
+        self._parse_failures: Dict[str, int] = {}
+        self._degraded: Dict[str, int] = {}
+        self._shed: Dict[str, int] = {}
+        self._queue_wait: Dict[str, _Histogram] = {}
+        self._queues: Dict[str, Tuple[Callable[[], int], Optional[Callable[[], float]]]] = {}
+        self._callbacks: List[Callable[[Dict[str, Any]], None]] = []
+
+    def subscribe(self, callback: Callable[[Dict[str, Any]], None]) -> Callable[[], None]:
+        """
+        Registers a callback that receives every recorded event. Returns a function that unsubscribes the callback.
+        Callbacks run synchronously in the pipeline threads, so they should return quickly.
+        """
+        # The list is replaced instead of changed, so _emit can iterate it without the lock.
+        with self._lock:
+            self._callbacks = self._callbacks + [callback]
+
+        def unsubscribe():
+            with self._lock:
+                self._callbacks = [registered for registered in self._callbacks if registered is not callback]
+        return unsubscribe
+
+    @contextmanager
+    def stage(self, stage: str, user_id: Optional[str] = None):
+        """
+        Measures the wall time of the enclosed block as the given stage. LLM calls and parse failures inside
+        the block are attributed to this stage. An exception is recorded as error of the stage and re-raised.
+        """
+        if not self.enabled:
+            yield
+            return
+        token = _current_stage.set((self, stage))
+        started = time.perf_counter()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            _current_stage.reset(token)
+            self.record_stage(stage, time.perf_counter() - started, user_id, error)
+
+    def wrap(self, stage: str, function: Callable, user_id: Optional[str] = None) -> Callable:
+        """
+        Returns a function that runs function inside stage, e.g. to instrument a call in an executor thread.
+        """
+        def wrapped(*args, **kwargs):
+            with self.stage(stage, user_id):
+                return function(*args, **kwargs)
+        return wrapped
+
+    def record_stage(self, stage: str, seconds: float, user_id: Optional[str] = None, error: Optional[BaseException] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(self._stage_seconds, stage).observe(seconds)
+            if error is not None:
+                self._stage_errors[stage] = self._stage_errors.get(stage, 0) + 1
+        self._emit({"type": "stage", "stage": stage, "user_id": user_id, "duration_ms": seconds * 1000, "error": repr(error) if error else None})
+
+    def record_llm(self, stage: str, seconds: float, prompt_chars: int, completion_chars: int, error: Optional[BaseException] = None):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(self._llm_seconds, stage).observe(seconds)
+            self._prompt_chars[stage] = self._prompt_chars.get(stage, 0) + prompt_chars
+            self._completion_chars[stage] = self._completion_chars.get(stage, 0) + completion_chars
+            if error is not None:
+                self._llm_errors[stage] = self._llm_errors.get(stage, 0) + 1
+        self._emit({
+            "type": "llm", "stage": stage, "duration_ms": seconds * 1000, "prompt_chars": prompt_chars,
+            "completion_chars": completion_chars, "error": repr(error) if error else None
+        })
+
+    def record_parse_failure(self, stage: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._parse_failures[stage] = self._parse_failures.get(stage, 0) + 1
+        self._emit({"type": "parse_failure", "stage": stage})
+
+    def record_degraded(self, stage: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._degraded[stage] = self._degraded.get(stage, 0) + 1
+        self._emit({"type": "degraded", "stage": stage})
+
+    def record_shed(self, work: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._shed[work] = self._shed.get(work, 0) + 1
+        self._emit({"type": "shed", "work": work})
+
+    def record_queue_wait(self, queue_name: str, seconds: float):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._histogram(self._queue_wait, queue_name).observe(seconds)
+
+    def register_queue(self, queue_name: str, depth: Callable[[], int], oldest_age: Optional[Callable[[], float]] = None):
+        """
+        Registers the depth (and optionally the age of the oldest item in seconds) of a queue; both are read on export.
+        """
+        with self._lock:
+            self._queues[queue_name] = (depth, oldest_age)
+
+    def current_stage(self) -> str:
+        """
+        Returns the stage running in the calling thread or task ("other" outside of any stage).
+        """
+        current = _current_stage.get()
+        return current[1] if current is not None and current[0] is self else "other"
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Returns the current metrics as dictionary (latencies in milliseconds, p50/p99 estimated from the histograms).
+        """
+        def summary(histogram: _Histogram) -> Dict[str, float]:
+            return {
+                "count": histogram.count,
+                "mean_ms": histogram.sum / histogram.count * 1000 if histogram.count else 0.0,
+                "p50_ms": histogram.quantile(0.5) * 1000,
+                "p99_ms": histogram.quantile(0.99) * 1000,
+            }
+
+        queues = {name: self._read_queue(depth, oldest_age) for name, (depth, oldest_age) in list(self._queues.items())}
+        with self._lock:
+            return {
+                "stages": {
+                    stage: dict(summary(histogram), errors=self._stage_errors.get(stage, 0))
+                    for stage, histogram in self._stage_seconds.items()
+                },
+                "llm": {
+                    stage: dict(
+                        summary(histogram), errors=self._llm_errors.get(stage, 0),
+                        prompt_chars=self._prompt_chars.get(stage, 0), completion_chars=self._completion_chars.get(stage, 0)
+                    )
+                    for stage, histogram in self._llm_seconds.items()
+                },
+                "parse_failures": dict(self._parse_failures),
+                "degraded": dict(self._degraded),
+                "shed": dict(self._shed),
+                "queues": {
+                    name: dict(queues.get(name, {}), wait=summary(self._queue_wait[name]) if name in self._queue_wait else None)
+                    for name in sorted(set(queues) | set(self._queue_wait))
+                },
+            }
+
+    def to_prometheus(self) -> str:
+        """
+        Renders all metrics in the Prometheus text exposition format.
+        """
+        p = self.prefix
+        lines: List[str] = []
+        queues = {name: self._read_queue(depth, oldest_age) for name, (depth, oldest_age) in list(self._queues.items())}
+        with self._lock:
+            self._export_histograms(lines, f"{p}_stage_duration_seconds", "Wall time of the pipeline stages.", "stage", self._stage_seconds)
+            self._export_counters(lines, f"{p}_stage_errors_total", "Pipeline stages that raised an exception.", "stage", self._stage_errors)
+            self._export_histograms(lines, f"{p}_llm_request_duration_seconds", "Latency of the LLM calls per stage.", "stage", self._llm_seconds)
+            self._export_counters(lines, f"{p}_llm_errors_total", "Failed LLM calls per stage.", "stage", self._llm_errors)
+            self._export_counters(lines, f"{p}_llm_prompt_chars_total", "Characters sent to the LLM per stage.", "stage", self._prompt_chars)
+            self._export_counters(lines, f"{p}_llm_completion_chars_total", "Characters returned by the LLM per stage.", "stage", self._completion_chars)
+            self._export_counters(lines, f"{p}_parse_failures_total", "LLM outputs that could not be parsed per stage.", "stage", self._parse_failures)
+            self._export_counters(lines, f"{p}_degraded_total", "Stages skipped or replaced by a local fallback.", "stage", self._degraded)
+            self._export_counters(lines, f"{p}_shed_total", "Work rejected or skipped under overload.", "work", self._shed)
+            self._export_histograms(lines, f"{p}_queue_wait_seconds", "Time the items waited in the queues.", "queue", self._queue_wait)
+        self._export_gauges(lines, f"{p}_queue_depth", "Number of queued items.", {name: values["depth"] for name, values in queues.items()})
+        self._export_gauges(
+            lines, f"{p}_queue_oldest_age_seconds", "Age of the oldest queued item.",
+            {name: values["oldest_age_seconds"] for name, values in queues.items() if "oldest_age_seconds" in values}
+        )
+        return "\n".join(lines) + "\n"
+
+    def serve_prometheus(self, port: int = 9464, host: str = "0.0.0.0"):
+        """
+        Serves to_prometheus() at http://host:port/metrics from a daemon thread. Returns the server (call shutdown() to stop it).
+        """
+        from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+        instrumentation = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = instrumentation.to_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+        return server
+
+    def _histogram(self, histograms: Dict[str, _Histogram], name: str) -> _Histogram:
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = _Histogram(self.buckets)
+        return histogram
+
+    def _emit(self, event: Dict[str, Any]):
+        for callback in self._callbacks:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"[Instrumentation] Error in callback: {e}")
+
+    @staticmethod
+    def _read_queue(depth: Callable[[], int], oldest_age: Optional[Callable[[], float]]) -> Dict[str, float]:
+        values = {"depth": depth()}
+        if oldest_age is not None:
+            values["oldest_age_seconds"] = oldest_age()
+        return values
+
+    @staticmethod
+    def _export_histograms(lines: List[str], name: str, help_text: str, label: str, histograms: Dict[str, _Histogram]):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+        for value, histogram in sorted(histograms.items()):
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label}="{value}",le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}="{value}"}} {histogram.sum}')
+            lines.append(f'{name}_count{{{label}="{value}"}} {histogram.count}')
+
+    @staticmethod
+    def _export_counters(lines: List[str], name: str, help_text: str, label: str, counters: Dict[str, int]):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} counter"]
+        lines += [f'{name}{{{label}="{value}"}} {count}' for value, count in sorted(counters.items())]
+
+    @staticmethod
+    def _export_gauges(lines: List[str], name: str, help_text: str, gauges: Dict[str, float]):
+        lines += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge"]
+        lines += [f'{name}{{queue="{queue_name}"}} {value}' for queue_name, value in sorted(gauges.items())]
+
+
+def note_parse_failure():
+    """
+    Counts an LLM output that could not be parsed for the stage running in the calling thread or task (if instrumented).
+    """
+    current = _current_stage.get()
+    if current is not None:
+        current[0].record_parse_failure(current[1])
+
+
+@contextmanager
+def llm_stage(stage: str):
+    """
+    Attributes the LLM calls of the enclosed block to stage (of the instrumentation that is active in the calling
+    context, e.g. in a helper thread that was started from an instrumented stage) without measuring the block itself.
+    """
+    current = _current_stage.get()
+    if current is None:
+        yield
+        return
+    token = _current_stage.set((current[0], stage))
+    try:
+        yield
+    finally:
+        _current_stage.reset(token)
+
+
+class TimedQueue(queue.Queue):
+    """
+    FIFO queue that remembers when every item was put, so the age of the oldest item and the wait time of every
+    item can be measured (see Instrumentation). The items themselves are returned unchanged.
+    """
+
+    def __init__(self, maxsize: int = 0, on_wait: Optional[Callable[[float], None]] = None):
+        super().__init__(maxsize)
+        self.on_wait = on_wait
+
+    def oldest_age(self) -> float:
+        """
+        Returns how many seconds the oldest queued item is waiting (0.0 if the queue is empty).
+        """
+        with self.mutex:
+            return time.monotonic() - self.queue[0][0] if self.queue else 0.0
+
+    def _put(self, item):
+        self.queue.append((time.monotonic(), item))
+
+    def _get(self):
+        enqueued, item = self.queue.popleft()
+        if self.on_wait is not None:
+            self.on_wait(time.monotonic() - enqueued)
+        return item
+
+
+class InstrumentedLLM(BaseLLM):
+    """
+    BaseLLM wrapper that records latency, prompt and completion size and failures of every call under the stage
+    that is running when the call is made (see Instrumentation.stage). Other attributes are those of the wrapped llm.
+    """
+
+    def __init__(self, llm: BaseLLM, instrumentation: Instrumentation):
+        self.inner = llm
+        self.instrumentation = instrumentation
+        self.max_concurrency = getattr(llm, "max_concurrency", BaseLLM.max_concurrency)
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model_name", None) or getattr(self.inner, "model", None) or type(self.inner).__name__
+
+    def __getattr__(self, name: str):
+        # The wrapper is transparent: attributes of the provider (e.g. the stats of a ResilientLLM) stay accessible.
+        if name == "inner":
+            raise AttributeError(name)
+        return getattr(self.inner, name)
+
+    def is_healthy(self) -> bool:
+        return self.inner.is_healthy()
+
+    def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        started = time.perf_counter()
+        try:
+            result = self.inner.send_prompt(prompt)
+        except Exception as e:
+            self._record(prompt, "", started, e)
+            raise
+        self._record(prompt, result, started)
+        return result
+
+    async def send_prompt_async(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        started = time.perf_counter()
+        try:
+            result = await self.inner.send_prompt_async(prompt)
+        except Exception as e:
+            self._record(prompt, "", started, e)
+            raise
+        self._record(prompt, result, started)
+        return result
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        # The stage is read when the stream starts, i.e. when the first piece is requested.
+        stage = self.instrumentation.current_stage()
+        started = time.perf_counter()
+        completion_chars = 0
+        try:
+            for piece in self.inner.stream_prompt(prompt):
+                completion_chars += len(piece)
+                yield piece
+        except Exception as e:
+            self.instrumentation.record_llm(stage, time.perf_counter() - started, self._size(prompt), completion_chars, e)
+            raise
+        self.instrumentation.record_llm(stage, time.perf_counter() - started, self._size(prompt), completion_chars)
+
+    def _record(self, prompt, result, started: float, error: Optional[Exception] = None):
+        self.instrumentation.record_llm(
+            self.instrumentation.current_stage(), time.perf_counter() - started, self._size(prompt), len(result or ""), error
+        )
+
+    @staticmethod
+    def _size(prompt: Union[str, List[Dict[str, str]]]) -> int:
+        if isinstance(prompt, str):
+            return len(prompt)
+        return sum(len(message.get("content", "")) for message in prompt)
@@ -1,3 +1,4 @@
+import copy
 import json
 from typing import Dict, Any, List
 
@@ -50,7 +51,47 @@ class InternalProfile:
             "trust_formation_speed": "",
             "collaboration_style": ""
         }
+
+        # Incremented whenever the profile changes, e.g. to detect that a rendered prompt is outdated.
+        self.version: int = 0
+
+    def mark_changed(self) -> None:
+        """
+        Marks the profile as changed. Must be called after the attributes were modified in place.
+        """
+        self.version += 1
+
+    def get_baseline_emotions(self) -> Dict[str, float]:
+        """
+        Returns the current baseline emotions of the agent without taking a lock.
+
+        The emotional profile is copy-on-write: it is never modified in place once the agent runs, but replaced
+        as a whole by set_baseline_emotions. The returned dict is therefore a consistent snapshot that other
+        threads do not change, and must not be modified by the caller.
+        """
+        return self.emotional_profile.get("baseline_emotions", {})
+
+    def set_baseline_emotions(self, baseline: Dict[str, float]) -> None:
+        """
+        Publishes new baseline emotions: a new emotional profile is built and swapped in by a single reference
+        assignment, so readers see either the old or the new state, never a mix of both.
+        Concurrent writers must be serialized by the caller (EmotionServices uses its emotional state lock).
+        """
+        self.emotional_profile = {**self.emotional_profile, "baseline_emotions": dict(baseline)}
+        # Only after the swap, so a reader that sees the new version also sees the new state.
+        self.mark_changed()
     
+    def share(self) -> "InternalProfile":
+        """
+        Returns a flyweight copy for another persona loaded from the same resource file: the persona data
+        (name, goal, personality traits, drivers, ...) is shared with this profile instead of being copied, so it
+        must be treated as read-only and only be replaced as a whole. The emotional state is the persona's own,
+        because set_baseline_emotions never modifies the shared emotional profile but swaps in a new one.
+        """
+        shared = copy.copy(self)
+        shared.version = 0
+        return shared
+
     def load_from_json(self, json_str: str) -> None:
         """
         Parses the provided JSON string and populates the class variables.
@@ -74,6 +115,7 @@ class InternalProfile:
                 self.ethical_framework = setup.get("ethical_framework", self.ethical_framework)
                 self.learning_behavior = setup.get("learning_behavior", self.learning_behavior)
                 self.relationship_building = setup.get("relationship_building", self.relationship_building)
+                self.mark_changed()
         except (FileNotFoundError, json.JSONDecodeError):
             print(f"Warning: Could not load resource file '{json_str}'. Proceeding without emotion_setup.")
 
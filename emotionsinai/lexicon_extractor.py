@@ -0,0 +1,154 @@
+import json
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+DEFAULT_LEXICON_PATH = os.path.join(os.path.dirname(__file__), "data", "emotion_lexicon.json")
+
+_TOKEN_PATTERN = re.compile(r"[a-z]+|[.!?;,]")
+_CLAUSE_BREAKS = {".", "!", "?", ";", ","}
+
+
+class LexiconEmotionExtractor:
+    """
+    CPU-only emotion extractor based on a bundled emotion lexicon.
+
+    It returns the same structure as EmotionServices.parse_input (the six appraisal fields and the
+    14-key "emotion_levels" object) together with a confidence value, so it can be used as a tier-0
+    extractor: confident results are used directly, everything else is escalated to the LLM.
+
+    The scoring is vectorized with NumPy:
+      - Every lexicon word is a row of an emotion matrix plus a valence value.
+      - Intensifiers ("very", "slightly", ...) scale the weight of the following word.
+      - Negations ("not", "never", "don't", ...) within the same clause and up to negation_window tokens
+        before a word move its emotions to the opposite emotions and flip its valence.
+      - Exclamation marks amplify the result.
+    """
+
+    def __init__(self, lexicon_path: str = DEFAULT_LEXICON_PATH, negation_window: int = 3):
+        with open(lexicon_path, "r") as file:
+            lexicon = json.load(file)
+
+        self.emotions: List[str] = lexicon["emotions"]
+        self.negation_window = negation_window
+        emotion_index = {emotion: index for index, emotion in enumerate(self.emotions)}
+
+        words = lexicon["words"]
+        self.vocabulary: Dict[str, int] = {word: index for index, word in enumerate(words)}
+        self.emotion_matrix = np.zeros((len(words), len(self.emotions)), dtype=np.float32)
+        self.valence = np.zeros(len(words), dtype=np.float32)
+        for row, entry in enumerate(words.values()):
+            self.valence[row] = entry.get("valence", 0.0)
+            for emotion, weight in entry.items():
+                if emotion in emotion_index:
+                    self.emotion_matrix[row, emotion_index[emotion]] = weight
+
+        # Negated emotions are moved (at half strength) to their opposite emotion.
+        self.negation_matrix = np.zeros((len(self.emotions), len(self.emotions)), dtype=np.float32)
+        for emotion, opposite in lexicon.get("opposites", {}).items():
+            self.negation_matrix[emotion_index[emotion], emotion_index[opposite]] = 0.5
+
+        self.negations = set(lexicon.get("negations", []))
+        self.intensifiers: Dict[str, float] = lexicon.get("intensifiers", {})
+
+    def tokenize(self, text: str) -> List[str]:
+        """
+        Lower-cases the text, drops apostrophes ("don't" -> "dont") and splits it into words and clause punctuation.
+        """
+        return _TOKEN_PATTERN.findall(text.lower().replace("'", "").replace("’", ""))
+
+    def extract(self, text: str) -> Tuple[dict, float]:
+        """
+        Extract appraisal scores and emotion levels from the text.
+        Returns a tuple (scores, confidence) where scores has the structure returned by parse_input
+        and confidence is a value between 0 and 1.
+        """
+        tokens = self.tokenize(text)
+        words = [token for token in tokens if token not in _CLAUSE_BREAKS]
+        if not words:
+            return self._build_scores(np.zeros(len(self.emotions), dtype=np.float32), 0.0, 0.0), 0.0
+
+        count = len(tokens)
+        positions = np.arange(count)
+        rows = np.array([self.vocabulary.get(token, -1) for token in tokens])
+        is_negation = np.array([token in self.negations for token in tokens])
+        is_break = np.array([token in _CLAUSE_BREAKS for token in tokens])
+        intensity = np.array([self.intensifiers.get(token, 1.0) for token in tokens], dtype=np.float32)
+
+        # Intensifiers act on the following token.
+        weights = np.ones(count, dtype=np.float32)
+        weights[1:] = intensity[:-1]
+
+        # A token is negated if the last negation before it is close enough and in the same clause.
+        clause = np.cumsum(is_break)
+        last_negation = np.maximum.accumulate(np.where(is_negation, positions, -1))
+        previous_negation = np.concatenate(([-1], last_negation[:-1]))
+        negated = (
+            (previous_negation >= 0)
+            & (positions - previous_negation <= self.negation_window)
+            & (clause[np.maximum(previous_negation, 0)] == clause)
+        )
+
+        hits = rows >= 0
+        hit_rows = rows[hits]
+        hit_weights = weights[hits][:, None]
+        hit_negated = negated[hits][:, None]
+
+        contributions = self.emotion_matrix[hit_rows] * hit_weights
+        contributions = np.where(hit_negated, contributions @ self.negation_matrix, contributions)
+        valences = self.valence[hit_rows] * hit_weights[:, 0] * np.where(hit_negated[:, 0], -0.5, 1.0)
+
+        exclamation = 1.0 + 0.1 * min(3, text.count("!"))
+        # Saturating sum: several weak cues add up, but levels never exceed 1.
+        levels = 1.0 - np.exp(-contributions.sum(axis=0) * exclamation)
+        valence = float(np.clip(valences.mean(), -1.0, 1.0)) if valences.size else 0.0
+
+        coverage = float(hits.sum()) / len(words)
+        scores = self._build_scores(levels, valence, coverage)
+        return scores, self._confidence(len(words), int(hits.sum()), coverage)
+
+    def _confidence(self, word_count: int, hit_count: int, coverage: float) -> float:
+        """
+        Short texts that are well covered by the lexicon get a high confidence, long texts and texts
+        with few lexicon hits get a low one.
+        """
+        if hit_count == 0:
+            return 0.0
+        length_factor = 1.0 if word_count <= 8 else 8.0 / word_count
+        return float(min(1.0, (0.5 + coverage) * length_factor))
+
+    def _build_scores(self, levels: np.ndarray, valence: float, coverage: float) -> dict:
+        """
+        Derive the appraisal fields from the emotion levels and the valence and build the parse_input structure.
+        """
+        emotion_levels = {emotion: round(float(level), 4) for emotion, level in zip(self.emotions, levels)}
+        positive = max(emotion_levels["happiness"], emotion_levels["trust"], emotion_levels["love"])
+        threat = max(emotion_levels["fear"], emotion_levels["anger"], emotion_levels["sadness"])
+        social = max(
+            emotion_levels["love"], emotion_levels["guilt"], emotion_levels["shame"],
+            emotion_levels["pride"], emotion_levels["compassion"], emotion_levels["anger"]
+        )
+        return {
+            "sentiment_score": round(0.5 + 0.5 * valence, 4),
+            "relevance": round(0.3 + 0.5 * min(1.0, coverage * 2), 4),
+            "novelty": round(0.2 + 0.6 * emotion_levels["surprise"], 4),
+            "goal_alignment": round(min(1.0, max(0.0, 0.5 + 0.5 * valence)), 4),
+            "controllability": round(min(1.0, max(0.0, 0.5 + 0.5 * (positive - threat))), 4),
+            "normative_significance": round(0.2 + 0.6 * social, 4),
+            "emotion_levels": emotion_levels,
+        }
+
+
+_default_extractor: Optional[LexiconEmotionExtractor] = None
+
+
+def get_default_extractor() -> LexiconEmotionExtractor:
+    """
+    Returns a shared extractor with the bundled lexicon, loading it on first use.
+    """
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = LexiconEmotionExtractor()
+    return _default_extractor
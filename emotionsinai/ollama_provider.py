@@ -1,25 +1,71 @@
+import threading
 from langchain_ollama import ChatOllama
-from typing import Union, List, Dict
+from typing import Any, Optional, Union, List, Dict, Iterator
 
-from emotionsinai import BaseLLM
+import httpx
+
+from .base_llm import BaseLLM
 
 class OllamaProvider(BaseLLM):
     """
     Implementation of BaseLLM that connects to a llama3.1 model using Ollama.
+
+    One long-lived ChatOllama client is created per provider, so all requests share the pooled HTTP connections
+    of its sync and async clients. At most max_concurrency requests (sync and async together) are sent at the same
+    time; further requests wait for a free slot instead of opening new connections.
     """
-    def __init__(self, model_name: str = "llama3"):
+    def __init__(
+        self,
+        model_name: str = "llama3",
+        temperature: Optional[float] = None,
+        base_url: Optional[str] = None,
+        max_concurrency: int = 8,
+        timeout: Optional[float] = 120.0,
+        **kwargs: Any
+    ):
         self.model_name = model_name
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+
+        limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self.client = ChatOllama(
+            model=model_name,
+            temperature=temperature,
+            base_url=base_url,
+            client_kwargs={"limits": limits, "timeout": timeout},
+            **kwargs
+        )
 
     def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
         """
         Sends a prompt to the Llama3.1 model via Ollama and returns the response.
         """
+        formatted_prompt = self._format_prompt(prompt)
+
+        with self._slots:
+            response = self.client.invoke(formatted_prompt)
+
+        return response.content
+
+    async def send_prompt_async(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        """
+        Sends a prompt with the pooled async client of Ollama.
+        """
+        async with self._async_slot():
+            response = await self.client.ainvoke(self._format_prompt(prompt))
+        return response.content
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        """
+        Streams the response of the model and yields the generated tokens as they arrive.
+        """
+        with self._slots:
+            for chunk in self.client.stream(self._format_prompt(prompt)):
+                if chunk.content:
+                    yield chunk.content
+
+    def _format_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
         if isinstance(prompt, list):
             # Convert chat messages into Ollama's expected format
-            formatted_prompt = "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in prompt])
-        else:
-            formatted_prompt = prompt
-        
-        response = ChatOllama.invoke(model=self.model_name, messages=[{"role": "user", "content": formatted_prompt}])
-
-        return response.get("message", {}).get("content", "")
+            return "\n".join([f"{msg['role'].capitalize()}: {msg['content']}" for msg in prompt])
+        return prompt
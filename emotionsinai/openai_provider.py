@@ -1,30 +1,91 @@
 # openai_provider.py
 
-from openai import OpenAI
-from typing import Union, List, Dict
+import threading
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from typing import Optional, Union, List, Dict, Iterator
 
-#from base_llm import BaseLLM
-from emotionsinai import BaseLLM
+import httpx
+
+from .base_llm import BaseLLM
 
 
 class OpenAIProvider(BaseLLM):
     """
     Default LLM provider using OpenAI's API.
     Allows passing either a single string prompt or a list of message dicts.
+
+    The sync and async clients are long-lived and share a pool of at most max_concurrency HTTP connections;
+    at most max_concurrency requests (sync and async together) are sent at the same time.
     """
 
-    def __init__(self, model_name: str = "gpt-4", temperature: float = 0.7, openai_key: str = ""):
+    def __init__(
+        self,
+        model_name: str = "gpt-4",
+        temperature: float = 0.7,
+        openai_key: str = "",
+        max_concurrency: int = 8,
+        timeout: Optional[float] = 120.0
+    ):
         self.model_name = model_name
         self.temperature = temperature
+        self.max_concurrency = max_concurrency
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._limits = httpx.Limits(max_connections=max_concurrency, max_keepalive_connections=max_concurrency)
+        self._openai_key = openai_key
+        self._timeout = timeout
         # Configure the OpenAI client
         OpenAI.api_key = openai_key
-        self.client = OpenAI(api_key=openai_key)
+        self.client = OpenAI(api_key=openai_key, timeout=timeout, http_client=DefaultHttpxClient(limits=self._limits))
+        self._async_client: Optional[AsyncOpenAI] = None
 
     def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
         """
         If `prompt` is a string, wrap it in a minimal chat message.
         If `prompt` is a list of dicts, we pass it directly to the chat endpoint.
         """
+        with self._slots:
+            response = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt),
+                temperature=self.temperature
+            )
+
+        return response.choices[0].message.content
+
+    async def send_prompt_async(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        """
+        Sends a prompt with the pooled async client, which is created on first use.
+        """
+        if self._async_client is None:
+            self._async_client = AsyncOpenAI(
+                api_key=self._openai_key,
+                timeout=self._timeout,
+                http_client=DefaultAsyncHttpxClient(limits=self._limits)
+            )
+        async with self._async_slot():
+            response = await self._async_client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt),
+                temperature=self.temperature
+            )
+        return response.choices[0].message.content
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        """
+        Streams the response of the chat endpoint and yields the content deltas as they arrive.
+        """
+        with self._slots:
+            stream = self.client.chat.completions.create(
+                model=self.model_name,
+                messages=self._build_messages(prompt),
+                temperature=self.temperature,
+                stream=True
+            )
+            for chunk in stream:
+                if chunk.choices and chunk.choices[0].delta.content:
+                    yield chunk.choices[0].delta.content
+
+    def _build_messages(self, prompt: Union[str, List[Dict[str, str]]]) -> List[Dict[str, str]]:
         if isinstance(prompt, str):
             messages = [
                 {"role": "system", "content": "You are a helpful assistant."},
@@ -38,11 +99,4 @@ class OpenAIProvider(BaseLLM):
                 prompt = ([{"role": "system", "content": "You are a helpful assistant."}] 
                           + prompt)
             messages = prompt
-
-        response = self.client.chat.completions.create(
-            model=self.model_name,
-            messages=messages,
-            temperature=self.temperature
-        )
-
-        return response.choices[0].message.content
+        return messages
@@ -0,0 +1,310 @@
+import atexit
+import os
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from .base_llm import BaseLLM
+from .emotion_services import EmotionServices
+from .internal_profile import InternalProfile
+from .profile_store import ProfileCache, ProfileStore
+from .response_split import TypingSpeedModel
+from .worker_pool import ShardedWorkerPool
+from .emotion_batcher import EmotionBatcher
+from .appraisal_cache import AppraisalCache
+from .context_builder import ContextBuilder
+from .resilient_llm import ResilientLLM
+from .instrumentation import Instrumentation, InstrumentedLLM, TimedQueue
+
+
+class PersonaHost:
+    """
+    Registry that hosts many personas (agents with their own resources.json) in one process on shared infrastructure.
+
+    A standalone EmotionServices starts three threads (plus one per worker) and owns an LLM client, an appraisal
+    cache and an emotion batcher. All personas of a host share instead:
+      - one LLM (default: OllamaProvider with llama3.1 wrapped in a ResilientLLM) and its pooled client,
+      - one pool of num_workers input workers, one reflection thread and one send thread,
+      - the appraisal cache, the emotion batcher (batch_size > 1), the context builder and the instrumentation,
+      - the persona data: a resource file is loaded once and every persona created from it shares the loaded
+        InternalProfile data (see InternalProfile.share), the typing model and the system prompt.
+    Every persona (HostedPersona) only keeps its mutable state: the agent's emotions, its users' profiles,
+    its response channels and its reflection bookkeeping.
+
+        host = PersonaHost(num_workers=8)
+        alice = host.add_persona("alice", "alice/resources.json", "emotion_system_prompt.json")
+        alice.add_input("user-1", "Hello!", "Hi, how are you?")
+        print(alice.get_response("user-1", timeout=30))
+
+    The inputs of one user of one persona are processed in order; everything else runs in parallel on the workers.
+    The queue bounds (max_queued_inputs, max_queued_reflections, max_queued_responses) are shared by all personas,
+    the overflow_policy and shed_ratio can be set per persona (see EmotionServices).
+    The user profiles of personas with a profile_store are flushed every profile_flush_interval seconds by one
+    shared thread. A persona with a state_dir still starts the writer thread of its own StateJournal.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = 4,
+        batch_size: int = 1,
+        batch_window_ms: int = 20,
+        cache_size: int = 4096,
+        cache_ttl: Optional[float] = 3600,
+        cache_path: Optional[str] = None,
+        profile_flush_interval: float = 5.0,
+        max_queued_inputs: int = 0,
+        max_queued_reflections: int = 0,
+        max_queued_responses: int = 0,
+        context_builder: Optional[ContextBuilder] = None,
+        llm: Optional[BaseLLM] = None,
+        instrumentation: Optional[Instrumentation] = None
+    ):
+        self.num_workers = num_workers
+        self.max_queued_inputs = max_queued_inputs
+        self.profile_flush_interval = profile_flush_interval
+        self.instrumentation = instrumentation if instrumentation is not None else Instrumentation()
+
+        if llm is None:
+            # Imported on demand, so a custom provider does not require the Ollama client.
+            from .ollama_provider import OllamaProvider
+            llm = ResilientLLM(OllamaProvider("llama3.1", temperature=0))
+        # Wrapped once, so the personas record their calls without wrapping the llm again.
+        self.llm = InstrumentedLLM(llm, self.instrumentation)
+
+        self.context_builder = context_builder if context_builder is not None else ContextBuilder()
+        # The extracted emotions of an input do not depend on the persona, so all personas share the results.
+        self.appraisal_cache = AppraisalCache(max_entries=cache_size, ttl_seconds=cache_ttl, persist_path=cache_path)
+        self.emotion_batcher: Optional[EmotionBatcher] = None
+        if batch_size > 1:
+            self.emotion_batcher = EmotionBatcher(self.llm, max_batch_size=batch_size, max_wait_ms=batch_window_ms)
+
+        self.personas: Dict[str, "HostedPersona"] = {}
+        self._personas_lock = threading.Lock()
+        self._templates: Dict[str, InternalProfile] = {}
+        self._typing_models: Dict[str, TypingSpeedModel] = {}
+        self._system_prompts: Dict[str, str] = {}
+        self._templates_lock = threading.Lock()
+        self._profile_caches: List[ProfileCache] = []
+        self._caches_lock = threading.Lock()
+        self._flush_thread: Optional[threading.Thread] = None
+
+        # Items are tagged with their persona: (persona, user_id) and ((persona, user_id), list_of_tuples).
+        self.reflection_queue = TimedQueue(max_queued_reflections, on_wait=lambda seconds: self.instrumentation.record_queue_wait("reflection", seconds))
+        self.send_response_queue = TimedQueue(max_queued_responses, on_wait=lambda seconds: self.instrumentation.record_queue_wait("send_response", seconds))
+        self.input_pool = ShardedWorkerPool(
+            self._process_input, num_workers, name="process_input",
+            on_wait=lambda seconds: self.instrumentation.record_queue_wait("input", seconds),
+            max_queue_size=max_queued_inputs
+        )
+        threading.Thread(target=self._reflection_process, name="persona-reflection", daemon=True).start()
+        threading.Thread(target=self._send_response_process, name="persona-send", daemon=True).start()
+        self.input_pool.start()
+        self.instrumentation.register_queue("input", lambda: sum(self.input_pool.queue_depths()), self.input_pool.oldest_age)
+        self.instrumentation.register_queue("reflection", self.reflection_queue.qsize, self.reflection_queue.oldest_age)
+        self.instrumentation.register_queue("send_response", self.send_response_queue.qsize, self.send_response_queue.oldest_age)
+
+    def add_persona(self, persona_id: str, resource_file_path: str, system_prompt_path: str, **kwargs) -> "HostedPersona":
+        """
+        Creates and registers a persona. Further keyword arguments (e.g. streaming, split_mode, profile_store,
+        state_dir, reflection_policy) are passed to EmotionServices; the shared infrastructure is set by the host.
+        Raises ValueError if a persona with this id is already registered.
+        """
+        with self._personas_lock:
+            if persona_id in self.personas:
+                raise ValueError(f"Persona '{persona_id}' is already registered.")
+            persona = HostedPersona(self, persona_id, resource_file_path, system_prompt_path, **kwargs)
+            self.personas[persona_id] = persona
+        return persona
+
+    def get_persona(self, persona_id: str) -> "HostedPersona":
+        """
+        Returns the registered persona. Raises KeyError if it is unknown.
+        """
+        return self.personas[persona_id]
+
+    def remove_persona(self, persona_id: str) -> Optional["HostedPersona"]:
+        """
+        Unregisters the persona and writes its pending user profiles. Inputs that are already queued are still processed.
+        """
+        with self._personas_lock:
+            persona = self.personas.pop(persona_id, None)
+        if persona is not None:
+            with self._caches_lock:
+                if persona.user_profiles in self._profile_caches:
+                    self._profile_caches.remove(persona.user_profiles)
+            persona.user_profiles.flush()
+        return persona
+
+    def __contains__(self, persona_id: str) -> bool:
+        return persona_id in self.personas
+
+    def __len__(self) -> int:
+        return len(self.personas)
+
+    def get_queue_depths(self) -> Dict[str, object]:
+        """
+        Returns the current number of queued items of the shared pipeline (see EmotionServices.get_queue_depths).
+        """
+        return {
+            "input": self.input_pool.queue_depths(),
+            "reflection": self.reflection_queue.qsize(),
+            "send_response": self.send_response_queue.qsize(),
+        }
+
+    def get_metrics(self) -> Dict[str, object]:
+        """
+        Returns the metrics of all personas (see Instrumentation.snapshot).
+        """
+        return self.instrumentation.snapshot()
+
+    def flush(self):
+        """
+        Writes the pending user profiles of all personas to their stores.
+        """
+        with self._caches_lock:
+            caches = list(self._profile_caches)
+        for cache in caches:
+            cache.flush()
+
+    def persona_template(self, resource_file_path: str) -> InternalProfile:
+        """
+        Returns the persona data loaded from the resource file; every file is only loaded once.
+        """
+        key = os.path.abspath(resource_file_path)
+        with self._templates_lock:
+            template = self._templates.get(key)
+            if template is None:
+                template = InternalProfile()
+                template.load_from_json(resource_file_path)
+                self._templates[key] = template
+                self._typing_models[key] = TypingSpeedModel.from_persona(template)
+            return template
+
+    def typing_model(self, resource_file_path: str) -> TypingSpeedModel:
+        """
+        Returns the typing model derived from the persona of the resource file.
+        """
+        self.persona_template(resource_file_path)
+        return self._typing_models[os.path.abspath(resource_file_path)]
+
+    def system_prompt(self, system_prompt_path: str, load: Callable[[str], str]) -> str:
+        """
+        Returns the system prompt of the file, loaded with load only the first time.
+        """
+        key = os.path.abspath(system_prompt_path)
+        with self._templates_lock:
+            prompt = self._system_prompts.get(key)
+        if prompt is None:
+            prompt = load(system_prompt_path)
+            with self._templates_lock:
+                prompt = self._system_prompts.setdefault(key, prompt)
+        return prompt
+
+    def _register_profile_cache(self, cache: ProfileCache):
+        """
+        Adds a persona's profile cache with a store to the caches that are flushed by the shared thread.
+        """
+        with self._caches_lock:
+            self._profile_caches.append(cache)
+            if self._flush_thread is None:
+                self._flush_thread = threading.Thread(target=self._flush_process, name="persona-profile-flush", daemon=True)
+                self._flush_thread.start()
+                atexit.register(self.flush)
+
+    def _flush_process(self):
+        while True:
+            time.sleep(self.profile_flush_interval)
+            self.flush()
+
+    def _process_input(self, entry):
+        persona, item = entry
+        persona.process_input(item)
+
+    def _reflection_process(self):
+        while True:
+            persona, user_id = self.reflection_queue.get()
+            persona.run_reflection(user_id)
+
+    def _send_response_process(self):
+        EmotionServices.schedule_chunks(self.send_response_queue, lambda key, text: key[0].deliver_response(key[1], text))
+
+
+class _PersonaQueue:
+    """
+    Queue of a hosted persona: the items are tagged with the persona and put on the shared queue of the host.
+    qsize and oldest_age report the shared queue.
+    """
+
+    def __init__(self, shared: TimedQueue, tag: Callable[[Any], Any]):
+        self._shared = shared
+        self._tag = tag
+
+    def put(self, item: Any, block: bool = True, timeout: Optional[float] = None):
+        self._shared.put(self._tag(item), block, timeout)
+
+    def qsize(self) -> int:
+        return self._shared.qsize()
+
+    def oldest_age(self) -> float:
+        return self._shared.oldest_age()
+
+
+class HostedPersona(EmotionServices):
+    """
+    EmotionServices of a persona that runs on the shared infrastructure of a PersonaHost (see PersonaHost.add_persona).
+    It has the same interface as EmotionServices, but starts no threads of its own; the queue depths
+    and metrics it reports are those of the host.
+    """
+
+    def __init__(self, host: PersonaHost, persona_id: str, resource_file_path: str, system_prompt_path: str, **kwargs):
+        self.host = host
+        self.persona_id = persona_id
+        kwargs.setdefault("typing_model", host.typing_model(resource_file_path))
+        super().__init__(
+            resource_file_path, system_prompt_path,
+            num_workers=host.num_workers,
+            max_queued_inputs=host.max_queued_inputs,
+            cache_size=0,
+            batch_size=1,
+            context_builder=host.context_builder,
+            llm=host.llm,
+            instrumentation=host.instrumentation,
+            **kwargs
+        )
+        # Shared with all personas of the host.
+        self.appraisal_cache = host.appraisal_cache
+        self.emotion_batcher = host.emotion_batcher
+
+    def _load_internal_profile(self, resource_file_path: str) -> InternalProfile:
+        return self.host.persona_template(resource_file_path).share()
+
+    def _load_system_prompt(self, system_prompt_path: str) -> str:
+        return self.host.system_prompt(system_prompt_path, super()._load_system_prompt)
+
+    def _create_profile_cache(self, profile_store: Optional[ProfileStore], max_cached_profiles: int, profile_flush_interval: float) -> ProfileCache:
+        # Few shard locks suffice for the users of one persona; the host flushes the cache.
+        cache = ProfileCache(profile_store, max_profiles=max_cached_profiles, flush_interval=None, num_shards=4)
+        if profile_store is not None:
+            self.host._register_profile_cache(cache)
+        return cache
+
+    def compile_prompt_extension(self):
+        super().compile_prompt_extension()
+        # Personas of the same resource file render the same fragments, so one copy is kept.
+        self._prompt_head = sys.intern(self._prompt_head)
+        self._prompt_persona = sys.intern(self._prompt_persona)
+
+    def _start_workers(self):
+        """
+        No threads are started: inputs, reflections and responses are handled by the workers of the host.
+        """
+        self.input_pool = self.host.input_pool
+        self.reflection_queue = _PersonaQueue(self.host.reflection_queue, lambda user_id: (self, user_id))
+        self.send_response_queue = _PersonaQueue(self.host.send_response_queue, lambda item: ((self, item[0]), item[1]))
+
+    def add_input(self, user_id: str, prompt: str, answer: Optional[str] = None, writing_style: bool = False, text_split: bool = False) -> bool:
+        """
+        Add a new input to the shared input workers of the host (see EmotionServices.add_input).
+        """
+        return self._enqueue_input(user_id, f"{self.persona_id}/{user_id}", (self, (user_id, prompt, answer, writing_style, text_split)))
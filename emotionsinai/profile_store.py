@@ -0,0 +1,324 @@
+import atexit
+import json
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Optional
+
+from .user_profile import UserProfile
+
+
+class ProfileStore(ABC):
+    """
+    Abstract base class for persistent storage of serialized user profiles (see UserProfile.to_dict).
+    """
+
+    @abstractmethod
+    def load(self, user_id: str) -> Optional[Dict]:
+        """
+        Returns the serialized profile of the user, or None if the user is unknown.
+        """
+        pass
+
+    @abstractmethod
+    def save_many(self, profiles: Dict[str, Dict]):
+        """
+        Writes a batch of serialized profiles, keyed by user_id.
+        """
+        pass
+
+    @abstractmethod
+    def delete(self, user_id: str):
+        """
+        Removes the profile of the user.
+        """
+        pass
+
+    def close(self):
+        """
+        Releases the resources of the store.
+        """
+        pass
+
+
+class SQLiteProfileStore(ProfileStore):
+    """
+    ProfileStore that keeps every profile as one JSON document in an SQLite database.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS user_profiles (user_id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+            )
+            self._connection.commit()
+
+    def load(self, user_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._connection.execute("SELECT data FROM user_profiles WHERE user_id = ?", (user_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_many(self, profiles: Dict[str, Dict]):
+        if not profiles:
+            return
+        now = time.time()
+        rows = [(user_id, json.dumps(data, ensure_ascii=False), now) for user_id, data in profiles.items()]
+        with self._lock:
+            self._connection.executemany(
+                "INSERT INTO user_profiles (user_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                rows
+            )
+            self._connection.commit()
+
+    def delete(self, user_id: str):
+        with self._lock:
+            self._connection.execute("DELETE FROM user_profiles WHERE user_id = ?", (user_id,))
+            self._connection.commit()
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class ProfileCache:
+    """
+    In-memory LRU of hot user profiles in front of an optional ProfileStore.
+
+      - Profiles are loaded lazily from the store on first access and created if the store does not know them.
+      - At most max_profiles profiles are kept in memory; the least recently used ones are evicted.
+      - Changed (dirty) profiles are written back in batches every flush_interval seconds by a background
+        thread, and when they are evicted.
+
+    Without a store, nothing is evicted (there would be nowhere to write it), so the cache behaves like a dict.
+    With flush_interval=None, no background thread is started and the owner has to call flush() itself
+    (e.g. PersonaHost flushes the caches of all its personas from one thread).
+    A worker uses a profile within pinned(): pinned profiles are not evicted and do not count against max_profiles,
+    so no change of a worker is lost and a profile that was just loaded is not evicted for the pinned ones.
+    Per-user state kept outside of the profiles is released by eviction listeners (see add_eviction_listener).
+
+    Lookups of profiles in memory take no lock (without a store) or only hold the map lock to mark the profile
+    as recently used. Loading and creating a profile is serialized per user by one of num_shards striped locks,
+    so a profile is created exactly once, while other users are loaded from the store in parallel.
+    """
+
+    def __init__(self, store: Optional[ProfileStore] = None, max_profiles: int = 10000, flush_interval: Optional[float] = 5.0, num_shards: int = 64):
+        self.store = store
+        self.max_profiles = max_profiles
+        self.flush_interval = flush_interval
+        self._profiles: "OrderedDict[str, UserProfile]" = OrderedDict()
+        self._evicted: Dict[str, Dict] = {}     # serialized dirty profiles that were evicted but not written yet
+        self._writing: Dict[str, Dict] = {}     # serialized profiles of the batch that is currently written
+        self._lock = threading.RLock()
+        self._shard_locks = [threading.Lock() for _ in range(max(1, num_shards))]
+        self._flush_lock = threading.Lock()
+        self._pins: Dict[str, int] = {}         # user_id -> number of workers that use the profile
+        self._eviction_listeners: List[Callable[[str], None]] = []
+
+        if store is not None and flush_interval is not None:
+            threading.Thread(target=self._flush_process, daemon=True).start()
+            atexit.register(self.flush)
+
+    def get(self, user_id: str) -> Optional[UserProfile]:
+        """
+        Returns the profile if it is in memory, without loading it from the store.
+        """
+        with self._lock:
+            return self._profiles.get(user_id)
+
+    def get_or_create(self, user_id: str, factory: Callable[[str, Optional[Dict]], UserProfile]) -> UserProfile:
+        """
+        Returns the in-memory profile of the user. Otherwise the profile is loaded from the store and
+        restored by factory(user_id, data), or created with factory(user_id, None) if the store does not know it.
+        A profile that the factory marks as dirty is written to the store like a changed one.
+        """
+        profile = self._lookup(user_id)
+        if profile is not None:
+            return profile
+
+        with self._shard_locks[hash(user_id) % len(self._shard_locks)]:
+            # Another thread may have created the profile while this one waited for the shard.
+            profile = self._lookup(user_id)
+            if profile is not None:
+                return profile
+
+            with self._lock:
+                # A profile whose eviction was not written yet is restored from the pending data and stays dirty.
+                data = self._evicted.pop(user_id, None)
+                unwritten = data is not None
+                if data is None:
+                    data = self._writing.get(user_id)
+            # The store is read without the map lock, so a slow load does not block the other users.
+            if data is None and self.store is not None:
+                data = self.store.load(user_id)
+            profile = factory(user_id, data)
+            # The factory may have changed the restored profile (e.g. merged a newer journaled state), keep its flag.
+            profile.dirty = unwritten or profile.dirty
+            with self._lock:
+                self._profiles[user_id] = profile
+                evicted = self._evict()
+        self._notify_evicted(evicted)
+        return profile
+
+    @contextmanager
+    def pinned(self, user_id: str, factory: Callable[[str, Optional[Dict]], UserProfile]) -> Iterator[UserProfile]:
+        """
+        Returns the profile like get_or_create and keeps it in memory until the block is left:
+
+            with cache.pinned(user_id, factory) as profile:
+                ...
+        """
+        with self._lock:
+            self._pins[user_id] = self._pins.get(user_id, 0) + 1
+        try:
+            yield self.get_or_create(user_id, factory)
+        finally:
+            with self._lock:
+                pins = self._pins.pop(user_id) - 1
+                if pins:
+                    self._pins[user_id] = pins
+                # Catch up on the evictions that were skipped while the profile was pinned.
+                evicted = self._evict()
+            self._notify_evicted(evicted)
+
+    def add_eviction_listener(self, listener: Callable[[str], None]):
+        """
+        Registers listener(user_id), which is called when a profile left memory and its changes were written to
+        the store, so that per-user state kept elsewhere can be released. The listener is called while the user's
+        profile cannot be loaded again, so it must be quick and must not access the user's profile.
+        """
+        self._eviction_listeners.append(listener)
+
+    def __contains__(self, user_id: str) -> bool:
+        with self._lock:
+            return user_id in self._profiles
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._profiles)
+
+    def __iter__(self) -> Iterator[str]:
+        with self._lock:
+            return iter(list(self._profiles))
+
+    def __getitem__(self, user_id: str) -> UserProfile:
+        profile = self.get(user_id)
+        if profile is None:
+            raise KeyError(user_id)
+        return profile
+
+    def values(self) -> List[UserProfile]:
+        with self._lock:
+            return list(self._profiles.values())
+
+    def flush(self):
+        """
+        Writes all dirty and evicted profiles to the store in one batch.
+        """
+        if self.store is None:
+            return
+        with self._flush_lock:
+            with self._lock:
+                # The batch is published as _writing right away, so an evicted profile that is loaded again
+                # before the batch is written is restored from it instead of the outdated store.
+                batch = self._evicted
+                self._evicted = {}
+                self._writing = batch
+                evicted = list(batch)
+                dirty = [profile for profile in self._profiles.values() if profile.dirty]
+            for profile in dirty:
+                # Clear the flag before serializing, so changes made during serialization are written next time.
+                profile.dirty = False
+                data = profile.to_dict()
+                with self._lock:
+                    batch[profile.user_id] = data
+            try:
+                self.store.save_many(batch)
+            except Exception as e:
+                print(f"[ProfileCache] Error writing {len(batch)} profiles: {e}")
+                evicted = []
+                with self._lock:
+                    for user_id, data in batch.items():
+                        if user_id not in self._profiles:
+                            self._evicted.setdefault(user_id, data)
+                        else:
+                            self._profiles[user_id].dirty = True
+            finally:
+                with self._lock:
+                    self._writing = {}
+            self._notify_evicted(evicted)
+
+    def close(self):
+        """
+        Writes all pending changes and closes the store.
+        """
+        self.flush()
+        if self.store is not None:
+            self.store.close()
+
+    def _lookup(self, user_id: str) -> Optional[UserProfile]:
+        """
+        Returns the in-memory profile and marks it as recently used.
+        """
+        if self.store is None:
+            # Nothing is ever evicted, so the recency does not matter and the (atomic) dict read needs no lock.
+            return self._profiles.get(user_id)
+        with self._lock:
+            profile = self._profiles.get(user_id)
+            if profile is not None:
+                self._profiles.move_to_end(user_id)
+            return profile
+
+    def _evict(self) -> List[str]:
+        """
+        Evicts the least recently used profiles beyond max_profiles that are not pinned. Must be called with the lock held.
+        Returns the evicted clean profiles; the dirty ones are passed to the listeners once they are written.
+        """
+        if self.store is None:
+            return []
+        clean = []
+        pinned = []
+        limit = self.max_profiles + len(self._pins)
+        while self._profiles and len(self._profiles) + len(pinned) > limit:
+            user_id, profile = self._profiles.popitem(last=False)
+            if user_id in self._pins:
+                pinned.append((user_id, profile))
+            elif profile.dirty:
+                self._evicted[user_id] = profile.to_dict()
+            else:
+                clean.append(user_id)
+        # The pinned profiles stay in memory as the most recently used ones.
+        for user_id, profile in pinned:
+            self._profiles[user_id] = profile
+        return clean
+
+    def _notify_evicted(self, user_ids: Iterable[str]):
+        """
+        Calls the eviction listeners for the evicted users that were neither loaded again nor are still to be written.
+        Must be called without the locks held.
+        """
+        if not self._eviction_listeners:
+            return
+        for user_id in user_ids:
+            # The shard lock keeps the profile from being loaded again while the listeners release the user's state.
+            with self._shard_locks[hash(user_id) % len(self._shard_locks)]:
+                with self._lock:
+                    if user_id in self._profiles or user_id in self._evicted:
+                        continue
+                for listener in self._eviction_listeners:
+                    try:
+                        listener(user_id)
+                    except Exception as e:
+                        print(f"[ProfileCache] Error in eviction listener for user {user_id}: {e}")
+
+    def _flush_process(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.flush()
@@ -1,16 +1,19 @@
 from typing import List, Dict, Optional, Tuple
 import json
 from .user_profile import UserProfile
-from dotenv import load_dotenv
-from langchain_ollama import ChatOllama
+from .context_builder import ContextBuilder
+from .base_llm import BaseLLM
+from .structured_output import extract_json, coerce_chunks
 
 class Reflection:
 
-    def __init__(self, llm: ChatOllama):
+    def __init__(self, llm: BaseLLM, context_builder: Optional[ContextBuilder] = None):
         """
         Initializes the Reflection instance with an LLM model.
+        If a context_builder is given, the conversation history in the prompts is limited to its token budget.
         """
         self.llm = llm
+        self.context_builder = context_builder
 
     def generate_emotional_guideline(self, user_profil: UserProfile, num_messages: int = 20) -> str:
         """
@@ -22,7 +25,8 @@ class Reflection:
 
         Args:
             llm: An instance of an LLM interface with a `.send_prompt()` method.
-            num_messages: How many recent messages to analyze (default: 20).
+            num_messages: How many recent messages to analyze (default: 20). With a context builder, these are
+                          quoted verbatim and older messages are part of the running summary.
         
         Returns:
             A concise emotional interaction guideline string.
@@ -30,7 +34,10 @@ class Reflection:
         import json
 
         # Gather relevant context
-        conversation_history = user_profil.get_conversation_history(num_messages)
+        if self.context_builder is not None:
+            conversation_history = self.context_builder.build(user_profil, "reflection", recent_turns=num_messages)
+        else:
+            conversation_history = json.dumps(user_profil.get_conversation_history(num_messages), indent=2)
 
         prompt = (
             "You are a psychological assistant embedded in an AI system. "
@@ -40,15 +47,16 @@ class Reflection:
             "Focus only on emotional and psychological best practices based on the user's behavior. "
             "This is NOT about topic content, only about *how* to relate to the user emotionally.\n\n"
             "Recent Conversation History (last few interactions):\n"
-            f"{json.dumps(conversation_history, indent=2)}\n\n"
+            f"{conversation_history}\n\n"
             "Please return ONLY the guideline string. No preamble, no formatting, no JSON. Just the raw guideline text."
         )
+        if self.context_builder is not None:
+            self.context_builder.record_prompt("reflection", prompt)
 
         # Send to LLM and return result
         #print("REFLECTION PROMPT SENT TO LLM:\n", prompt)
-        response = self.llm.invoke(prompt)
-        #print("REFLECTION RESPONSE RECEIVED FROM LLM:\n", response.content)
-        guideline = response.content
+        guideline = self.llm.send_prompt(prompt)
+        #print("REFLECTION RESPONSE RECEIVED FROM LLM:\n", guideline)
 
         #print("###########REFLECTION GUIDELINE GENERATED:", guideline)
 
@@ -73,7 +81,10 @@ class Reflection:
         if user_profile is None:
             raise ValueError("User profile not found.")
 
-        conversation_history = user_profile.get_conversation_history(10)
+        if self.context_builder is not None:
+            conversation_history = self.context_builder.build(user_profile, "reminder")
+        else:
+            conversation_history = json.dumps(user_profile.get_conversation_history(10), ensure_ascii=False, indent=2)
         emotional_profile = user_profile.get_emotional_profile()
         
         # Assume the last AI response is the text part of the last tuple in response_list.
@@ -93,27 +104,26 @@ class Reflection:
             "  - 'delay': an integer representing the time in milliseconds when the message should be sent.\n"
             "If no message is necessary, return an empty JSON array."
         ).format(
-            conversation_history=json.dumps(conversation_history, ensure_ascii=False, indent=2),
+            conversation_history=conversation_history,
             emotional_profile=json.dumps(emotional_profile, ensure_ascii=False, indent=2),
             last_ai_response=last_ai_response
         )
+        if self.context_builder is not None:
+            self.context_builder.record_prompt("reminder", prompt)
 
         #print(f"REFLECTION PROMPT:{prompt}")
         # Use the LLM to get its evaluation.
-        llm_output = self.llm.invoke([{"role": "system", "content": prompt}])
+        llm_output = self.llm.send_prompt([{"role": "system", "content": prompt}])
         #print(f"[Reflection] LLM output: {llm_output}")
 
         # Parse the JSON output.
         try:
-            data = json.loads(llm_output)
+            data = coerce_chunks(extract_json(llm_output))
             # If the array is empty, no reminder is needed.
             if not data:
                 return ("", 0)
             # Otherwise, expect exactly one object.
-            obj = data[0]
-            text = str(obj["text"])
-            delay = int(obj["delay"])
-            return (text, delay)
+            return data[0]
         except Exception as e:
             print(f"[Reflection] Error parsing LLM output: {e}")
             return ("", 0)
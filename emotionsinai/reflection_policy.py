@@ -0,0 +1,96 @@
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from .user_profile import UserProfile
+
+
+class ReflectionPolicy:
+    """
+    Decides when the emotional guideline of a user is worth regenerating.
+
+    Instead of one reflection per user message, a refresh is only triggered if:
+      - no guideline was requested for the user yet,
+      - the user's emotions drift: at least min_outliers emotions of the new message deviate from the
+        rolling averages by more than drift_threshold (see UserProfile.detect_outliers),
+      - every_n_messages messages were received since the last refresh, or
+      - interval_seconds passed since the last refresh.
+    Drift only triggers a refresh if the last one is at least min_interval_seconds ago, so a volatile
+    conversation cannot cause a reflection on every message.
+    If a granted refresh cannot be made (e.g. it is shed under overload), retry requests it again
+    with the next message of the user.
+    """
+
+    def __init__(
+        self,
+        drift_threshold: float = 0.3,
+        min_outliers: int = 2,
+        every_n_messages: Optional[int] = 10,
+        interval_seconds: Optional[float] = 900,
+        min_interval_seconds: float = 30
+    ):
+        self.drift_threshold = drift_threshold
+        self.min_outliers = min_outliers
+        self.every_n_messages = every_n_messages
+        self.interval_seconds = interval_seconds
+        self.min_interval_seconds = min_interval_seconds
+        self.decisions: Dict[str, int] = {}
+        # user_id -> [messages since the last refresh, time of the last refresh, refresh to retry]
+        self._state: Dict[str, list] = {}
+        self._lock = threading.Lock()
+
+    def should_reflect(self, user_profile: UserProfile, new_emotions: Dict[str, float]) -> Tuple[bool, str]:
+        """
+        Registers a new user message and decides whether the user's guideline should be refreshed.
+        Must be called before the new emotions are merged into the rolling averages.
+        Returns a tuple (refresh, reason).
+        """
+        now = time.monotonic()
+        with self._lock:
+            state = self._state.setdefault(user_profile.user_id, [0, None, False])
+            state[0] += 1
+            messages_since, last_refresh, retry = state
+
+            if last_refresh is None:
+                reason = "first_message"
+            elif retry:
+                reason = "retry"
+            elif self.every_n_messages is not None and messages_since >= self.every_n_messages:
+                reason = "message_count"
+            elif self.interval_seconds is not None and now - last_refresh >= self.interval_seconds:
+                reason = "interval"
+            elif (
+                user_profile.rolling_averages
+                and now - last_refresh >= self.min_interval_seconds
+                and len(user_profile.detect_outliers(new_emotions, self.drift_threshold)) >= self.min_outliers
+            ):
+                reason = "drift"
+            else:
+                reason = "skipped"
+
+            self.decisions[reason] = self.decisions.get(reason, 0) + 1
+            if reason == "skipped":
+                return False, reason
+
+            state[0] = 0
+            state[1] = now
+            state[2] = False
+            return True, reason
+
+    def retry(self, user_id: str):
+        """
+        Registers that the refresh granted by the last should_reflect call was not made,
+        so the next message of the user requests it again.
+        """
+        with self._lock:
+            state = self._state.get(user_id)
+            if state is not None:
+                state[2] = True
+
+    def forget(self, user_id: str):
+        """
+        Drops the bookkeeping of a user, e.g. when the user's profile is evicted (see EmotionServices.release_user).
+        The next message of the user then counts as first message.
+        """
+        with self._lock:
+            self._state.pop(user_id, None)
@@ -1,12 +1,15 @@
-from typing import List, Dict, Optional
-import json
+from typing import List, Dict, Optional, Tuple
 
 from .base_llm import BaseLLM
 from .user_profile import UserProfile
+from .context_builder import ContextBuilder
+from .structured_output import APPRAISAL_KEYS, EMOTION_KEYS, StructuredOutputError, extract_json, coerce_scores, coerce_chunks
+
 
 class Response:
-    def __init__(self, llm: BaseLLM):  
+    def __init__(self, llm: BaseLLM, context_builder: Optional[ContextBuilder] = None):  
         self.llm = llm
+        self.context_builder = context_builder
 
     def get_combined_emotional_prompt(
         self, 
@@ -91,7 +94,10 @@ class Response:
             - 'extracted_emotions': An array of objects, each with 'emotion' and a numeric 'score' between 0.0 and 1.0.
         """
         # Retrieve conversation history and emotional profile
-        conversation_history = user_profile.get_conversation_history(10)
+        if self.context_builder is not None:
+            conversation_history = self.context_builder.build(user_profile, "response")
+        else:
+            conversation_history = user_profile.get_conversation_history(10)
         avg_user_emotions = user_profile.get_emotional_profile()
 
         # Build the combined prompt with full context and detailed instructions
@@ -102,22 +108,150 @@ class Response:
             agent_state=agent_state,
             llm_answer=llm_answer
         )
+        if self.context_builder is not None:
+            self.context_builder.record_prompt("response", combined_prompt)
 
         # Send the combined prompt in a single LLM call and expect a JSON response
         raw_response = self.llm.send_prompt(combined_prompt)
 
         try:
-            response_data = json.loads(raw_response)
-        except json.JSONDecodeError:
-            # Attempt to sanitize the JSON by escaping newline characters
-            sanitized_response = raw_response.replace('\n', '\\n')
-            try:
-                response_data = json.loads(sanitized_response)
-            except json.JSONDecodeError:
-                response_data = {
-                    "emotional_response": raw_response,
-                    "reasoning": "The LLM did not return a valid JSON even after sanitizing newlines.",
-                    "extracted_emotions": []
-                }
+            response_data = extract_json(raw_response, expect=dict)
+        except StructuredOutputError:
+            response_data = {
+                "emotional_response": raw_response,
+                "reasoning": "The LLM did not return a valid JSON object.",
+                "extracted_emotions": []
+            }
 
         return response_data
+
+    def get_fused_prompt(
+        self,
+        conversation_history: str,
+        user_prompt: str,
+        avg_user_emotions: Dict,
+        agent_state: Dict,
+        llm_answer: Optional[str],
+        writing_style: bool,
+        text_split: bool
+    ) -> str:
+        """
+        Create a prompt that instructs the LLM to extract the appraisal scores and emotion levels of the user prompt
+        (the structure of EmotionServices.parse_input), to write or adapt the answer and to split it into
+        human-like chat messages, all in one JSON object.
+        """
+        if llm_answer is None:
+            answer_task = "b) Write an empathetic and emotionally adapted answer to the user's prompt.\n"
+        elif writing_style:
+            answer_task = (
+                "b) Adapt the existing answer to the user's writing style and tone and make it emotionally adapted. "
+                "The full adaption to the user's writing style should only be applied when a very high level of trust and sympathy is reached.\n"
+            )
+        else:
+            answer_task = "b) Keep the existing answer exactly as it is.\n"
+        if text_split:
+            split_task = (
+                "c) Split the answer into multiple parts in a style how humans naturally answer in a chat. For each part, "
+                "'delay' is an integer in milliseconds that simulates a human-like pause before sending the next part.\n"
+            )
+        else:
+            split_task = "c) Return the complete answer as one single part with a 'delay' of 0.\n"
+
+        fused_prompt = (
+            "You are an empathetic AI agent responding to a user. Consider the following inputs:\n"
+            "1. User Prompt: The latest message from the user.\n"
+            "2. Average User Emotions: Overall emotional profile derived from past interactions.\n"
+            "3. Agent's Current Emotional State: Your own emotional state at the moment.\n"
+            "\n"
+            "Your tasks are:\n"
+            "a) Analyze the user's prompt and score each of the following keys between 0.0 (absent) and 1.0 (maximum): "
+            "'sentiment_score' (0 very negative, 1 very positive), 'relevance', 'novelty', 'goal_alignment', "
+            "'controllability', 'normative_significance', and the 'emotion_levels' "
+            + ", ".join(EMOTION_KEYS) + ".\n"
+            + answer_task
+            + split_task
+            + "\n"
+            "IMPORTANT: Return ONLY a valid JSON object with exactly these keys:\n"
+            "   " + ", ".join(f"'{key}'" for key in APPRAISAL_KEYS) + " (numbers between 0.0 and 1.0),\n"
+            "   'emotion_levels' (an object with a number between 0.0 and 1.0 for each of the emotions listed above),\n"
+            "   'emotional_response' (the complete answer as plain text),\n"
+            "   'parts' (an array of objects with the keys 'text' and 'delay').\n"
+        )
+
+        fused_prompt += f"\nConversation History: {conversation_history}\n"
+        fused_prompt += f"User Prompt: {user_prompt}\n"
+        fused_prompt += f"Average User Emotions: {avg_user_emotions}\n"
+        fused_prompt += f"Agent's Current Emotional State: {agent_state}\n"
+        if llm_answer is not None:
+            fused_prompt += f"Existing LLM Answer: {llm_answer}\n"
+
+        return fused_prompt
+
+    def fused_response(
+        self,
+        user_id: str,
+        prompt: str,
+        user_profile: UserProfile,
+        agent_state: Dict,
+        llm_answer: Optional[str] = None,
+        writing_style: bool = True,
+        text_split: bool = True
+    ) -> Optional[Dict]:
+        """
+        Extracts the emotions of the user prompt, writes or adapts the answer and splits it into chat messages
+        with a single LLM call. Returns a dictionary with the keys:
+            - 'scores': the appraisal scores and emotion levels in the structure of EmotionServices.parse_input,
+            - 'emotional_response': the final answer,
+            - 'parts': the list of (text, delay) tuples to send.
+        Returns None if the LLM output is incomplete or invalid, so the caller can fall back to separate calls.
+        """
+        if self.context_builder is not None:
+            conversation_history = self.context_builder.build(user_profile, "fused")
+        else:
+            conversation_history = user_profile.get_conversation_history(10)
+
+        fused_prompt = self.get_fused_prompt(
+            conversation_history=conversation_history,
+            user_prompt=prompt,
+            avg_user_emotions=user_profile.get_emotional_profile(),
+            agent_state=agent_state,
+            llm_answer=llm_answer,
+            writing_style=writing_style,
+            text_split=text_split
+        )
+        if self.context_builder is not None:
+            self.context_builder.record_prompt("fused", fused_prompt)
+
+        try:
+            raw_response = self.llm.send_prompt(fused_prompt)
+        except Exception as e:
+            print(f"[Response] Error during the fused LLM call: {e}")
+            return None
+
+        result = self.parse_fused_output(raw_response, require_parts=text_split)
+        if result is None:
+            return None
+        if llm_answer is not None and not writing_style:
+            # The answer must not change; the LLM output is only used for the emotions.
+            result["emotional_response"] = llm_answer
+        if not text_split:
+            # Without a split the answer is sent as one message, whatever parts the LLM returned.
+            result["parts"] = [(result["emotional_response"], 0)]
+        return result
+
+    def parse_fused_output(self, raw_response: str, require_parts: bool = True) -> Optional[Dict]:
+        """
+        Validates the output of the fused prompt. Returns None if the emotion levels, the answer or (if require_parts)
+        the parts are missing or malformed; the scores are clamped by coerce_scores.
+        """
+        try:
+            data = extract_json(raw_response, expect=dict)
+            scores = coerce_scores(data)
+            answer = data.get("emotional_response")
+            parts: List[Tuple[str, int]] = coerce_chunks(data.get("parts")) if require_parts else []
+        except StructuredOutputError:
+            return None
+        if not isinstance(answer, str) or not answer.strip() or (require_parts and not parts):
+            return None
+
+        return {"scores": scores, "emotional_response": answer, "parts": parts}
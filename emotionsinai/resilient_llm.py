@@ -0,0 +1,250 @@
+import asyncio
+import random
+import threading
+import time
+from typing import Dict, Iterator, List, Optional, Union
+
+from .base_llm import BaseLLM
+
+
+class CircuitOpenError(RuntimeError):
+    """
+    Raised instead of calling the LLM while its circuit breaker is open.
+    """
+    pass
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: tokens are refilled at rate per second up to capacity, every request takes one token.
+    """
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """
+        Takes one token and returns how many seconds the caller has to wait until the token is available.
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+
+class CircuitBreaker:
+    """
+    Opens after failure_threshold consecutive failures. While it is open, calls fail fast. After reset_timeout
+    seconds a single trial call is let through (half open): its success closes the breaker, its failure opens it again.
+    A trial that ends without either (e.g. an abandoned stream or a cancelled call) must be released, so the
+    next call can become the trial.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_running = False
+        self._trial_id = 0
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def allow(self) -> bool:
+        """
+        Returns True if a call may be made now. A trial call admitted by allow() cannot be released, use acquire().
+        """
+        return self.acquire() is not None
+
+    def acquire(self) -> Optional[int]:
+        """
+        Admits a call: returns None if the call is rejected, 0 for a call while the breaker is closed and the
+        (positive) id of the trial call while it is half open. The trial has to be passed to release() once the
+        call ended, whatever the outcome.
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return 0
+            if time.monotonic() - self._opened_at >= self.reset_timeout and not self._trial_running:
+                self._trial_running = True
+                self._trial_id += 1
+                return self._trial_id
+            return None
+
+    def release(self, trial: Optional[int]):
+        """
+        Ends the trial call of acquire() if neither record_success nor record_failure ended it, e.g. because the
+        caller abandoned it. The breaker stays half open, so the next call becomes the new trial.
+        """
+        if not trial:
+            return
+        with self._lock:
+            if self._trial_id == trial:
+                self._trial_running = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_running = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._trial_running or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+            self._trial_running = False
+
+
+class ResilientLLM(BaseLLM):
+    """
+    BaseLLM wrapper that protects a provider (and the pipeline) against an overloaded or failing backend:
+
+      - Rate limiting: at most requests_per_second requests are started (token bucket with burst capacity).
+      - Concurrency limit: at most max_in_flight requests (sync and async together) run at the same time.
+      - Retries: failed requests are retried up to max_retries times with jittered exponential backoff.
+      - Circuit breaker: after failure_threshold consecutive failures, requests fail fast with CircuitOpenError
+        for reset_timeout seconds instead of piling up on the backend. is_healthy() returns False meanwhile,
+        so callers can skip optional LLM work.
+
+    Wrappers are composable, as the wrapped llm can be any BaseLLM.
+    """
+
+    def __init__(
+        self,
+        llm: BaseLLM,
+        requests_per_second: Optional[float] = None,
+        burst: Optional[int] = None,
+        max_in_flight: int = 8,
+        max_retries: int = 2,
+        backoff_base: float = 0.5,
+        backoff_max: float = 8.0,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0
+    ):
+        self.inner = llm
+        self.max_concurrency = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.bucket = TokenBucket(requests_per_second, burst) if requests_per_second else None
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self._slots = threading.BoundedSemaphore(max_in_flight)
+        self.stats = {"calls": 0, "failures": 0, "retries": 0, "rejected": 0}
+        self._stats_lock = threading.Lock()
+
+    @property
+    def model_name(self) -> str:
+        return getattr(self.inner, "model_name", None) or getattr(self.inner, "model", None) or type(self.inner).__name__
+
+    def is_healthy(self) -> bool:
+        return self.breaker.state != "open" and self.inner.is_healthy()
+
+    def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        for attempt in range(self.max_retries + 1):
+            trial = self._admit()
+            try:
+                with self._slots:
+                    result = self.inner.send_prompt(prompt)
+            except Exception:
+                if not self._failed(attempt):
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                self.breaker.release(trial)
+
+    async def send_prompt_async(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        for attempt in range(self.max_retries + 1):
+            trial = self._admit(blocking=False)
+            try:
+                if self.bucket is not None:
+                    await asyncio.sleep(self.bucket.reserve())
+                async with self._async_slot():
+                    result = await self.inner.send_prompt_async(prompt)
+            except Exception:
+                if not self._failed(attempt):
+                    raise
+                await asyncio.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return result
+            finally:
+                # Also releases a trial that was cancelled (asyncio.CancelledError is no Exception).
+                self.breaker.release(trial)
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        # A stream is only retried as long as nothing was yielded yet.
+        for attempt in range(self.max_retries + 1):
+            trial = self._admit()
+            started = False
+            try:
+                with self._slots:
+                    for piece in self.inner.stream_prompt(prompt):
+                        started = True
+                        yield piece
+            except Exception:
+                if started or not self._failed(attempt):
+                    if started:
+                        self.breaker.record_failure()
+                    raise
+                time.sleep(self._backoff(attempt))
+                continue
+            else:
+                self.breaker.record_success()
+                return
+            finally:
+                # Runs as well if the caller closes the stream early (GeneratorExit).
+                self.breaker.release(trial)
+
+    def _admit(self, blocking: bool = True) -> int:
+        """
+        Fails fast if the circuit is open, otherwise waits for the rate limit (if blocking).
+        Returns the trial of the breaker that the caller has to release (see CircuitBreaker.acquire).
+        """
+        trial = self.breaker.acquire()
+        if trial is None:
+            with self._stats_lock:
+                self.stats["rejected"] += 1
+            raise CircuitOpenError(f"The circuit of {self.model_name} is open, the LLM backend is considered unhealthy.")
+        with self._stats_lock:
+            self.stats["calls"] += 1
+        if blocking and self.bucket is not None:
+            delay = self.bucket.reserve()
+            if delay > 0:
+                time.sleep(delay)
+        return trial
+
+    def _failed(self, attempt: int) -> bool:
+        """
+        Records a failed attempt and returns True if it should be retried.
+        """
+        self.breaker.record_failure()
+        with self._stats_lock:
+            self.stats["failures"] += 1
+            retry = attempt < self.max_retries and self.breaker.state == "closed"
+            if retry:
+                self.stats["retries"] += 1
+        return retry
+
+    def _backoff(self, attempt: int) -> float:
+        # Full jitter: concurrent callers do not retry in lockstep.
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
@@ -0,0 +1,187 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+
+class ResponseChannels:
+    """
+    Per-user delivery channels for the response chunks of the emotion service.
+
+    Every chunk that is published for a user is delivered exactly once, in the order it was published:
+      - If callbacks are subscribed for the user (or for all users), the chunk is handed to each of them.
+      - Otherwise the chunk is buffered in the user's channel until it is fetched with get, get_async or stream.
+
+    Chunks of different users never overwrite each other, and waiting consumers are woken up as soon as
+    a chunk is published, so the delivery latency is only determined by the producer.
+
+    Chunks that nobody fetches (e.g. if only get_new_response is used) must not pile up: a channel buffers at most
+    max_buffered chunks (older chunks are dropped first) and buffered chunks expire after ttl seconds (None keeps them
+    until they are fetched). drop removes the channel of a user that is gone. dropped counts the discarded chunks.
+    """
+
+    def __init__(self, max_buffered: int = 1000, ttl: Optional[float] = 600.0):
+        self.max_buffered = max_buffered
+        self.ttl = ttl
+        self.dropped = 0
+        self._condition = threading.Condition()
+        # Buffered chunks as (publish time, text).
+        self._buffers: Dict[str, Deque[Tuple[float, str]]] = {}
+        self._last_expiry = time.monotonic()
+        self._async_waiters: Dict[str, Deque[Tuple[asyncio.AbstractEventLoop, asyncio.Future]]] = {}
+        self._subscribers: Dict[Optional[str], List[Callable[[str, str], None]]] = {}
+
+    def publish(self, user_id: str, text: str):
+        """
+        Publish a new response chunk for the given user.
+        """
+        with self._condition:
+            callbacks = self._subscribers.get(user_id, []) + self._subscribers.get(None, [])
+            if not callbacks:
+                waiters = self._async_waiters.get(user_id)
+                if waiters:
+                    loop, future = waiters.popleft()
+                    loop.call_soon_threadsafe(self._resolve_async_waiter, user_id, future, text)
+                else:
+                    self._buffer(user_id).append((time.monotonic(), text))
+                    self._expire()
+                    self._condition.notify_all()
+                return
+
+        for callback in callbacks:
+            try:
+                callback(user_id, text)
+            except Exception as e:
+                print(f"[ResponseChannels] Error in response callback for user {user_id}: {e}")
+
+    def get(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Block until the next response chunk for the given user is available and return it.
+        Returns None if no chunk arrived within the timeout (in seconds).
+        """
+        with self._condition:
+            if not self._condition.wait_for(lambda: self._buffers.get(user_id), timeout):
+                return None
+            return self._pop(user_id)
+
+    async def get_async(self, user_id: str, timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Wait for the next response chunk for the given user without blocking the event loop.
+        Returns None if no chunk arrived within the timeout (in seconds).
+        """
+        loop = asyncio.get_running_loop()
+        with self._condition:
+            if self._buffers.get(user_id):
+                return self._pop(user_id)
+            future = loop.create_future()
+            self._async_waiters.setdefault(user_id, deque()).append((loop, future))
+
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            with self._condition:
+                waiters = self._async_waiters.get(user_id)
+                if waiters and (loop, future) in waiters:
+                    waiters.remove((loop, future))
+
+    async def stream(self, user_id: str):
+        """
+        Asynchronous iterator over the response chunks of the given user.
+        """
+        while True:
+            yield await self.get_async(user_id)
+
+    def subscribe(self, callback: Callable[[str, str], None], user_id: Optional[str] = None) -> Callable[[], None]:
+        """
+        Subscribe a callback(user_id, text) to the response chunks of one user or, if user_id is None, of all users.
+        The callback is invoked on the delivering thread, so it should return quickly.
+        Returns a function that removes the subscription again.
+        """
+        with self._condition:
+            self._subscribers.setdefault(user_id, []).append(callback)
+
+        def unsubscribe():
+            with self._condition:
+                callbacks = self._subscribers.get(user_id, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+                if not callbacks:
+                    self._subscribers.pop(user_id, None)
+
+        return unsubscribe
+
+    def pending(self, user_id: str) -> int:
+        """
+        Returns the number of buffered, not yet fetched chunks of the given user.
+        """
+        with self._condition:
+            return len(self._buffers.get(user_id, ()))
+
+    def drop(self, user_id: str) -> int:
+        """
+        Discards the buffered chunks of the given user, e.g. when the user's profile is evicted.
+        Returns the number of discarded chunks.
+        """
+        with self._condition:
+            buffer = self._buffers.pop(user_id, None)
+            count = len(buffer) if buffer else 0
+            self.dropped += count
+            return count
+
+    def _buffer(self, user_id: str) -> Deque[Tuple[float, str]]:
+        """
+        Returns the buffer of the given user. When it is full, its oldest chunk is dropped.
+        """
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            buffer = self._buffers[user_id] = deque(maxlen=self.max_buffered or None)
+        elif buffer.maxlen is not None and len(buffer) == buffer.maxlen:
+            self.dropped += 1
+        return buffer
+
+    def _pop(self, user_id: str) -> str:
+        """
+        Removes and returns the oldest buffered chunk of the given user; an empty channel is removed.
+        """
+        buffer = self._buffers[user_id]
+        _, text = buffer.popleft()
+        if not buffer:
+            del self._buffers[user_id]
+        return text
+
+    def _expire(self):
+        """
+        Drops the chunks that are buffered for longer than the ttl. All channels are scanned at most
+        once per ttl/10 seconds, so an unread channel is removed at most 10% after its last chunk expired.
+        """
+        if self.ttl is None:
+            return
+        now = time.monotonic()
+        if now - self._last_expiry < self.ttl / 10:
+            return
+        self._last_expiry = now
+        deadline = now - self.ttl
+        for user_id in list(self._buffers):
+            buffer = self._buffers[user_id]
+            while buffer and buffer[0][0] < deadline:
+                buffer.popleft()
+                self.dropped += 1
+            if not buffer:
+                del self._buffers[user_id]
+
+    def _resolve_async_waiter(self, user_id: str, future: asyncio.Future, text: str):
+        """
+        Hand a chunk to a waiting coroutine. If the waiter gave up in the meantime, the chunk is put back
+        in front of the user's buffer so that it is neither lost nor reordered.
+        """
+        if future.done():
+            with self._condition:
+                buffer = self._buffer(user_id)
+                if buffer.maxlen is None or len(buffer) < buffer.maxlen:
+                    buffer.appendleft((time.monotonic(), text))
+                self._condition.notify_all()
+        else:
+            future.set_result(text)
@@ -1,12 +1,149 @@
-from typing import List, Dict, Tuple, Optional
-import json
+from typing import Iterable, Iterator, List, Dict, Tuple, Optional
+import re
+import textwrap
 
 from .base_llm import BaseLLM
 from .user_profile import UserProfile
+from .structured_output import IncrementalJSONParser, extract_json, coerce_chunks
+
+# A sentence ends with ., ! or ? (optionally followed by closing quotes or brackets) and whitespace; a line break always ends a chunk.
+_SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?…])[\"')\]]*[ \t]+|\n+")
+
+
+class TypingSpeedModel:
+    """
+    Simulates the pause between two chat messages: the next message is sent once the user had the time to read
+    the last one and the agent had the time to type the next one (both happen at the same time), plus a short
+    pause to think.
+
+    All delays are in milliseconds, like the delays of Response_Split.
+    """
+
+    def __init__(
+        self,
+        typing_chars_per_second: float = 15.0,
+        reading_words_per_minute: float = 250.0,
+        pause_ms: int = 400,
+        min_delay_ms: int = 300,
+        max_delay_ms: int = 5000,
+        min_chars: int = 40,
+        max_chars: int = 200
+    ):
+        self.typing_chars_per_second = typing_chars_per_second
+        self.reading_words_per_minute = reading_words_per_minute
+        self.pause_ms = pause_ms
+        self.min_delay_ms = min_delay_ms
+        self.max_delay_ms = max_delay_ms
+        # Preferred message length, used by the LocalSplitter.
+        self.min_chars = min_chars
+        self.max_chars = max_chars
+
+    @classmethod
+    def from_persona(cls, internal_profile) -> "TypingSpeedModel":
+        """
+        Derives the model from the persona: the communication_style ("concise", "detailed", ...) sets the message
+        length, extraversion speeds up typing and conscientiousness lengthens the pause before the next message.
+        """
+        traits = internal_profile.personality_traits or {}
+        big_five = traits.get("big_five", {})
+        style = str(traits.get("other_traits", {}).get("communication_style", "")).lower()
+
+        if any(word in style for word in ("concise", "brief", "short", "direct")):
+            min_chars, max_chars = 30, 120
+        elif any(word in style for word in ("detailed", "elaborate", "verbose", "thorough")):
+            min_chars, max_chars = 80, 320
+        else:
+            min_chars, max_chars = 40, 200
+
+        return cls(
+            typing_chars_per_second=15.0 * (0.8 + 0.4 * big_five.get("extraversion", 0.5)),
+            pause_ms=int(300 + 500 * big_five.get("conscientiousness", 0.5)),
+            min_chars=min_chars,
+            max_chars=max_chars
+        )
+
+    def delay_ms(self, text: str, next_text: Optional[str] = None) -> int:
+        """
+        Returns the delay after sending text before next_text is sent.
+        If the next message is not known yet (streaming), it is assumed to be as long as text.
+        """
+        if next_text is None:
+            next_text = text
+        reading = len(text.split()) / self.reading_words_per_minute * 60000
+        typing = len(next_text) / self.typing_chars_per_second * 1000
+        return int(min(self.max_delay_ms, max(self.min_delay_ms, self.pause_ms + max(reading, typing))))
+
+
+class LocalSplitter:
+    """
+    Splits a response into (text, delay) chunks by sentences and paragraphs without an LLM call.
+
+    Sentences are combined until a chunk has at least min_chars characters; a line break (paragraph) always ends
+    a chunk and chunks longer than max_chars are wrapped at word boundaries. The delays come from the
+    TypingSpeedModel.
+
+    The splitter also works on streamed responses (feed, flush, split): a chunk is emitted as soon as a sentence
+    boundary appears, so the first chunk can be delivered while the rest of the response is still generated.
+    """
+
+    def __init__(self, typing_model: Optional[TypingSpeedModel] = None):
+        self.typing_model = typing_model or TypingSpeedModel()
+        self._buffer = ""
+
+    def split_text(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Splits a complete response. The delay of every chunk takes the length of the following chunk into account;
+        the last chunk has no delay.
+        """
+        pieces = [piece for piece, _ in LocalSplitter(self.typing_model).split([text])]
+        return [
+            (piece, self.typing_model.delay_ms(piece, pieces[index + 1]) if index + 1 < len(pieces) else 0)
+            for index, piece in enumerate(pieces)
+        ]
+
+    def feed(self, text: str) -> List[Tuple[str, int]]:
+        """
+        Adds the next piece of a streamed response and returns the chunks that are complete.
+        """
+        self._buffer += text
+        chunks = []
+        start = 0
+        for match in _SENTENCE_BOUNDARY.finditer(self._buffer):
+            piece = self._buffer[start:match.end()].strip()
+            if len(piece) >= self.typing_model.min_chars or "\n" in match.group():
+                chunks.extend(self._make_chunks(piece))
+                start = match.end()
+        self._buffer = self._buffer[start:]
+        return chunks
+
+    def flush(self) -> List[Tuple[str, int]]:
+        """
+        Returns the remaining text as the last chunk once the streamed response is complete.
+        """
+        piece = self._buffer.strip()
+        self._buffer = ""
+        return self._make_chunks(piece)
+
+    def split(self, pieces: Iterable[str]) -> Iterator[Tuple[str, int]]:
+        """
+        Yields the chunks of a streamed response as soon as they are complete.
+        """
+        for text in pieces:
+            yield from self.feed(text)
+        yield from self.flush()
+
+    def _make_chunks(self, piece: str) -> List[Tuple[str, int]]:
+        if not piece:
+            return []
+        parts = textwrap.wrap(piece, self.typing_model.max_chars, break_long_words=False) if len(piece) > self.typing_model.max_chars else [piece]
+        return [(part, self.typing_model.delay_ms(part)) for part in parts]
+
 
 class Response_Split:
-    def __init__(self, llm: BaseLLM):  
+    def __init__(self, llm: BaseLLM, local_splitter: Optional[LocalSplitter] = None):  
         self.llm = llm
+        # Used if the LLM output cannot be parsed, so the user never gets an empty response.
+        self.local_splitter = local_splitter or LocalSplitter()
 
     def return_response_split(
         self,
@@ -23,9 +160,51 @@ class Response_Split:
           - 'delay': an integer in milliseconds representing the time interval to wait before sending this piece.
         
         The function converts the JSON output into a list of (text, delay) tuples.
+        If the output is invalid or empty, the answer is split locally instead (see LocalSplitter).
+        """
+        # Attempt to parse the JSON output and convert it to a list of (text, delay) tuples.
+        try:
+            # Call the LLM with the constructed prompt
+            llm_output = self.llm.send_prompt([{"role": "system", "content": self.build_prompt(llm_answer)}])
+            #print(f"[return_response_split] LLM output: {llm_output}")
+            result: List[Tuple[str, int]] = coerce_chunks(extract_json(llm_output))
+            if result:
+                return result
+        except Exception as e:
+            print(f"[return_response_split] Error parsing JSON output: {e}")
+        return self.local_splitter.split_text(llm_answer)
+
+    def stream_response_split(self, llm_answer: str) -> Iterator[Tuple[str, int]]:
         """
-        # Build the prompt for splitting the answer
-        response_split_prompt = (
+        Like return_response_split, but streams the LLM output and yields every (text, delay) part as soon as
+        its JSON object is complete. If the LLM fails or no part can be parsed, the answer is split locally;
+        if it fails after some parts, the rest of the answer is split locally.
+        """
+        parser = IncrementalJSONParser()
+        sent = False
+        position = 0    # end of the last sent part in the answer
+        try:
+            for piece in self.llm.stream_prompt([{"role": "system", "content": self.build_prompt(llm_answer)}]):
+                for text, delay in coerce_chunks(parser.feed(piece)):
+                    index = llm_answer.find(text, position)
+                    if index != -1:
+                        position = index + len(text)
+                    sent = True
+                    yield (text, delay)
+                if parser.done:
+                    break
+        except Exception as e:
+            print(f"[stream_response_split] Error streaming the split: {e}")
+        if not sent:
+            yield from self.local_splitter.split_text(llm_answer)
+        elif not parser.done and llm_answer[position:].strip():
+            yield from self.local_splitter.split_text(llm_answer[position:].strip())
+
+    def build_prompt(self, llm_answer: str) -> str:
+        """
+        Builds the prompt that asks the LLM to split the answer into a JSON array of parts.
+        """
+        return (
             "You are an assistant that formats long responses into smaller, human-like conversation pieces. "
             "Your task is to split the provided long answer into multiple parts. The split-up should be in a style how humans naturally answer. For each part, "
             "create a JSON object with two keys: 'text' and 'delay'. 'text' should contain the text piece, "
@@ -35,19 +214,3 @@ class Response_Split:
             "Return the JSON array now."
         )
 
-        # Call the LLM with the constructed prompt
-        llm_output = self.llm.send_prompt([{"role": "system", "content": response_split_prompt}])
-        #print(f"[return_response_split] LLM output: {llm_output}")
-
-        # Attempt to parse the JSON output and convert it to a list of (text, delay) tuples.
-        try:
-            data = json.loads(llm_output)
-            # Ensure the parsed data is a list of dictionaries with "text" and "delay" keys.
-            result: List[Tuple[str, int]] = [
-                (str(item["text"]), int(item["delay"])) for item in data if "text" in item and "delay" in item
-            ]
-            return result
-        except Exception as e:
-            print(f"[return_response_split] Error parsing JSON output: {e}")
-            return []
-
@@ -0,0 +1,212 @@
+import json
+import os
+import queue
+import threading
+from typing import Dict, Optional
+
+
+class StateJournal:
+    """
+    Write-behind persistence for the changing emotional state: the agent's baseline emotions and
+    the rolling emotion averages of every user.
+
+    Changes are recorded as small deltas (only the changed values) and appended to a change log by a
+    background thread, so recording a change never blocks the message pipeline. Every snapshot_every
+    changes, the writer thread compacts the log into a snapshot of the full state and truncates the log.
+
+    On start-up the state is rebuilt by loading the latest snapshot and replaying the log entries that
+    were written after it, which takes O(changes since the last snapshot). A torn entry at the end of the log
+    (an interrupted write) is cut off, so the entries written after the restart are appended to a valid log.
+
+    The state of a user is kept in memory until forget_user is called, e.g. once the user's profile was written
+    to the profile store and evicted from memory (see ProfileCache.add_eviction_listener); from then on the profile
+    store holds the user's latest state.
+
+    Files in the journal directory:
+      - snapshot.json: {"sequence": n, "agent": {...}, "users": {user_id: {...}}}
+      - changes.log: one JSON object per line: {"sequence": n, "user_id": null or user_id, "values": {...}}
+    """
+
+    def __init__(self, directory: str, snapshot_every: int = 1000, fsync: bool = False):
+        self.directory = directory
+        self.snapshot_every = snapshot_every
+        self.fsync = fsync
+        self.snapshot_path = os.path.join(directory, "snapshot.json")
+        self.log_path = os.path.join(directory, "changes.log")
+        os.makedirs(directory, exist_ok=True)
+
+        self._queue: queue.Queue = queue.Queue()
+        self._agent_state: Dict[str, float] = {}
+        self._user_states: Dict[str, Dict[str, float]] = {}
+        self._sequence = 0
+        self._changes_since_snapshot = 0
+        self._state_lock = threading.Lock()
+        self._recover()
+
+        self._log = open(self.log_path, "a", encoding="utf-8")
+        threading.Thread(target=self._writer_process, daemon=True).start()
+
+    def get_agent_state(self) -> Dict[str, float]:
+        """
+        Returns the recovered/current baseline emotions of the agent.
+        """
+        with self._state_lock:
+            return dict(self._agent_state)
+
+    def get_user_state(self, user_id: str) -> Optional[Dict[str, float]]:
+        """
+        Returns the recovered/current rolling averages of the user, or None if the journal does not know the user.
+        """
+        with self._state_lock:
+            state = self._user_states.get(user_id)
+            return dict(state) if state is not None else None
+
+    def record_agent(self, changes: Dict[str, float]):
+        """
+        Records changed baseline emotions of the agent.
+        """
+        if changes:
+            self._queue.put((None, dict(changes)))
+
+    def record_user(self, user_id: str, changes: Dict[str, float]):
+        """
+        Records changed rolling averages of a user.
+        """
+        if changes:
+            self._queue.put((user_id, dict(changes)))
+
+    def forget_user(self, user_id: str):
+        """
+        Drops the state of a user from memory and from the following snapshots. Changes of the user that were
+        recorded before are still written first.
+        """
+        self._queue.put((user_id, None))
+
+    def flush(self):
+        """
+        Blocks until all recorded changes are written to the change log.
+        """
+        self._queue.join()
+
+    def snapshot(self):
+        """
+        Requests a compaction of the change log into a new snapshot and waits for it.
+        """
+        self._queue.put(None)
+        self._queue.join()
+
+    def _apply(self, user_id: Optional[str], values: Optional[Dict[str, float]]):
+        with self._state_lock:
+            if values is None:
+                self._user_states.pop(user_id, None)
+            elif user_id is None:
+                self._agent_state.update(values)
+            else:
+                self._user_states.setdefault(user_id, {}).update(values)
+
+    def _recover(self):
+        """
+        Loads the latest snapshot and replays the log entries written after it.
+        """
+        try:
+            with open(self.snapshot_path, "r", encoding="utf-8") as file:
+                snapshot = json.load(file)
+            self._sequence = snapshot.get("sequence", 0)
+            self._agent_state = snapshot.get("agent", {})
+            self._user_states = snapshot.get("users", {})
+        except FileNotFoundError:
+            pass
+        except (OSError, json.JSONDecodeError) as e:
+            print(f"Warning: Could not load state snapshot '{self.snapshot_path}': {e}")
+
+        valid_end = 0           # offset after the last valid entry
+        complete = True         # the last valid entry ends with a line break
+        try:
+            with open(self.log_path, "rb") as file:
+                for line in file:
+                    try:
+                        entry = json.loads(line)
+                        sequence, user_id, values = entry["sequence"], entry.get("user_id"), entry["values"]
+                    except (ValueError, KeyError, TypeError):
+                        # A torn last line of an interrupted write.
+                        break
+                    valid_end += len(line)
+                    complete = line.endswith(b"\n")
+                    # Entries up to the snapshot sequence are already contained in the snapshot.
+                    if sequence > self._sequence:
+                        self._apply(user_id, values)
+                        self._sequence = sequence
+                        self._changes_since_snapshot += 1
+                size = file.seek(0, os.SEEK_END)
+        except FileNotFoundError:
+            return
+
+        if valid_end < size or not complete:
+            # New entries are appended, so they must not follow the torn fragment, or the next recovery stops there.
+            if valid_end < size:
+                print(f"Warning: Cut off {size - valid_end} bytes of a torn entry at the end of '{self.log_path}'.")
+            with open(self.log_path, "r+b") as file:
+                file.truncate(valid_end)
+                if not complete:
+                    file.seek(valid_end)
+                    file.write(b"\n")
+
+    def _writer_process(self):
+        """
+        Appends the recorded changes to the change log in batches and compacts the log every snapshot_every changes.
+        """
+        while True:
+            batch = [self._queue.get()]
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            compact = False
+            try:
+                lines = []
+                for item in batch:
+                    if item is None:
+                        compact = True
+                        continue
+                    user_id, values = item
+                    if values is None:
+                        # forget_user: nothing to log, the following snapshots just omit the user.
+                        self._apply(user_id, None)
+                        continue
+                    self._sequence += 1
+                    self._apply(user_id, values)
+                    lines.append(json.dumps({"sequence": self._sequence, "user_id": user_id, "values": values}) + "\n")
+                if lines:
+                    self._log.writelines(lines)
+                    self._log.flush()
+                    if self.fsync:
+                        os.fsync(self._log.fileno())
+                    self._changes_since_snapshot += len(lines)
+
+                if compact or self._changes_since_snapshot >= self.snapshot_every:
+                    self._write_snapshot()
+            except Exception as e:
+                print(f"[StateJournal] Error writing state changes: {e}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+
+    def _write_snapshot(self):
+        """
+        Atomically replaces the snapshot with the current state and truncates the change log.
+        If the process dies between both steps, the log entries are skipped on recovery by their sequence number.
+        """
+        tmp_path = f"{self.snapshot_path}.tmp"
+        with self._state_lock:
+            snapshot = json.dumps({"sequence": self._sequence, "agent": self._agent_state, "users": self._user_states})
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            file.write(snapshot)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, self.snapshot_path)
+
+        self._log.close()
+        self._log = open(self.log_path, "w", encoding="utf-8")
+        self._changes_since_snapshot = 0
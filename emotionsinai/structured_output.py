@@ -0,0 +1,284 @@
+import ast
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from .user_profile import EMOTIONS
+from .instrumentation import note_parse_failure
+
+APPRAISAL_KEYS = ["sentiment_score", "relevance", "novelty", "goal_alignment", "controllability", "normative_significance"]
+EMOTION_KEYS = list(EMOTIONS)
+
+_CODE_FENCE = re.compile(r"```[a-zA-Z]*")
+_TRAILING_COMMA = re.compile(r",\s*([}\]])")
+_SMART_DOUBLE_QUOTES = "“”„"
+_SMART_SINGLE_QUOTES = "‘’"
+_CLOSING = {"{": "}", "[": "]"}
+_STRING_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t"}
+
+
+class StructuredOutputError(ValueError):
+    """
+    Raised if no usable JSON value can be extracted from an LLM output.
+    """
+    pass
+
+
+def extract_json(text: str, expect: Optional[type] = None) -> Any:
+    """
+    Extracts the first JSON value (object or array; only of type expect if given) from an LLM output.
+
+    Tolerates the usual defects of LLM outputs: code fences, prose before or after the value, trailing commas,
+    smart quotes around keys and values, unescaped line breaks in strings, Python literals (single quotes, True/False/None) and a
+    value that was cut off at the end (the open brackets are closed).
+    Raises StructuredOutputError if no value can be extracted.
+    """
+    if not isinstance(text, str):
+        raise StructuredOutputError(f"Expected the LLM output as text, got {type(text).__name__}.")
+
+    # Fast path: the output is exactly the expected JSON value.
+    try:
+        value = json.loads(text)
+        if isinstance(value, expect or (dict, list)):
+            return value
+    except json.JSONDecodeError:
+        pass
+
+    cleaned = _CODE_FENCE.sub("", text)
+    openers = "{" if expect is dict else "[" if expect is list else "{["
+    start = _find_start(cleaned, openers)
+    while start != -1:
+        value = _repair_and_load(_balanced_value(cleaned, start))
+        if isinstance(value, expect or (dict, list)):
+            return value
+        start = _find_start(cleaned, openers, start + 1)
+    note_parse_failure()
+    raise StructuredOutputError(f"No valid JSON value found in the LLM output: {text[:200]!r}")
+
+
+def coerce_scores(data: Any) -> Dict[str, Any]:
+    """
+    Validates an emotion extraction result against the schema of EmotionServices.parse_input and clamps it:
+    the six appraisal scores and the 14 emotion levels are numbers between 0 and 1. Missing appraisal scores
+    are neutral (0.5), missing emotions are absent (0.0). Unknown keys are dropped.
+    Raises StructuredOutputError if data is no object with an "emotion_levels" object.
+    """
+    if not isinstance(data, dict) or not isinstance(data.get("emotion_levels"), dict):
+        raise StructuredOutputError("The emotion scores must be an object with an 'emotion_levels' object.")
+    emotion_levels = {str(key).strip().lower(): value for key, value in data["emotion_levels"].items()}
+    scores: Dict[str, Any] = {key: _clamp(data.get(key), 0.5) for key in APPRAISAL_KEYS}
+    scores["emotion_levels"] = {key: _clamp(emotion_levels.get(key), 0.0) for key in EMOTION_KEYS}
+    return scores
+
+
+def coerce_chunks(data: Any) -> List[Tuple[str, int]]:
+    """
+    Converts a JSON array of {"text": ..., "delay": ...} objects into (text, delay) tuples.
+    Items without text are skipped, invalid or negative delays become 0.
+    """
+    if isinstance(data, dict):
+        # Some models wrap the array in an object, e.g. {"parts": [...]}.
+        data = next((value for value in data.values() if isinstance(value, list)), None)
+    if not isinstance(data, list):
+        raise StructuredOutputError("The response parts must be an array of objects with 'text' and 'delay'.")
+    chunks = []
+    for item in data:
+        if not isinstance(item, dict) or not str(item.get("text", "")).strip():
+            continue
+        try:
+            delay = max(0, int(float(item.get("delay", 0))))
+        except (TypeError, ValueError):
+            delay = 0
+        chunks.append((str(item["text"]), delay))
+    return chunks
+
+
+class IncrementalJSONParser:
+    """
+    Parses a JSON array of objects that is streamed in pieces and returns every element as soon as it is complete,
+    e.g. the parts of a response split while the LLM is still generating the following ones.
+    The array starts at the first "[" that is followed by a "{", so brackets in prose before it are skipped.
+
+        parser = IncrementalJSONParser()
+        for piece in llm.stream_prompt(prompt):
+            for item in parser.feed(piece):
+                ...
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0          # next character to scan
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._element_start: Optional[int] = None
+        self.done = False
+
+    def feed(self, text: str) -> List[Any]:
+        """
+        Adds the next piece of the output and returns the array elements that were completed by it.
+        """
+        self._buffer += text
+        items = []
+        while self._position < len(self._buffer) and not self.done:
+            char = self._buffer[self._position]
+            if self._depth == 0:
+                # Prose or code fences before the array are skipped, including brackets without an object.
+                if char == "[":
+                    following = self._buffer[self._position + 1:].lstrip()
+                    if not following:
+                        # Decided by the next piece.
+                        break
+                    if following[0] == "{":
+                        self._depth = 1
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+                if self._depth == 2:
+                    self._element_start = self._position
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._element_start is not None:
+                    items.extend(self._parse_element(self._buffer[self._element_start:self._position + 1]))
+                    self._element_start = None
+                elif self._depth == 0:
+                    self.done = True
+            self._position += 1
+        return items
+
+    def _parse_element(self, text: str) -> List[Any]:
+        try:
+            return [extract_json(text)]
+        except StructuredOutputError:
+            return []
+
+
+def _find_start(text: str, openers: str, position: int = 0) -> int:
+    indices = [index for index in (text.find(opener, position) for opener in openers) if index != -1]
+    return min(indices) if indices else -1
+
+
+def _balanced_value(text: str, start: int) -> str:
+    """
+    Returns the balanced value starting at start. A value that was cut off is closed.
+    """
+    stack = []
+    in_string = False
+    escaped = False
+    quote = '"'
+    for index in range(start, len(text)):
+        char = text[index]
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == quote:
+                in_string = False
+        elif char in "\"'":
+            in_string = True
+            quote = char
+        elif char in "{[":
+            stack.append(_CLOSING[char])
+        elif char in "}]":
+            if not stack or stack[-1] != char:
+                return text[start:index]
+            stack.pop()
+            if not stack:
+                return text[start:index + 1]
+    # Cut off: close the open string and brackets.
+    candidate = text[start:].rstrip().rstrip(",")
+    if in_string:
+        candidate += quote
+    return candidate + "".join(reversed(stack))
+
+
+def _repair_and_load(candidate: str) -> Any:
+    attempts = [candidate, _TRAILING_COMMA.sub(r"\1", candidate)]
+    # Raw line breaks inside strings are invalid JSON.
+    attempts.append(_escape_control_characters(attempts[-1]))
+    # Typographic quotes as string delimiters; the ones inside strings are text and stay.
+    attempts.append(_normalize_quotes(attempts[-1]))
+    for attempt in attempts:
+        try:
+            return json.loads(attempt)
+        except json.JSONDecodeError:
+            continue
+    try:
+        # Python literals, e.g. {'happiness': 0.5, 'flag': True}.
+        value = ast.literal_eval(_normalize_quotes(attempts[1]))
+        if isinstance(value, (dict, list)):
+            return value
+    except (ValueError, SyntaxError, MemoryError, RecursionError):
+        pass
+    return None
+
+
+def _escape_control_characters(text: str) -> str:
+    """
+    Escapes the control characters (e.g. raw line breaks) inside the double-quoted strings of a JSON text.
+    The line breaks between the tokens are kept.
+    """
+    result = []
+    in_string = False
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            elif char < " ":
+                char = _STRING_ESCAPES.get(char) or f"\\u{ord(char):04x}"
+        elif char == '"':
+            in_string = True
+        result.append(char)
+    return "".join(result)
+
+
+def _normalize_quotes(text: str) -> str:
+    """
+    Replaces the typographic quotes that delimit strings by ASCII quotes. Typographic quotes inside strings
+    delimited by ASCII quotes are kept, e.g. "Er sagte „Hallo“".
+    """
+    result = []
+    in_string = False
+    smart = False           # the string was opened by a typographic quote
+    escaped = False
+    for char in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"' or (smart and char in _SMART_DOUBLE_QUOTES):
+                in_string = False
+                char = '"'
+        elif char == '"' or char in _SMART_DOUBLE_QUOTES:
+            in_string = True
+            smart = char != '"'
+            char = '"'
+        elif char in _SMART_SINGLE_QUOTES:
+            char = "'"
+        result.append(char)
+    return "".join(result)
+
+
+def _clamp(value: Any, default: float) -> float:
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return default
+    if number != number:    # NaN
+        return default
+    return min(1.0, max(0.0, number))
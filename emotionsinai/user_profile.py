@@ -1,17 +1,107 @@
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from .conversation_buffer import ConversationBuffer, MessageRecord
+
+# Fixed order of the emotions that are tracked per user.
+EMOTIONS: Tuple[str, ...] = (
+    "happiness", "sadness", "anger", "fear", "surprise", "disgust", "love",
+    "jealousy", "guilt", "pride", "shame", "compassion", "sympathy", "trust"
+)
+EMOTION_INDEX: Dict[str, int] = {emotion: index for index, emotion in enumerate(EMOTIONS)}
+
+# Dynamic learning rates for the different emotions based on their emotional inertia.
+# Lower alpha means slower update (more inertia), higher alpha means faster change.
+ALPHA_VALUES: Dict[str, float] = {
+    "happiness": 0.2,
+    "sadness": 0.3,
+    "anger": 0.4,
+    "fear": 0.4,
+    "surprise": 0.3,
+    "disgust": 0.3,
+    "love": 0.2,
+    "jealousy": 0.4,
+    "guilt": 0.3,
+    "pride": 0.2,
+    "shame": 0.3,
+    "compassion": 0.2,
+    "sympathy": 0.2,
+    "trust": 0.1
+}
+DEFAULT_ALPHA = 0.3
+ALPHA_VECTOR = np.array([ALPHA_VALUES[emotion] for emotion in EMOTIONS], dtype=np.float64)
+
+
+def emotions_to_vector(new_emotions: List[Dict[str, float]]) -> Tuple[np.ndarray, Dict[str, float]]:
+    """
+    Converts a list of {'emotion': ..., 'score': ...} dictionaries into a vector in EMOTIONS order.
+    Emotions that are not part of the update are NaN. Emotions outside of EMOTIONS are returned separately.
+    """
+    vector = np.full(len(EMOTIONS), np.nan)
+    extras: Dict[str, float] = {}
+    for emotion_obj in new_emotions:
+        emotion, score = emotion_obj["emotion"], float(emotion_obj["score"])
+        index = EMOTION_INDEX.get(emotion)
+        if index is None:
+            extras[emotion] = score
+        else:
+            vector[index] = score
+    return vector, extras
+
+
+def ema_update(averages: np.ndarray, scores: np.ndarray) -> np.ndarray:
+    """
+    Vectorized EMA update of one state vector or a matrix of state vectors (one row per user):
+        new_avg = (1 - alpha) * old_avg + alpha * new_score
+    NaN scores leave the average untouched, NaN averages are initialized with the new score.
+    """
+    updated = np.where(np.isnan(averages), scores, (1 - ALPHA_VECTOR) * averages + ALPHA_VECTOR * scores)
+    return np.where(np.isnan(scores), averages, updated)
+
+
+def bulk_update_emotions(profiles: Sequence["UserProfile"], scores: np.ndarray):
+    """
+    Applies the EMA update of update_emotions to many user profiles in one vectorized operation.
+    scores is a (len(profiles), len(EMOTIONS)) matrix in EMOTIONS order, NaN for emotions without an update.
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    if scores.shape != (len(profiles), len(EMOTIONS)):
+        raise ValueError(f"Expected a score matrix of shape {(len(profiles), len(EMOTIONS))}, got {scores.shape}.")
+    if not len(profiles):
+        return
+    updated = ema_update(np.stack([profile._averages for profile in profiles]), scores)
+    for profile, averages, row in zip(profiles, updated, scores):
+        profile._averages = averages
+        profile.version += 1
+        profile._append_history(row)
+
 
 class UserProfile:
     """
     A unified user profile that stores both:
       - The user's overall emotional profile with rolling averages.
       - The user's conversation history with emotion metadata.
+
+    The rolling averages are a vector in EMOTIONS order and the emotion history is a columnar
+    (messages x EMOTIONS) ring buffer; rolling_averages and message_history provide the dictionary views.
+
+    Both histories keep at most history_capacity entries, so the memory per user is bounded. If archive_path
+    is given, messages that drop out of the conversation history are archived there (see ConversationBuffer).
     """
 
-    def __init__(self, user_id: str):
+    def __init__(self, user_id: str, history_capacity: int = 100, archive_path: Optional[str] = None):
         self.user_id = user_id
-        self.rolling_averages: Dict[str, float] = {}
-        self.message_history: List[Dict[str, float]] = []
-        self.conversations: List[Dict[str, Optional[str]]] = []
+        self._averages = np.full(len(EMOTIONS), np.nan)
+        self._extra_averages: Dict[str, float] = {}
+        self._history = np.full((history_capacity, len(EMOTIONS)), np.nan)
+        self._history_count = 0
+        self._history_extras: Dict[int, Dict[str, float]] = {}
+        self.conversations = ConversationBuffer(history_capacity, archive_path)
+        self.dirty = False    # True if the profile changed since it was last written to a profile store
+        self.version = 0      # Incremented whenever the guideline or the rolling averages change
+        self.context_summary: str = ""    # running summary of the older conversation (see ContextBuilder)
+        self.context_summarized = 0       # number of messages (counted over all appended ones) in context_summary
         self.guideline: str = ""    #this is a string to summarize key best practices how to best handle the specific user profile emotionally
 
 
@@ -26,6 +116,8 @@ class UserProfile:
         Set the guideline for the user profile.
         """
         self.guideline = guideline
+        self.version += 1
+        self.dirty = True
 
 
     def add_message(self, role: str, content: str, emotions: Optional[List[Dict[str, float]]] = None):
@@ -33,14 +125,11 @@ class UserProfile:
         Adds a new message to the conversation history along with its emotions.
         Updates the user's emotional profile based on the new emotions.
         """
-        message_entry = {
-            "role": role,
-            "content": content,
-            "emotions": emotions
-        }
+        message_entry = MessageRecord(role, content, emotions)
 
         #print(f"Adding message: {message_entry}")
         self.conversations.append(message_entry)
+        self.dirty = True
 
         if emotions:
             #self.detect_outliers(emotions)
@@ -48,18 +137,95 @@ class UserProfile:
 
     def get_conversation_history(self, num_messages: Optional[int] = None) -> List[Dict[str, Optional[str]]]:
         """
-        Returns the conversation history. 
+        Returns the conversation history as list of message dictionaries (a snapshot, not the live buffer).
         If num_messages is provided, return only the last 'num_messages' messages.
         """
-        if num_messages is None or num_messages >= len(self.conversations):
-            return self.conversations
-        return self.conversations[-num_messages:]
+        return [record.to_dict() for record in self.conversations.last(num_messages)]
+
+    def get_recent_messages(self, num_messages: Optional[int] = None) -> List[MessageRecord]:
+        """
+        Returns the last 'num_messages' message records (all if None) without converting them to dictionaries.
+        """
+        return self.conversations.last(num_messages)
 
     def clear_conversation_history(self):
         """
-        Clears the conversation history.
+        Clears the conversation history and the running summary of it (see ContextBuilder).
+        """
+        self.conversations.clear()
+        # The message count starts over, so the summary bookkeeping must start over as well.
+        self.context_summary = ""
+        self.context_summarized = 0
+        self.dirty = True
+
+    @property
+    def rolling_averages(self) -> Dict[str, float]:
+        """
+        The rolling average of every emotion that was updated at least once.
+        """
+        averages = {emotion: float(value) for emotion, value in zip(EMOTIONS, self._averages) if not np.isnan(value)}
+        averages.update(self._extra_averages)
+        return averages
+
+    @rolling_averages.setter
+    def rolling_averages(self, averages: Dict[str, float]):
+        self._averages = np.full(len(EMOTIONS), np.nan)
+        self._extra_averages = {}
+        for emotion, value in averages.items():
+            index = EMOTION_INDEX.get(emotion)
+            if index is None:
+                self._extra_averages[emotion] = value
+            else:
+                self._averages[index] = value
+        self.version += 1
+        self.dirty = True
+
+    def get_emotion_vector(self) -> np.ndarray:
+        """
+        Returns a copy of the rolling averages as vector in EMOTIONS order (NaN for emotions without updates).
+        """
+        return self._averages.copy()
+
+    @property
+    def message_history(self) -> List[Dict[str, float]]:
+        """
+        The retained emotion updates as list of dictionaries, oldest first.
+        """
+        history = []
+        for position in self._history_positions():
+            row = self._history[position]
+            update = {emotion: float(value) for emotion, value in zip(EMOTIONS, row) if not np.isnan(value)}
+            update.update(self._history_extras.get(position, {}))
+            history.append(update)
+        return history
+
+    def get_emotion_history(self) -> np.ndarray:
+        """
+        Returns the retained emotion updates as (messages x EMOTIONS) matrix, oldest first.
         """
-        self.conversations = []
+        return self._history[self._history_positions()]
+
+    def _history_positions(self) -> np.ndarray:
+        """
+        Positions of the retained rows of the history ring buffer, oldest first.
+        """
+        capacity = len(self._history)
+        if self._history_count <= capacity:
+            return np.arange(self._history_count)
+        return (np.arange(capacity) + self._history_count) % capacity
+
+    def _append_history(self, row: np.ndarray, extras: Optional[Dict[str, float]] = None):
+        """
+        Appends one emotion update to the history ring buffer, overwriting the oldest one when it is full.
+        """
+        position = self._history_count % len(self._history)
+        self._history[position] = row
+        if extras:
+            self._history_extras[position] = extras
+        else:
+            self._history_extras.pop(position, None)
+        self._history_count += 1
+        self.dirty = True
 
     def update_emotions(self, new_emotions: List[Dict[str, float]]):
         """
@@ -81,46 +247,24 @@ class UserProfile:
         The updated rolling averages are computed as:
             new_avg = (1 - alpha) * old_avg + alpha * new_score
             
-        where alpha is a dynamic learning rate that may vary for each emotion.
-        """
-        # Define dynamic learning rates for different emotions based on their emotional inertia.
-        # Lower alpha means slower update (more inertia), higher alpha means faster change.
-        alpha_values = {
-            "happiness": 0.2,
-            "sadness": 0.3,
-            "anger": 0.4,
-            "fear": 0.4,
-            "surprise": 0.3,
-            "disgust": 0.3,
-            "love": 0.2,
-            "jealousy": 0.4,
-            "guilt": 0.3,
-            "pride": 0.2,
-            "shame": 0.3,
-            "compassion": 0.2,
-            "sympathy": 0.2,
-            "trust": 0.1
-        }
-        
-        # For traceability, convert the list of emotion updates into a dictionary
-        # and append it to the message history.
-        current_update = {emotion_obj['emotion']: emotion_obj['score'] for emotion_obj in new_emotions}
-        self.message_history.append(current_update)
-        
-        # Update each emotion using the exponential moving average approach.
-        for emotion, new_score in current_update.items():
-            # Retrieve the corresponding alpha value, defaulting to 0.3 if not defined.
-            alpha = alpha_values.get(emotion, 0.3)
-            # If this emotion has not been updated before, initialize it with the new score.
-            if emotion not in self.rolling_averages:
-                self.rolling_averages[emotion] = new_score
-            else:
-                # EMA update: new_average = (1 - alpha) * old_average + alpha * new_score
-                old_avg = self.rolling_averages[emotion]
-                new_avg = (1 - alpha) * old_avg + alpha * new_score
-                self.rolling_averages[emotion] = new_avg
+        where alpha is a dynamic learning rate that may vary for each emotion (see ALPHA_VALUES).
+        All emotions in EMOTIONS are updated at once as a vector; use bulk_update_emotions to update many users.
+        """
+        scores, extras = emotions_to_vector(new_emotions)
 
-        # Optionally, you could log or return the updated rolling averages for further analysis.
+        # For traceability, append the update to the message history.
+        self._append_history(scores, extras)
+
+        self._averages = ema_update(self._averages, scores)
+        self.version += 1
+
+        # Emotions outside of EMOTIONS are updated one by one with the default alpha.
+        for emotion, new_score in extras.items():
+            if emotion not in self._extra_averages:
+                self._extra_averages[emotion] = new_score
+            else:
+                old_avg = self._extra_averages[emotion]
+                self._extra_averages[emotion] = (1 - DEFAULT_ALPHA) * old_avg + DEFAULT_ALPHA * new_score
 
 
     def detect_outliers(self, new_emotions: Dict[str, float], threshold: float = 0.3) -> List[str]:
@@ -130,8 +274,9 @@ class UserProfile:
         Return a list of emotion keys that deviate significantly.
         """
         outlier_keys = []
+        averages = self.rolling_averages
         for emotion_key, value in new_emotions.items():
-            avg_val = self.rolling_averages.get(emotion_key, 0.5)  # default to 0.5 if not found
+            avg_val = averages.get(emotion_key, 0.5)  # default to 0.5 if not found
             if abs(value - avg_val) > threshold:
                 outlier_keys.append(emotion_key)
         return outlier_keys
@@ -140,4 +285,42 @@ class UserProfile:
         """
         Returns the user's current emotional profile (rolling average emotions).
         """
-        return self.rolling_averages.copy()
+        return self.rolling_averages
+
+    def to_dict(self) -> Dict:
+        """
+        Serializes the profile into a JSON compatible dictionary (see from_dict).
+        """
+        return {
+            "user_id": self.user_id,
+            "guideline": self.guideline,
+            "context_summary": self.context_summary,
+            # Number of messages that are newer than the summary, message counts restart when the profile is restored.
+            "context_unsummarized": self.conversations.total_appended - self.context_summarized,
+            "rolling_averages": self.rolling_averages,
+            "message_history": self.message_history,
+            "conversations": [
+                {**record.to_dict(), "timestamp": record.timestamp} for record in self.conversations.last()
+            ],
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict, history_capacity: int = 100, archive_path: Optional[str] = None) -> "UserProfile":
+        """
+        Restores a profile that was serialized with to_dict. The restored profile is not dirty.
+        """
+        profile = cls(data["user_id"], history_capacity=history_capacity, archive_path=archive_path)
+        profile.guideline = data.get("guideline", "")
+        profile.context_summary = data.get("context_summary", "")
+        profile.rolling_averages = data.get("rolling_averages", {})
+        for update in data.get("message_history", [])[-history_capacity:]:
+            profile._append_history(*emotions_to_vector([{"emotion": emotion, "score": score} for emotion, score in update.items()]))
+        for message in data.get("conversations", [])[-history_capacity:]:
+            profile.conversations.append(
+                MessageRecord(message["role"], message["content"], message.get("emotions"), message.get("timestamp"))
+            )
+        if profile.context_summary:
+            unsummarized = data.get("context_unsummarized", 0)
+            profile.context_summarized = max(0, profile.conversations.total_appended - unsummarized)
+        profile.dirty = False
+        return profile
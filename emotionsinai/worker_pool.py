@@ -0,0 +1,123 @@
+import bisect
+import hashlib
+import queue
+import threading
+from typing import Any, Callable, List, Optional, Tuple
+
+from .instrumentation import TimedQueue
+
+
+class OverloadError(queue.Full):
+    """
+    Raised by EmotionServices.add_input with overflow_policy="reject" if the input queue is full.
+    """
+    pass
+
+
+class ShardedWorkerPool:
+    """
+    A pool of N worker threads, each draining its own queue.
+
+    Items are routed to a shard by consistent hashing of their key (e.g. the user_id): every key is always
+    handled by the same worker, so the items of one key are processed strictly in order, while items of
+    different keys are processed in parallel by different workers. Consistent hashing with virtual nodes
+    spreads the keys evenly over the shards and keeps most keys on their shard if the pool size changes.
+    With max_queue_size > 0, every shard queues at most max_queue_size items (see submit).
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Any], None],
+        num_workers: int = 1,
+        virtual_nodes: int = 64,
+        name: str = "emotion-worker",
+        on_wait: Optional[Callable[[float], None]] = None,
+        max_queue_size: int = 0
+    ):
+        if num_workers < 1:
+            raise ValueError("num_workers must be at least 1.")
+        self.handler = handler
+        self.num_workers = num_workers
+        self.name = name
+        # on_wait receives the seconds every item waited in its queue.
+        self.max_queue_size = max_queue_size
+        self._queues: List[TimedQueue] = [TimedQueue(max_queue_size, on_wait=on_wait) for _ in range(num_workers)]
+        self._ring: List[Tuple[int, int]] = sorted(
+            (self._hash(f"{shard}#{node}"), shard)
+            for shard in range(num_workers)
+            for node in range(virtual_nodes)
+        )
+        self._ring_hashes = [ring_hash for ring_hash, _ in self._ring]
+        self._threads: List[threading.Thread] = []
+        self._local = threading.local()
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        """
+        Stable 64 bit hash of a key (unlike hash(), it does not change between interpreter runs).
+        """
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+    def start(self):
+        """
+        Starts one daemon thread per shard.
+        """
+        for shard, shard_queue in enumerate(self._queues):
+            thread = threading.Thread(target=self._worker, args=(shard_queue,), name=f"{self.name}-{shard}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def shard_for(self, key: str) -> int:
+        """
+        Returns the index of the shard that handles the given key.
+        """
+        index = bisect.bisect(self._ring_hashes, self._hash(str(key))) % len(self._ring)
+        return self._ring[index][1]
+
+    def submit(self, key: str, item: Any, block: bool = True, timeout: Optional[float] = None):
+        """
+        Queues the item on the shard of the given key. If the shard is full, waits for a free slot (at most timeout
+        seconds) or, with block=False, raises queue.Full right away; queue.Full is also raised when the timeout expires.
+        """
+        self._queues[self.shard_for(key)].put(item, block, timeout)
+
+    def queue_depths(self) -> List[int]:
+        """
+        Returns the number of queued items per shard.
+        """
+        return [shard_queue.qsize() for shard_queue in self._queues]
+
+    def current_backlog(self) -> int:
+        """
+        Returns the number of items waiting in the queue of the calling worker (0 if not called by a worker).
+        """
+        shard_queue = getattr(self._local, "queue", None)
+        return shard_queue.qsize() if shard_queue is not None else 0
+
+    def oldest_age(self) -> float:
+        """
+        Returns how many seconds the oldest queued item of all shards is waiting.
+        """
+        return max(shard_queue.oldest_age() for shard_queue in self._queues)
+
+    def join(self):
+        """
+        Blocks until all submitted items have been processed.
+        """
+        for shard_queue in self._queues:
+            shard_queue.join()
+
+    def _worker(self, shard_queue: queue.Queue):
+        """
+        Processes the items of one shard one after another.
+        An exception raised by the handler is reported and does not stop the worker.
+        """
+        self._local.queue = shard_queue
+        while True:
+            item = shard_queue.get()
+            try:
+                self.handler(item)
+            except Exception as e:
+                print(f"[{threading.current_thread().name}] Error processing item: {e}")
+            finally:
+                shard_queue.task_done()
@@ -1,12 +1,14 @@
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 import json
 
 from .base_llm import BaseLLM
 from .user_profile import UserProfile
+from .context_builder import ContextBuilder
 
 class WritingStyle:
-    def __init__(self, llm: BaseLLM):  
+    def __init__(self, llm: BaseLLM, context_builder: Optional[ContextBuilder] = None):  
         self.llm = llm
+        self.context_builder = context_builder
 
     def adapt_writing_style(self, user_id: str, user_profile: UserProfile, agent_state: Dict, llm_answer: str) -> str:
         """
@@ -17,8 +19,28 @@ class WritingStyle:
           - Additional contextual parameters from the agent_state.
         The prompt instructs the LLM to return a final adapted answer that resonates with the user's style.
         """
-        # Retrieve the last 10 messages from the user's conversation history.
-        conversation_history = user_profile.get_conversation_history(10)
+        prompt = self.build_prompt(user_id, user_profile, agent_state, llm_answer)
+        
+        # Send the prompt to the LLM to receive the adapted answer.
+        adapted_answer = self.llm.send_prompt([{"role": "system", "content": prompt}])
+        return adapted_answer
+
+    def stream_writing_style(self, user_id: str, user_profile: UserProfile, agent_state: Dict, llm_answer: str) -> Iterator[str]:
+        """
+        Like adapt_writing_style, but yields the adapted answer in pieces as the LLM generates them.
+        """
+        prompt = self.build_prompt(user_id, user_profile, agent_state, llm_answer)
+        yield from self.llm.stream_prompt([{"role": "system", "content": prompt}])
+
+    def build_prompt(self, user_id: str, user_profile: UserProfile, agent_state: Dict, llm_answer: str) -> str:
+        """
+        Builds the prompt that instructs the LLM to adapt llm_answer to the writing style of the user.
+        """
+        # Retrieve the last 10 messages from the user's conversation history, or the budgeted context.
+        if self.context_builder is not None:
+            conversation_history = self.context_builder.build(user_profile, "writing_style")
+        else:
+            conversation_history = json.dumps(user_profile.get_conversation_history(10), ensure_ascii=False, indent=2)
         # Retrieve the user's emotional profile.
         avg_user_emotions = user_profile.get_emotional_profile()
         
@@ -35,12 +57,11 @@ class WritingStyle:
             "Return only the adapted answer as plain text no explanations how you came to the adpated writing style."
         ).format(
             user_id=user_id,
-            conversation_history=json.dumps(conversation_history, ensure_ascii=False, indent=2),
+            conversation_history=conversation_history,
             avg_user_emotions=json.dumps(avg_user_emotions, ensure_ascii=False, indent=2),
             agent_state=json.dumps(agent_state, ensure_ascii=False, indent=2),
             llm_answer=llm_answer
         )
-        
-        # Send the prompt to the LLM to receive the adapted answer.
-        adapted_answer = self.llm.send_prompt([{"role": "system", "content": prompt}])
-        return adapted_answer
+        if self.context_builder is not None:
+            self.context_builder.record_prompt("writing_style", prompt)
+        return prompt
@@ -0,0 +1,87 @@
+import json
+import os
+import threading
+from typing import Callable, Dict, Iterator, List, Optional, Union
+
+import pytest
+
+from emotionsinai.base_llm import BaseLLM
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESOURCES = os.path.join(ROOT, "demos", "simple long-term memory emotional agent")
+RESOURCE_FILE = os.path.join(RESOURCES, "resources.json")
+SYSTEM_PROMPT_FILE = os.path.join(RESOURCES, "emotion_system_prompt.json")
+
+EMOTIONS = ["happiness", "sadness", "anger", "fear", "surprise", "disgust", "love", "jealousy", "guilt", "pride", "shame", "compassion", "sympathy", "trust"]
+SCORES = {
+    "sentiment_score": 0.7, "relevance": 0.5, "novelty": 0.3, "goal_alignment": 0.6,
+    "controllability": 0.5, "normative_significance": 0.4,
+    "emotion_levels": {emotion: 0.3 for emotion in EMOTIONS},
+}
+
+
+class ScriptedLLM(BaseLLM):
+    """
+    Offline BaseLLM for the tests: answers every prompt with respond(prompt) (by default valid emotion scores
+    for extraction prompts and a fixed text otherwise) and records the prompts.
+    """
+
+    def __init__(self, respond: Optional[Callable[[str], str]] = None, gate: Optional[threading.Event] = None):
+        self.respond = respond or self.default_response
+        self.gate = gate
+        self.prompts: List[str] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_response(prompt: str) -> str:
+        if "NLP analyzer" in prompt:
+            return json.dumps(SCORES)
+        return "guideline text"
+
+    def send_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> str:
+        with self._lock:
+            self.prompts.append(str(prompt))
+        if self.gate is not None:
+            # Blocks the calling worker until the test opens the gate.
+            self.gate.wait(10)
+        return self.respond(str(prompt))
+
+    def stream_prompt(self, prompt: Union[str, List[Dict[str, str]]]) -> Iterator[str]:
+        for word in self.send_prompt(prompt).split(" "):
+            yield word + " "
+
+
+@pytest.fixture
+def make_service():
+    """
+    Returns a factory for EmotionServices with the demo persona and a ScriptedLLM (unless llm is given).
+    """
+    from emotionsinai import EmotionServices
+
+    def factory(**kwargs) -> EmotionServices:
+        kwargs.setdefault("llm", ScriptedLLM())
+        return EmotionServices(RESOURCE_FILE, SYSTEM_PROMPT_FILE, **kwargs)
+
+    return factory
+
+
+@pytest.fixture
+def make_async_service():
+    """
+    Returns a factory for AsyncEmotionServices with the demo persona and a ScriptedLLM (unless llm is given).
+    """
+    from emotionsinai import AsyncEmotionServices
+
+    def factory(**kwargs) -> AsyncEmotionServices:
+        kwargs.setdefault("llm", ScriptedLLM())
+        return AsyncEmotionServices(RESOURCE_FILE, SYSTEM_PROMPT_FILE, **kwargs)
+
+    return factory
+
+
+@pytest.fixture
+def scripted_llm():
+    """
+    Returns the ScriptedLLM class, so tests can script their own responses.
+    """
+    return ScriptedLLM
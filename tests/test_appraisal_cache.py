@@ -0,0 +1,72 @@
+import json
+import os
+import threading
+import time
+
+from emotionsinai.appraisal_cache import AppraisalCache
+
+SCORES = {"sentiment_score": 0.5, "emotion_levels": {"happiness": 0.4}}
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def test_normalized_inputs_hit_the_cache():
+    cache = AppraisalCache()
+    cache.put("Thanks!", "model", SCORES)
+    assert cache.get("  thanks!  ", "model") == SCORES
+    assert cache.get("Thanks!", "other model") is None
+    assert cache.stats()["hits"] == 1
+
+
+def test_entries_expire():
+    cache = AppraisalCache(ttl_seconds=0.01)
+    cache.put("ok", "model", SCORES)
+    time.sleep(0.05)
+    assert cache.get("ok", "model") is None
+
+
+def test_put_never_saves_on_the_calling_thread(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = AppraisalCache(persist_path=path, save_every=2, save_interval=60)
+    saving_threads = []
+    save = cache.save
+    cache.save = lambda: (saving_threads.append(threading.current_thread()), save())
+
+    cache.put("hello", "model", SCORES)
+    cache.put("thanks", "model", SCORES)
+    assert wait_for(lambda: os.path.exists(path))
+    assert saving_threads and threading.current_thread() not in saving_threads
+    assert AppraisalCache(persist_path=path, save_interval=None).get("hello", "model") == SCORES
+
+
+def test_concurrent_saves_leave_a_valid_file(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = AppraisalCache(persist_path=path, save_interval=None)
+    for i in range(200):
+        cache.put(f"message {i}", "model", SCORES)
+    errors = []
+
+    def save_repeatedly():
+        try:
+            for _ in range(20):
+                cache.save()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=save_repeatedly) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    with open(path) as file:
+        assert len(json.load(file)) == 200
+    assert os.listdir(str(tmp_path)) == ["cache.json"]
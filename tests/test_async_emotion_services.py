@@ -0,0 +1,100 @@
+import asyncio
+import threading
+import time
+
+from emotionsinai.profile_store import SQLiteProfileStore
+
+
+def test_inputs_are_answered_in_order(make_async_service):
+    async def run():
+        async with make_async_service() as service:
+            for i in range(3):
+                await service.add_input("u", f"message {i}", answer=f"answer {i}")
+            return [await service.get_response("u", timeout=5) for _ in range(3)]
+
+    assert asyncio.run(run()) == ["answer 0", "answer 1", "answer 2"]
+
+
+def test_idle_pipeline_is_torn_down_and_restarted(make_async_service):
+    async def run():
+        async with make_async_service(pipeline_idle_timeout=0.05) as service:
+            await service.add_input("u", "hello", answer="first")
+            assert await service.get_response("u", timeout=5) == "first"
+            assert "u" in service._input_queues
+            await asyncio.sleep(0.3)
+            torn_down = ("u" not in service._input_queues, "u" not in service._send_queues, len(service._tasks))
+
+            await service.add_input("u", "again", answer="second")
+            return torn_down, await service.get_response("u", timeout=5)
+
+    (no_input_queue, no_send_queue, tasks), response = asyncio.run(run())
+    assert no_input_queue and no_send_queue
+    assert tasks == 0
+    assert response == "second"
+
+
+def test_full_input_queue_refuses_inputs(make_async_service):
+    async def run():
+        async with make_async_service(max_queued_inputs=1, overflow_policy="busy") as service:
+            # The pipeline worker only starts after the inputs were queued.
+            return [await service.add_input("u", f"message {i}", answer="ok") for i in range(3)]
+
+    accepted = asyncio.run(run())
+    assert accepted[0] is True
+    assert False in accepted
+
+
+def test_idle_pipeline_is_torn_down_when_the_profile_is_evicted(make_async_service, tmp_path):
+    async def run():
+        store = SQLiteProfileStore(str(tmp_path / "profiles.db"))
+        async with make_async_service(profile_store=store, max_cached_profiles=1, profile_flush_interval=None, pipeline_idle_timeout=None) as service:
+            await service.add_input("u", "hello", answer="for u")
+            assert await service.get_response("u", timeout=5) == "for u"
+            await service.add_input("v", "hello", answer="for v")
+            assert await service.get_response("v", timeout=5) == "for v"
+            service.user_profiles.flush()
+            await asyncio.sleep(0.1)
+            return set(service._input_queues), set(service._send_queues)
+
+    assert asyncio.run(run()) == ({"v"}, {"v"})
+
+
+class SlowStore(SQLiteProfileStore):
+    """
+    Profile store whose load of the user "slow" waits until the gate is opened.
+    """
+
+    def __init__(self, path, gate):
+        super().__init__(path)
+        self.gate = gate
+
+    def load(self, user_id):
+        if user_id == "slow":
+            self.gate.wait(10)
+        return super().load(user_id)
+
+
+def test_slow_profile_load_does_not_block_other_users(make_async_service, tmp_path):
+    gate = threading.Event()
+
+    async def run():
+        store = SlowStore(str(tmp_path / "profiles.db"), gate)
+        async with make_async_service(profile_store=store, profile_flush_interval=None) as service:
+            # Users of the same shard are loaded one after another (see ProfileCache), so "fast" needs another one.
+            shards = len(service.user_profiles._shard_locks)
+            fast_user = next(f"fast {i}" for i in range(1000) if hash(f"fast {i}") % shards != hash("slow") % shards)
+            started = time.monotonic()
+            await service.add_input("slow", "hello", answer="for slow")
+            await service.add_input(fast_user, "hello", answer="for fast")
+            fast = await service.get_response(fast_user, timeout=2)
+            elapsed = time.monotonic() - started
+            gate.set()
+            return fast, elapsed, await service.get_response("slow", timeout=5)
+
+    try:
+        fast, elapsed, slow = asyncio.run(run())
+        assert (fast, slow) == ("for fast", "for slow")
+        # The load of "slow" is still blocked when "fast" is answered.
+        assert elapsed < 2
+    finally:
+        gate.set()
@@ -0,0 +1,44 @@
+from emotionsinai.context_builder import ContextBuilder
+from emotionsinai.reflection import Reflection
+from emotionsinai.user_profile import UserProfile
+
+
+def profile_with_messages(count):
+    profile = UserProfile("u")
+    for index in range(count):
+        profile.add_message("User", f"message {index}")
+    return profile
+
+
+def test_recent_turns_are_kept_verbatim_and_older_ones_summarized():
+    context = ContextBuilder(recent_turns=2).build(profile_with_messages(5))
+    summary, recent = context.split("Recent messages:\n")
+    assert recent.splitlines() == ["User: message 3", "User: message 4"]
+    assert "message 0" in summary and "message 2" in summary
+
+
+def test_callers_can_change_the_window():
+    builder = ContextBuilder(recent_turns=2)
+    context = builder.build(profile_with_messages(8), recent_turns=5)
+    assert context.split("Recent messages:\n")[1].splitlines() == [f"User: message {index}" for index in range(3, 8)]
+
+
+def test_reflection_honors_num_messages(scripted_llm):
+    llm = scripted_llm()
+    Reflection(llm=llm, context_builder=ContextBuilder(recent_turns=2)).generate_emotional_guideline(profile_with_messages(8), 4)
+    prompt = llm.prompts[-1]
+    assert "Recent messages:\nUser: message 4\n" in prompt
+
+
+def test_clearing_the_history_resets_the_summary():
+    builder = ContextBuilder(recent_turns=2)
+    profile = profile_with_messages(6)
+    builder.build(profile)
+    assert profile.context_summarized == 4
+
+    profile.clear_conversation_history()
+    assert profile.context_summary == "" and profile.context_summarized == 0
+    for index in range(5):
+        profile.add_message("User", f"new {index}")
+    context = builder.build(profile)
+    assert "new 0" in context and "message 0" not in context
@@ -0,0 +1,67 @@
+import json
+import threading
+
+import pytest
+
+
+@pytest.fixture
+def fused_llm(scripted_llm):
+    """
+    Returns a factory for an LLM that answers the fused prompt with a valid output (with or without parts).
+    """
+    def factory(parts=True):
+        output = json.loads(scripted_llm.default_response("NLP analyzer"))
+        output["emotional_response"] = "Adapted answer. With two sentences."
+        if parts:
+            output["parts"] = [{"text": "Adapted answer.", "delay": 0}, {"text": "With two sentences.", "delay": 400}]
+
+        def respond(prompt):
+            if "Your tasks are" in prompt:
+                return json.dumps(output)
+            return scripted_llm.default_response(prompt)
+
+        return scripted_llm(respond)
+
+    return factory
+
+
+def test_without_split_the_adapted_answer_is_one_part(make_service, fused_llm):
+    service = make_service(llm=fused_llm(), pipeline_mode="fused")
+    fused = service.process_fused("u", "hi", service.get_user_profile("u"), "answer", writing_style=True, text_split=False)
+    assert fused["parts"] == [("Adapted answer. With two sentences.", 0)]
+
+
+def test_without_split_missing_parts_are_no_error(make_service, fused_llm):
+    service = make_service(llm=fused_llm(parts=False), pipeline_mode="fused")
+    fused = service.process_fused("u", "hi", service.get_user_profile("u"), None, writing_style=False, text_split=False)
+    assert fused["parts"] == [("Adapted answer. With two sentences.", 0)]
+    assert service.fused_stats == {"fused": 1, "fallback": 0}
+
+
+def test_unchanged_answer_is_kept(make_service, fused_llm):
+    service = make_service(llm=fused_llm(), pipeline_mode="fused")
+    fused = service.process_fused("u", "hi", service.get_user_profile("u"), "answer", writing_style=False, text_split=False)
+    assert fused["emotional_response"] == "answer"
+    assert fused["parts"] == [("answer", 0)]
+
+
+def test_llm_split_parts_are_used(make_service, fused_llm):
+    service = make_service(llm=fused_llm(), pipeline_mode="fused", split_mode="llm")
+    fused = service.process_fused("u", "hi", service.get_user_profile("u"), "answer", writing_style=True, text_split=True)
+    assert fused["parts"] == [("Adapted answer.", 0), ("With two sentences.", 400)]
+
+
+def test_fused_stats_are_counted_by_concurrent_workers(make_service, fused_llm):
+    service = make_service(llm=fused_llm(), pipeline_mode="fused")
+
+    def run(index):
+        profile = service.get_user_profile(f"user {index}")
+        for _ in range(25):
+            service.process_fused(f"user {index}", "hi", profile, "answer", True, False)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert service.fused_stats == {"fused": 200, "fallback": 0}
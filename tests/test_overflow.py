@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from emotionsinai import OverloadError
+
+
+def wait_for(condition, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+@pytest.fixture
+def blocked_service(make_service, scripted_llm):
+    """
+    Returns a factory for a service with one input worker whose LLM calls wait until the returned gate is opened.
+    The first input is already being processed, so the input queue is empty.
+    """
+    gates = []
+
+    def factory(**kwargs):
+        gate = threading.Event()
+        gates.append(gate)
+        llm = scripted_llm(gate=gate)
+        service = make_service(llm=llm, num_workers=1, max_queued_inputs=2, **kwargs)
+        assert service.add_input("busy", "first message", answer="first")
+        assert wait_for(lambda: llm.prompts)
+        return service, gate
+
+    yield factory
+    for gate in gates:
+        gate.set()
+
+
+def test_busy_policy_refuses_inputs_beyond_the_bound(blocked_service):
+    service, gate = blocked_service(overflow_policy="busy")
+    accepted = [service.add_input("u", f"message {i}", answer=f"answer {i}") for i in range(4)]
+    assert accepted == [True, True, False, False]
+    assert service.shed_stats["input"] == 2
+
+    gate.set()
+    assert [service.get_response("u", timeout=5) for _ in range(2)] == ["answer 0", "answer 1"]
+
+
+def test_reject_policy_raises(blocked_service):
+    service, _ = blocked_service(overflow_policy="reject")
+    service.add_input("u", "message 0")
+    service.add_input("u", "message 1")
+    with pytest.raises(OverloadError):
+        service.add_input("u", "message 2")
+
+
+def test_block_policy_gives_up_after_the_timeout(blocked_service):
+    service, gate = blocked_service(overflow_policy="block", overflow_timeout=0.05)
+    assert service.add_input("u", "message 0")
+    assert service.add_input("u", "message 1")
+    started = time.monotonic()
+    assert not service.add_input("u", "message 2")
+    assert time.monotonic() - started >= 0.05
+
+    # Once there is room again, blocked inputs are queued.
+    threading.Timer(0.05, gate.set).start()
+    service.overflow_timeout = 5
+    assert service.add_input("u", "message 3")
+
+
+def test_backlog_sheds_the_writing_style_but_never_the_response(blocked_service):
+    service, gate = blocked_service(overflow_policy="busy")
+    assert service.add_input("u", "message 0", answer="answer 0", writing_style=True)
+    assert service.add_input("u", "message 1", answer="answer 1", writing_style=True)
+
+    gate.set()
+    # The first queued message is processed while the second one waits: its adaptation is shed.
+    assert service.get_response("u", timeout=5) == "answer 0"
+    assert service.get_response("u", timeout=5) is not None
+    assert service.shed_stats["writing_style"] == 1
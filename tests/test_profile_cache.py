@@ -0,0 +1,142 @@
+import threading
+
+from emotionsinai.profile_store import ProfileCache, SQLiteProfileStore
+from emotionsinai.user_profile import UserProfile
+
+
+def factory(user_id, data):
+    return UserProfile.from_dict(data) if data is not None else UserProfile(user_id)
+
+
+def make_cache(tmp_path, max_profiles=2):
+    return ProfileCache(SQLiteProfileStore(str(tmp_path / "profiles.db")), max_profiles=max_profiles, flush_interval=None)
+
+
+def change(profile, text="hello"):
+    profile.add_message("User", text)
+
+
+def test_least_recently_used_profile_is_evicted(tmp_path):
+    cache = make_cache(tmp_path)
+    cache.get_or_create("a", factory)
+    cache.get_or_create("b", factory)
+    cache.get_or_create("a", factory)
+    cache.get_or_create("c", factory)
+    assert sorted(cache) == ["a", "c"]
+
+
+def test_evicted_changes_are_written_and_restored(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1)
+    change(cache.get_or_create("a", factory), "remember me")
+    cache.get_or_create("b", factory)
+    assert "a" not in cache
+    # Loaded again before the flush: restored from the pending data.
+    assert cache.get_or_create("a", factory).get_conversation_history(1)
+    cache.get_or_create("b", factory)
+    cache.flush()
+    reloaded = make_cache(tmp_path).get_or_create("a", factory)
+    assert "remember me" in str(reloaded.get_conversation_history(1))
+
+
+def test_pinned_profile_is_not_evicted(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1)
+    with cache.pinned("a", factory) as profile:
+        cache.get_or_create("b", factory)
+        cache.get_or_create("c", factory)
+        assert cache.get("a") is profile
+        change(profile, "written while pinned")
+        assert len(cache) == 2
+    # Released: the skipped eviction is caught up.
+    assert list(cache) == ["a"]
+    cache.flush()
+    assert "written while pinned" in str(make_cache(tmp_path).get_or_create("a", factory).get_conversation_history(1))
+
+
+def test_eviction_listeners_run_once_the_profile_is_written(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1)
+    released = []
+    cache.add_eviction_listener(released.append)
+
+    cache.get_or_create("clean", factory)
+    change(cache.get_or_create("dirty", factory))
+    assert released == ["clean"]
+
+    cache.get_or_create("other", factory)
+    # The dirty profile is only released once it is in the store.
+    assert released == ["clean"]
+    cache.flush()
+    assert released == ["clean", "dirty"]
+
+
+def test_profile_loaded_again_before_the_flush_is_not_released(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1)
+    released = []
+    cache.add_eviction_listener(released.append)
+    change(cache.get_or_create("a", factory))
+    cache.get_or_create("b", factory)
+    with cache.pinned("a", factory):
+        cache.flush()
+        assert "a" not in released
+
+
+def test_profiles_are_created_once_under_concurrency(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1000)
+    created = []
+
+    def counting_factory(user_id, data):
+        created.append(user_id)
+        return factory(user_id, data)
+
+    def run():
+        for index in range(100):
+            cache.get_or_create(f"user {index}", counting_factory)
+
+    threads = [threading.Thread(target=run) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert sorted(created) == sorted(f"user {index}" for index in range(100))
+
+
+def test_eviction_releases_the_per_user_state_of_the_service(tmp_path, make_service):
+    service = make_service(
+        profile_store=SQLiteProfileStore(str(tmp_path / "profiles.db")), max_cached_profiles=1,
+        profile_flush_interval=None, state_dir=str(tmp_path / "state")
+    )
+    with service.using_profile("u") as profile:
+        profile.update_emotions([{"emotion": "happiness", "score": 0.8}])
+        service.state_journal.record_user("u", profile.rolling_averages)
+    service.response_channels.publish("u", "unread")
+    service.state_journal.flush()
+    assert service.state_journal.get_user_state("u")
+
+    service.get_user_profile("v")
+    service.user_profiles.flush()
+    service.state_journal.flush()
+    assert service.response_channels.pending("u") == 0
+    assert service.state_journal.get_user_state("u") is None
+    # The state now comes from the profile store.
+    assert service.get_user_profile("u").rolling_averages["happiness"] > 0
+
+
+def test_profile_changed_by_the_factory_is_written_before_it_is_released(tmp_path):
+    cache = make_cache(tmp_path, max_profiles=1)
+    change(cache.get_or_create("a", factory), "stored")
+    cache.flush()
+
+    def merging_factory(user_id, data):
+        # Like EmotionServices.create_user_profile merging a newer journaled state into the stored profile.
+        profile = factory(user_id, data)
+        profile.rolling_averages = {"anger": 0.9}
+        return profile
+
+    reloading = make_cache(tmp_path, max_profiles=1)
+    released = []
+    reloading.add_eviction_listener(released.append)
+    assert reloading.get_or_create("a", merging_factory).dirty
+    reloading.get_or_create("b", factory)
+    assert released == []
+    reloading.flush()
+    assert released == ["a"]
+    assert make_cache(tmp_path).get_or_create("a", factory).rolling_averages["anger"] == 0.9
@@ -0,0 +1,89 @@
+import queue
+
+from emotionsinai.profile_store import SQLiteProfileStore
+from emotionsinai.reflection_policy import ReflectionPolicy
+from emotionsinai.user_profile import UserProfile
+
+CALM = {"happiness": 0.5}
+
+
+def test_first_message_and_message_count():
+    policy = ReflectionPolicy(every_n_messages=3, interval_seconds=None)
+    profile = UserProfile("u")
+    decisions = [policy.should_reflect(profile, CALM) for _ in range(4)]
+    assert decisions == [(True, "first_message"), (False, "skipped"), (False, "skipped"), (True, "message_count")]
+
+
+def test_retry_requests_the_refresh_again():
+    policy = ReflectionPolicy(every_n_messages=None, interval_seconds=None)
+    profile = UserProfile("u")
+    assert policy.should_reflect(profile, CALM) == (True, "first_message")
+    assert policy.should_reflect(profile, CALM) == (False, "skipped")
+    policy.retry("u")
+    assert policy.should_reflect(profile, CALM) == (True, "retry")
+    assert policy.should_reflect(profile, CALM) == (False, "skipped")
+
+
+def test_forget_drops_the_state():
+    policy = ReflectionPolicy()
+    policy.should_reflect(UserProfile("u"), CALM)
+    policy.forget("u")
+    assert policy.should_reflect(UserProfile("u"), CALM) == (True, "first_message")
+
+
+def requested_reflections(service):
+    requested = []
+    request_reflection = service.request_reflection
+    service.request_reflection = lambda user_id: (requested.append(user_id), request_reflection(user_id))
+    return requested
+
+
+def test_shed_refresh_is_requested_with_the_next_message(make_service):
+    service = make_service(reflection_policy=ReflectionPolicy(every_n_messages=None, interval_seconds=None))
+    requested = requested_reflections(service)
+
+    service.is_overloaded = lambda user_id: True
+    service.process_message("u", "hello", "answer", False, False)
+    assert requested == [] and service.shed_stats["reflection"] == 1
+
+    service.is_overloaded = lambda user_id: False
+    service.process_message("u", "hello again", "answer", False, False)
+    assert requested == ["u"]
+
+
+def test_refresh_that_does_not_fit_into_the_queue_is_retried(make_service):
+    service = make_service(reflection_policy=ReflectionPolicy(every_n_messages=None, interval_seconds=None))
+    requested = requested_reflections(service)
+
+    def full(item, block=True, timeout=None):
+        raise queue.Full
+
+    put = service.reflection_queue.put
+    service.reflection_queue.put = full
+    service.process_message("u", "hello", "answer", False, False)
+    assert service.shed_stats["reflection"] == 1
+
+    service.reflection_queue.put = put
+    service.process_message("u", "hello again", "answer", False, False)
+    assert requested == ["u", "u"]
+    assert service.shed_stats["reflection"] == 1
+
+
+def test_policy_state_is_dropped_when_the_profile_is_evicted(make_service, tmp_path):
+    service = make_service(profile_store=SQLiteProfileStore(str(tmp_path / "profiles.db")), max_cached_profiles=1, profile_flush_interval=None)
+    service.process_message("u", "hello", "answer", False, False)
+    assert "u" in service.reflection_policy._state
+
+    service.process_message("v", "hello", "answer", False, False)
+    service.user_profiles.flush()
+    assert "u" not in service.reflection_policy._state
+    assert "v" in service.reflection_policy._state
+
+
+def test_refresh_skipped_for_an_unhealthy_llm_is_retried(make_service):
+    service = make_service(reflection_policy=ReflectionPolicy(every_n_messages=None, interval_seconds=None))
+    service.process_message("u", "hello", "answer", False, False)
+    service.llm.is_healthy = lambda: False
+    service.run_reflection("u")
+    assert service.degraded_stats["reflection"] == 1
+    assert service.reflection_policy.should_reflect(service.get_user_profile("u"), CALM) == (True, "retry")
@@ -0,0 +1,148 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from emotionsinai.base_llm import BaseLLM
+from emotionsinai.resilient_llm import CircuitBreaker, CircuitOpenError, ResilientLLM
+
+
+class FlakyLLM(BaseLLM):
+    def __init__(self):
+        self.failing = True
+
+    def send_prompt(self, prompt):
+        if self.failing:
+            raise ConnectionError("backend down")
+        return "ok"
+
+    def stream_prompt(self, prompt):
+        if self.failing:
+            raise ConnectionError("backend down")
+        yield "first "
+        yield "second"
+
+    async def send_prompt_async(self, prompt):
+        await asyncio.sleep(10)
+        return "late"
+
+
+class CountingLLM(BaseLLM):
+    def __init__(self):
+        self.running = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def send_prompt(self, prompt):
+        with self._lock:
+            self.running += 1
+            self.peak = max(self.peak, self.running)
+        time.sleep(0.05)
+        with self._lock:
+            self.running -= 1
+        return "ok"
+
+
+def open_breaker(reset_timeout=0.05):
+    inner = FlakyLLM()
+    llm = ResilientLLM(inner, max_retries=0, failure_threshold=1, reset_timeout=reset_timeout)
+    with pytest.raises(ConnectionError):
+        llm.send_prompt("hi")
+    assert llm.breaker.state == "open"
+    inner.failing = False
+    time.sleep(reset_timeout * 1.5)
+    assert llm.breaker.state == "half_open"
+    return llm
+
+
+def test_breaker_rejects_while_open():
+    llm = ResilientLLM(FlakyLLM(), max_retries=0, failure_threshold=1, reset_timeout=60)
+    with pytest.raises(ConnectionError):
+        llm.send_prompt("hi")
+    with pytest.raises(CircuitOpenError):
+        llm.send_prompt("hi")
+    assert not llm.is_healthy()
+
+
+def test_successful_trial_closes_breaker():
+    llm = open_breaker()
+    assert llm.send_prompt("hi") == "ok"
+    assert llm.breaker.state == "closed"
+
+
+def test_abandoned_trial_stream_releases_the_trial():
+    llm = open_breaker()
+    stream = llm.stream_prompt("hi")
+    assert next(stream) == "first "
+    # The caller stops reading, e.g. because it parsed everything it needed.
+    stream.close()
+
+    assert llm.breaker.state == "half_open"
+    assert llm.send_prompt("hi") == "ok"
+    assert llm.breaker.state == "closed"
+
+
+def test_cancelled_trial_call_releases_the_trial():
+    llm = open_breaker()
+
+    async def cancel_trial():
+        task = asyncio.ensure_future(llm.send_prompt_async("hi"))
+        await asyncio.sleep(0.01)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(cancel_trial())
+    assert llm.send_prompt("hi") == "ok"
+
+
+def test_completed_trial_stream_closes_breaker():
+    llm = open_breaker()
+    assert "".join(llm.stream_prompt("hi")) == "first second"
+    assert llm.breaker.state == "closed"
+
+
+def test_release_does_not_end_a_newer_trial():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    first = breaker.acquire()
+    breaker.record_failure()
+    second = breaker.acquire()
+    assert first and second and first != second
+    breaker.release(first)
+    # The second trial is still running, so no further call is admitted.
+    assert breaker.acquire() is None
+
+
+def test_sync_and_async_requests_share_one_limit():
+    inner = CountingLLM()
+    llm = ResilientLLM(inner, max_in_flight=2)
+    threads = [threading.Thread(target=llm.send_prompt, args=("sync",)) for _ in range(4)]
+
+    async def send_async():
+        return await asyncio.gather(*(llm.send_prompt_async("async") for _ in range(4)))
+
+    for thread in threads:
+        thread.start()
+    assert asyncio.run(send_async()) == ["ok"] * 4
+    for thread in threads:
+        thread.join()
+    assert inner.peak <= 2
+
+
+def test_cancelled_wait_for_a_slot_gives_the_slot_back():
+    llm = ResilientLLM(CountingLLM(), max_in_flight=1)
+
+    async def cancel_waiting():
+        llm._slots.acquire()
+        task = asyncio.ensure_future(llm.send_prompt_async("hi"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        llm._slots.release()
+        # The slot taken by the cancelled wait is released again, so a new request gets through.
+        return await asyncio.wait_for(llm.send_prompt_async("hi"), timeout=2)
+
+    assert asyncio.run(cancel_waiting()) == "ok"
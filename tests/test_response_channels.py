@@ -0,0 +1,69 @@
+import asyncio
+import threading
+
+from emotionsinai.response_channels import ResponseChannels
+
+
+def test_chunks_are_delivered_in_order():
+    channels = ResponseChannels()
+    channels.publish("u", "a")
+    channels.publish("u", "b")
+    assert channels.get("u", timeout=0) == "a"
+    assert channels.get("u", timeout=0) == "b"
+    assert channels.get("u", timeout=0) is None
+
+
+def test_waiting_consumer_is_woken_up():
+    channels = ResponseChannels()
+    threading.Timer(0.05, channels.publish, ("u", "hello")).start()
+    assert channels.get("u", timeout=5) == "hello"
+
+
+def test_async_consumer():
+    channels = ResponseChannels()
+
+    async def consume():
+        asyncio.get_running_loop().call_later(0.05, channels.publish, "u", "hello")
+        return await channels.get_async("u", timeout=5)
+
+    assert asyncio.run(consume()) == "hello"
+
+
+def test_buffer_is_bounded():
+    channels = ResponseChannels(max_buffered=3)
+    for i in range(10):
+        channels.publish("u", str(i))
+    assert channels.pending("u") == 3
+    assert channels.dropped == 7
+    assert [channels.get("u", timeout=0) for _ in range(3)] == ["7", "8", "9"]
+
+
+def test_unread_chunks_expire():
+    channels = ResponseChannels(ttl=0.05)
+    channels.publish("u", "old")
+    threading.Event().wait(0.1)
+    channels.publish("v", "new")
+    assert channels.pending("u") == 0
+    assert channels.pending("v") == 1
+    assert channels.dropped == 1
+
+
+def test_drop_discards_the_channel():
+    channels = ResponseChannels()
+    channels.publish("u", "a")
+    channels.publish("u", "b")
+    assert channels.drop("u") == 2
+    assert channels.pending("u") == 0
+    assert channels.get("u", timeout=0) is None
+
+
+def test_subscribed_chunks_are_not_buffered():
+    channels = ResponseChannels()
+    received = []
+    unsubscribe = channels.subscribe(lambda user_id, text: received.append((user_id, text)))
+    channels.publish("u", "a")
+    assert received == [("u", "a")]
+    assert channels.pending("u") == 0
+    unsubscribe()
+    channels.publish("u", "b")
+    assert channels.pending("u") == 1
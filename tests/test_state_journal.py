@@ -0,0 +1,95 @@
+import os
+
+from emotionsinai.profile_store import SQLiteProfileStore
+from emotionsinai.state_journal import StateJournal
+
+
+def reopen(directory):
+    return StateJournal(directory)
+
+
+def test_changes_survive_a_restart(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.record_agent({"happiness": 0.7})
+    journal.record_user("u", {"sadness": 0.2})
+    journal.flush()
+
+    recovered = reopen(str(tmp_path))
+    assert recovered.get_agent_state() == {"happiness": 0.7}
+    assert recovered.get_user_state("u") == {"sadness": 0.2}
+
+
+def test_torn_tail_is_cut_off_across_two_restarts(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.record_user("u", {"sadness": 0.2})
+    journal.flush()
+    # The process dies in the middle of writing the next entry.
+    with open(os.path.join(str(tmp_path), "changes.log"), "a", encoding="utf-8") as file:
+        file.write('{"sequence": 2, "user_id": "u", "val')
+
+    second = reopen(str(tmp_path))
+    assert second.get_user_state("u") == {"sadness": 0.2}
+    second.record_user("u", {"sadness": 0.9})
+    second.record_user("v", {"anger": 0.5})
+    second.flush()
+
+    third = reopen(str(tmp_path))
+    assert third.get_user_state("u") == {"sadness": 0.9}
+    assert third.get_user_state("v") == {"anger": 0.5}
+
+
+def test_entry_without_line_break_is_kept(tmp_path):
+    with open(os.path.join(str(tmp_path), "changes.log"), "w", encoding="utf-8") as file:
+        file.write('{"sequence": 1, "user_id": "u", "values": {"fear": 0.4}}')
+
+    journal = reopen(str(tmp_path))
+    assert journal.get_user_state("u") == {"fear": 0.4}
+    journal.record_user("u", {"fear": 0.6})
+    journal.flush()
+    assert reopen(str(tmp_path)).get_user_state("u") == {"fear": 0.6}
+
+
+def test_snapshot_and_replay(tmp_path):
+    journal = StateJournal(str(tmp_path), snapshot_every=2)
+    for value in (0.1, 0.2, 0.3):
+        journal.record_user("u", {"trust": value})
+        journal.flush()
+    assert os.path.exists(os.path.join(str(tmp_path), "snapshot.json"))
+    assert reopen(str(tmp_path)).get_user_state("u") == {"trust": 0.3}
+
+
+def test_forget_user_drops_the_state(tmp_path):
+    journal = StateJournal(str(tmp_path))
+    journal.record_user("u", {"trust": 0.5})
+    journal.forget_user("u")
+    journal.snapshot()
+    assert journal.get_user_state("u") is None
+    assert reopen(str(tmp_path)).get_user_state("u") is None
+
+
+def test_journaled_state_survives_eviction_with_a_profile_store(tmp_path, make_service):
+    def start():
+        return make_service(
+            profile_store=SQLiteProfileStore(str(tmp_path / "profiles.db")), max_cached_profiles=1,
+            profile_flush_interval=None, state_dir=str(tmp_path / "state")
+        )
+
+    # The store holds an older state of the user, the journal a newer one (e.g. a crash before the flush).
+    first = start()
+    first.get_user_profile("u").rolling_averages = {"anger": 0.1}
+    first.user_profiles.flush()
+    first.state_journal.record_user("u", {"anger": 0.9})
+    first.state_journal.flush()
+
+    second = start()
+    restored = second.get_user_profile("u")
+    assert restored.rolling_averages["anger"] == 0.9
+    assert restored.dirty
+    # Evicted before the profile was written once: the journal may only forget the state once the store has it.
+    second.get_user_profile("v")
+    second.user_profiles.flush()
+    second.state_journal.flush()
+    assert second.state_journal.get_user_state("u") is None
+
+    third = start()
+    assert third.get_user_profile("u").rolling_averages["anger"] == 0.9
@@ -0,0 +1,67 @@
+import pytest
+
+from emotionsinai.structured_output import IncrementalJSONParser, StructuredOutputError, coerce_chunks, extract_json
+
+
+def test_line_break_inside_a_string_is_escaped():
+    assert extract_json('{\n  "a": "line1\nline2",\n  "b": 1\n}') == {"a": "line1\nline2", "b": 1}
+
+
+def test_control_characters_inside_strings():
+    assert extract_json('[{"text": "a\tb\r\nc"},\n{"text": "d"}]') == [{"text": "a\tb\r\nc"}, {"text": "d"}]
+
+
+def test_prose_code_fences_and_trailing_commas():
+    text = 'Sure, here it is:\n```json\n{"happiness": 0.5, "emotion_levels": {"joy": 1},}\n```'
+    assert extract_json(text, dict) == {"happiness": 0.5, "emotion_levels": {"joy": 1}}
+
+
+def test_python_literals_and_cut_off_values():
+    assert extract_json("{'flag': True, 'value': None}") == {"flag": True, "value": None}
+    assert extract_json('[{"text": "a"}, {"text": "b') == [{"text": "a"}, {"text": "b"}]
+
+
+def test_no_json_value():
+    with pytest.raises(StructuredOutputError):
+        extract_json("no json here")
+
+
+def feed_all(text, size):
+    parser = IncrementalJSONParser()
+    items = []
+    for start in range(0, len(text), size):
+        items.extend(parser.feed(text[start:start + size]))
+    return parser, items
+
+
+@pytest.mark.parametrize("size", [1, 3, 1000])
+def test_incremental_parser_skips_brackets_in_prose(size):
+    text = 'Here are the parts [as requested]:\n[{"text": "Hi!", "delay": 0}, {"text": "How are you?", "delay": 300}]'
+    parser, items = feed_all(text, size)
+    assert coerce_chunks(items) == [("Hi!", 0), ("How are you?", 300)]
+    assert parser.done
+
+
+@pytest.mark.parametrize("size", [1, 1000])
+def test_incremental_parser_handles_brackets_in_strings(size):
+    text = '[{"text": "a ] b", "delay": 1}, {"text": "c } d", "delay": 2}] trailing [prose]'
+    parser, items = feed_all(text, size)
+    assert coerce_chunks(items) == [("a ] b", 1), ("c } d", 2)]
+    assert parser.done
+
+
+def test_incremental_parser_returns_elements_while_streaming():
+    parser = IncrementalJSONParser()
+    assert parser.feed('[{"text": "first"}, {"text": "sec') == [{"text": "first"}]
+    assert parser.feed('ond"}]') == [{"text": "second"}]
+    assert parser.done
+
+
+def test_typographic_quotes_inside_strings_are_kept():
+    text = '```json\n[{"text": "Er sagte „Hallo“ zu mir", "delay": 1}, {"text": "She said “hi”", "delay": 2}]\n```'
+    assert extract_json(text) == [{"text": "Er sagte „Hallo“ zu mir", "delay": 1}, {"text": "She said “hi”", "delay": 2}]
+
+
+def test_typographic_quotes_as_delimiters():
+    assert extract_json("Result: {“happiness”: 0.5, “note”: “ok”}") == {"happiness": 0.5, "note": "ok"}
+    assert extract_json("{‘flag’: True}") == {"flag": True}